@@ -171,7 +171,14 @@ class ClientLogic:
         if not self.client.que.empty():
             recv: dict = self.client.que.get()
 
+            if "changes" in recv:
+                if not self.game_data.state.apply(recv.get("seq"), recv.get("changes")):
+                    # A delta is missing, the server sends the whole state again
+                    self.client.send_to_server("STATE_REQUEST", self.game_data.username)
+
             match recv.get("command"):
+                case "STATE_SNAPSHOT":
+                    self.game_data.state.load(recv.get("seq"), recv.get("state"))
                 case "PLAYER_NAMES":
                     self.new_player_names(recv)
                 case "NEW_CARD":
@@ -363,7 +370,7 @@ class ClientLogic:
         self.client.send_to_server("PLAY_CARD", self.game_data.username, card=card_id)
 
     def update_turn(self, data: dict):
-        self.game_data.played_ids = data.get("played")
+        self.game_data.played_ids = list(data.get("played", self.game_data.state.state.get("played", [])))
         last_player: str = data.get("last_played")
         if last_player != self.game_data.username:
             self.game_data.player_cards_surfaces[last_player].pop(0)
@@ -381,7 +388,7 @@ class ClientLogic:
         Parameters
         ----------
         data : dict
-            The command data including the 'team1' and 'team2' key
+            The command data including the 'team1' and 'team2' key (or the changes of the state)
 
         Returns
         -------
@@ -389,8 +396,8 @@ class ClientLogic:
         """
         self.game_data.played_ids.clear()
 
-        team1:dict = data.get("team1")
-        team2:dict = data.get("team2")
+        team1:dict = data.get("team1", self.game_data.state.team(1))
+        team2:dict = data.get("team2", self.game_data.state.team(2))
 
         self.game_data.turns = (team1.get("turns"), team2.get("turns"))
         self.game_data.points = (team1.get("points"), team2.get("points"))
@@ -411,14 +418,14 @@ class ClientLogic:
         Parameters
         ----------
         data : dict
-            The command data including the 'team1' and 'team2' key
+            The command data including the 'team1' and 'team2' key (or the changes of the state)
 
         Returns
         -------
         None
         """
-        team1:dict = data.get("team1")
-        team2:dict = data.get("team2")
+        team1:dict = data.get("team1", self.game_data.state.team(1))
+        team2:dict = data.get("team2", self.game_data.state.team(2))
 
         self.game_data.turns = (team1.get("turns"), team2.get("turns"))
         self.game_data.points = (team1.get("points"), team2.get("points"))
@@ -437,14 +444,14 @@ class ClientLogic:
         Parameters
         ----------
         data : dict
-            The command data including the 'team1' and 'team2' key
+            The command data including the 'team1' and 'team2' key (or the changes of the state)
 
         Returns
         -------
         None
         """
-        team1:dict = data.get("team1")
-        team2:dict = data.get("team2")
+        team1:dict = data.get("team1", self.game_data.state.team(1))
+        team2:dict = data.get("team2", self.game_data.state.team(2))
 
         self.game_data.turns = (team1.get("turns"), team2.get("turns"))
         self.game_data.points = (team1.get("points"), team2.get("points"))
@@ -4,6 +4,8 @@ import pygame
 import string
 from dataclasses import dataclass, field
 
+from state_delta import StateView
+
 
 class StateInstance:
     def __init__(self, pos: tuple[int, int], surface: pygame.Surface,
@@ -165,6 +167,8 @@ class ClientGameData:
         The whole game surface
     player_cards_surfaces: dict (default: dict)
         The surfaces of the cards of the players
+    state: StateView (default: StateView)
+        The state of the table rebuilt from the snapshot and the deltas of the server
     """
     username: str = ""
     player_names: list[str] = field(default_factory=list)
@@ -185,4 +189,6 @@ class ClientGameData:
 
     turns: tuple = (0,0)
     points: tuple = (0,0)
-    rounds: tuple = (0,0)
\ No newline at end of file
+    rounds: tuple = (0,0)
+
+    state: StateView = field(default_factory=StateView)
\ No newline at end of file
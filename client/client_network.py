@@ -1,10 +1,14 @@
-import time
 import json
 import socket
 import multiprocessing
 
 from typing import Any
 
+from framing import FrameDecoder
+from codec import JSON, BINARY, encode_binary, decode
+from state_delta import DELTA, HEARTBEAT
+from protocol_trace import SENT, RECEIVED, trace
+
 
 class NetworkClient:
     """
@@ -25,6 +29,16 @@ class NetworkClient:
         A queue to store the commands received from the client
     server : socket.socket
         The connection to the server
+    decoder : FrameDecoder
+        Splits the data of the server into frames (keeps partial and additional frames between reads)
+    name : str
+        The name the client logged in with
+    codec : str
+        The codec the server confirmed at the login ("json" or "binary")
+    features : list[str]
+        The protocol features the server confirmed at the login (e.g. "delta")
+    token : str | None
+        The session token of the last login (sent instead of the password when the client connects again)
     listener : multiprocessing.Process
         A process to listen to commands from the server
     running : bool
@@ -40,7 +54,7 @@ class NetworkClient:
         Connect to the server with a given name
     send_to_server(self, command: str, username: str, **data) -> None
         Send a command to the server
-    recv_from_server(self) -> dict | list[dict]
+    recv_from_server(self) -> dict
         Receive data from the server and convert it to a command
     recv_in_process(self) -> None
         The method the listener will listen to, to receive data from the server
@@ -53,6 +67,11 @@ class NetworkClient:
         self.ENCODING = "utf-8"
         self.que = multiprocessing.Queue()
         self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.decoder = FrameDecoder()
+        self.name: str = ""
+        self.codec: str = JSON
+        self.features: list[str] = []
+        self.token: str | None = None
         self.listener = multiprocessing.Process(target=self.recv_in_process, daemon=True)
         self.running: bool = True
 
@@ -77,20 +96,22 @@ class NetworkClient:
     def recv(self) -> bytes:
         """
         Function to receive the exact amount of bytes
-        First the length will be received than the client receives the data
+        The bytes are read until one whole frame (length, then data) was received,
+        every additional frame is kept for the next call
 
         Returns
         -------
         bytes : The data received
         """
-        length = int.from_bytes(self.server.recv(16), "big")
-        data = self.server.recv(length)
-        return data
+        return self.decoder.recv(self.server)
 
-    def server_connect(self, name: str, pwd: str, host: str = "127.0.0.2", port: int = 3333) -> bool:
+    def server_connect(self, name: str, pwd: str, host: str = "127.0.0.2", port: int = 3333, binary: bool = True, delta: bool = True) -> bool:
         """
         Connect to the server with a given name
 
+        A client that was connected with this name before sends its session token instead of the password,
+        if the server refuses the token the next call logs in with the password again
+
         Parameters
         ----------
         name : str
@@ -99,24 +120,49 @@ class NetworkClient:
             The IPv4-Address of the Server to connect to
         port : int (default: 3333)
             The Port of the Server to connect to
+        binary : bool (default: True)
+            If the binary codec should be offered to the server (json is used if the server does not confirm it)
+        delta : bool (default: True)
+            If the state should be received as versioned deltas (see STATE_SNAPSHOT)
 
         Returns
         -------
 
         """
+        if self.listener.pid is not None:
+            # Reconnect: the old connection and its listener are replaced
+            self.listener.terminate()
+            self.listener = multiprocessing.Process(target=self.recv_in_process, daemon=True)
+            self.server.close()
+            self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.decoder = FrameDecoder()
+
         self.server.connect((host, port))
-        login_credentials  = json.dumps({"user": name, "password": pwd})
+        credentials = {"user": name,
+                       "codecs": [BINARY] if binary else [],
+                       "features": [DELTA, HEARTBEAT] if delta else [HEARTBEAT]}
+        if self.token is not None and name == self.name:
+            credentials["token"] = self.token
+        else:
+            credentials["password"] = pwd
+        self.name = name
+        login_credentials = json.dumps(credentials)
     
         self.send(login_credentials.encode())
         resp = self.recv_from_server()
         if resp.get("command") == "CONNECTED":
             if resp.get("to") == name:
+                self.codec = resp.get("codec", JSON)
+                self.features = resp.get("features", [])
+                self.token = resp.get("token")
                 print("listener_started")
                 self.listener.start()
                 return True
         elif resp.get("command") == "CONNECTION_REFUSED":
+            self.token = None
             self.server.close()
             self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.decoder = FrameDecoder()
             return False
 
     def send_to_server(self, command: str, username: str, **data: Any) -> None:
@@ -136,6 +182,14 @@ class NetworkClient:
         -------
         None
         """
+        if self.codec == BINARY:
+            binary = encode_binary(command, data)
+            if binary is not None:
+                self.send(binary)
+                if trace.level:
+                    trace.frame("server", SENT, binary)
+                return None
+
         jso = {"command": command,
                "from": username}
 
@@ -143,35 +197,25 @@ class NetworkClient:
             for key, value in data.items():
                 jso[key] = value
 
-        string_data = json.dumps(jso)
-        print(f"[{'SENDING':<10}] {string_data}")
-
-        self.send(string_data.encode(self.ENCODING))
+        encoded = json.dumps(jso).encode(self.ENCODING)
+        self.send(encoded)
+        if trace.level:
+            trace.frame("server", SENT, encoded)
 
-    def recv_from_server(self) -> dict | list[dict]:
+    def recv_from_server(self) -> dict:
         """
         Receive data from the server and convert it to a command
-        (Multiple commands can be received at once)
+        (commands sent at once are returned one after another by the next calls)
+        json and binary commands are both decoded to the same dict
 
         Returns
         -------
         dict : a command received from the server
-        list[dict] : a list of commands received from the server
         """
-        data = self.recv().decode()
-        print(f"[{'RECEIVED':<10}] {data}")
-        try:
-            return json.loads(data)
-        except json.decoder.JSONDecodeError:
-            commands = []
-            commands_len = data.count("command")
-            # Remove first and last {,} to be sure to add the {,} afterwards in the for loop
-            partial_commands = data[1:-1].split("}{")
-            if len(partial_commands) == commands_len:
-                for command in partial_commands:
-                    # Add the {, } to the command again to make sure it is json loadable
-                    commands.append(json.loads("{" + command + "}"))
-            return commands
+        data = self.recv()
+        if trace.level:
+            trace.frame("server", RECEIVED, data)
+        return decode(data, self.name, self.ENCODING)
 
     def recv_in_process(self) -> None:
         """
@@ -183,11 +227,13 @@ class NetworkClient:
         None
         """
         while self.running:
-            recv = self.recv_from_server()
-            if recv:
-                if isinstance(recv, list):
-                    for com in recv:
-                        self.que.put(com)
-                    return
+            try:
+                recv = self.recv_from_server()
+            except (ConnectionError, ValueError) as e:
+                trace.dump("server", e)
+                raise
+            if recv.get("command") == "HEARTBEAT":
+                # The answer keeps the connection from being closed as idle
+                self.send_to_server("HEARTBEAT", self.name)
+            elif recv:
                 self.que.put(recv)
-            time.sleep(0.2)
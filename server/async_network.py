@@ -0,0 +1,984 @@
+import json
+import random
+import asyncio
+from typing import Any, Iterable
+from models import ClientData
+from database import Database, BOT_PREFIX
+from game_logic import AsyncGameLogic
+from server_network import encode_broadcast
+from framing import HEADER_SIZE, MAX_FRAME_SIZE, encode_frame
+from codec import BINARY, negotiate_codec, encode_binary, decode_command
+from state_delta import HEARTBEAT, negotiate_features
+from lobby import Lobby, TABLE_SIZE
+from timer_wheel import TimerWheel, Timer
+from protocol_trace import SENT, RECEIVED, trace
+from engine import table_rng
+from replay_log import ReplayLog, PointRecorder
+from history import HistoryWriter, TableHistory
+from leaderboard import Leaderboard
+from bots import BotPlayer, bot_pool
+from snapshot import Checkpointer, load_checkpoints, snapshot_players
+from login_pool import LoginVerifier, valid_credentials
+from session import SessionTokens
+
+# A client whose unsent data grows beyond this does not read anymore
+MAX_WRITE_BUFFER = 1 << 20
+
+
+class AsyncTableServer:
+    """
+    A class to handle the network part of one table of the asyncio server
+
+    Offers the same methods GameLogic uses on a NetworkServer,
+    but the data is written to the StreamWriter of the clients
+    and receiving a command has to be awaited.
+    Every client has a task reading its commands into an inbox,
+    the deadlines of the table are timers of the shared TimerWheel
+
+    ...
+
+    Constants
+    ---------
+    ENCODING : str -> "utf-8"
+        The encoding when sending/receiving data
+
+    Attributes
+    ----------
+    clients : dict[str, ClientData]
+        The four clients sitting at this table
+    wheel : TimerWheel | None
+        The timers of every table of the event loop (None: no deadlines at all)
+    turn_timeout : float | None
+        The seconds a player has to play a card (None: wait forever)
+    idle_timeout : float | None
+        The table is closed if a client with the "heartbeat" feature sent nothing for this many seconds (None: never)
+    heartbeat_interval : float | None
+        Every how many seconds a HEARTBEAT is sent and the clients are checked for stalled writes
+    inboxes : dict[str, asyncio.Queue]
+        The received commands of every client
+    readers : list[asyncio.Task]
+        The tasks reading the commands of the clients
+    timers : dict[str, Timer]
+        The idle timers of the clients and the heartbeat timer of the table
+
+    Methods
+    -------
+    start() -> None
+        Start reading from the clients and arm the heartbeat and idle timers
+    send_all(command: str, **data) -> None
+        Send a command to every client of the table
+    broadcast(command: str, usernames: Iterable[str], **data) -> None
+        Send the same command to the given clients (encoded only once)
+    send_to(command: str, username: str, **data) -> None
+        Send data to a Client
+    receive_from_client(client: str, timeout: float | None = None) -> dict
+        Wait for ONE command of a client
+    read_commands(client: str) -> None
+        Read the commands of a client into its inbox (task per client)
+    heartbeat() -> None
+        Send a HEARTBEAT to every client and check if a client stopped reading
+    fail(error: Exception) -> None
+        Stop the table, the waiting receive_from_client raises the error
+    close() -> None
+        Close the connections to every client of the table
+    """
+    def __init__(self, clients: list[ClientData], wheel: TimerWheel | None = None, turn_timeout: float | None = None,
+                 idle_timeout: float | None = None, heartbeat_interval: float | None = None):
+        """
+        Initialize a new table with the given clients
+
+        Parameters
+        ----------
+        clients : list[ClientData]
+            The clients sitting at this table (in the order they joined)
+        wheel : TimerWheel | None (default: None)
+            The timers of every table of the event loop (None: no deadlines at all)
+        turn_timeout : float | None (default: None)
+            The seconds a player has to play a card
+        idle_timeout : float | None (default: None)
+            The table is closed if a client with the "heartbeat" feature sent nothing for this many seconds
+        heartbeat_interval : float | None (default: None)
+            Every how many seconds a HEARTBEAT is sent
+        """
+        self.ENCODING = "utf-8"
+        self.clients: dict[str, ClientData] = {client.name: client for client in clients}
+
+        self.wheel = wheel
+        self.turn_timeout = turn_timeout if wheel else None
+        self.idle_timeout = idle_timeout if wheel else None
+        self.heartbeat_interval = heartbeat_interval if wheel else None
+
+        self.inboxes: dict[str, asyncio.Queue] = {name: asyncio.Queue() for name in self.clients}
+        self.readers: list[asyncio.Task] = []
+        self.timers: dict[str, Timer] = {}
+
+    def start(self) -> None:
+        """
+        Start reading from the clients and arm the heartbeat and idle timers
+
+        Returns
+        -------
+        None
+        """
+        for name in self.clients:
+            self.readers.append(asyncio.create_task(self.read_commands(name)))
+            if self.idle_timeout and HEARTBEAT in self.clients[name].features:
+                self.timers[name] = self.wheel.call_later(self.idle_timeout, self.fail, TimeoutError(f"{name} is idle"))
+        if self.heartbeat_interval:
+            self.timers[""] = self.wheel.call_later(self.heartbeat_interval, self.heartbeat)
+
+    def send_all(self, command: str, **data: Any) -> None:
+        """
+        Send a command to every client of the table
+
+        Parameters
+        ----------
+        command : str
+            The command every client should receive
+        data : any
+            Additional data every client should receive
+
+        Returns
+        -------
+        None
+        """
+        self.broadcast(command, self.clients, **data)
+
+    def broadcast(self, command: str, usernames: Iterable[str], **data: Any) -> None:
+        """
+        Send the same command to the given clients
+
+        The data is serialized once, only the name of the client is spliced in
+        and every frame is handed to the StreamWriter with one writelines
+        (clients using the binary codec get the same binary command)
+
+        Parameters
+        ----------
+        command : str
+            The command the clients should receive
+        usernames : Iterable[str]
+            The names of the clients to send the command to
+        data : any
+            Additional data every client should receive
+
+        Returns
+        -------
+        None
+        """
+        head, tail = encode_broadcast(command, data, self.ENCODING)
+        binary = encode_binary(command, data)
+
+        for name in usernames:
+            client = self.clients.get(name)
+            if client is None:
+                continue
+            if binary is not None and client.codec == BINARY:
+                write_frame(client.writer, binary)
+                if trace.level:
+                    trace.frame(name, SENT, binary)
+            else:
+                length = len(head) + len(client.encoded_name) + len(tail)
+                client.writer.writelines([length.to_bytes(HEADER_SIZE, "big"), head, client.encoded_name, tail])
+                if trace.level:
+                    trace.frame(name, SENT, (head, client.encoded_name, tail))
+
+    def send_to(self, command: str, username: str, **data: Any) -> None:
+        """
+        Send data to a Client
+        (the data is buffered by the StreamWriter, so this never blocks the event loop)
+
+        Parameters
+        ----------
+        command : str
+            The command the Client should receive
+        username : str
+            The username the command should be sent to
+        data : any
+            Additional data the client needs
+
+        Returns
+        -------
+        None
+        """
+        if username not in self.clients:
+            return None
+        if self.clients[username].codec == BINARY:
+            binary = encode_binary(command, data)
+            if binary is not None:
+                write_frame(self.clients[username].writer, binary)
+                if trace.level:
+                    trace.frame(username, SENT, binary)
+                return None
+        jso = {"command": command,
+               "to": username}
+
+        if data:
+            for key, value in data.items():
+                jso[key] = value
+
+        encoded = json.dumps(jso).encode(self.ENCODING)
+        write_frame(self.clients[username].writer, encoded)
+        if trace.level:
+            trace.frame(username, SENT, encoded)
+
+    async def receive_from_client(self, client: str, timeout: float | None = None) -> dict:
+        """
+        Wait for ONE command of a client
+
+        Parameters
+        ----------
+        client : str
+            The client to receive the command from
+        timeout : float | None (default: None)
+            After this many seconds {"command": "TURN_TIMEOUT", "from": client} is returned
+
+        Returns
+        -------
+        dict : The command
+        """
+        inbox = self.inboxes[client]
+        deadline = None
+        if timeout and self.wheel:
+            # Every call has its own marker, a timeout that expired after the command arrived is skipped later
+            expired = {"command": "TURN_TIMEOUT", "from": client}
+            deadline = self.wheel.call_later(timeout, inbox.put_nowait, expired)
+        try:
+            while True:
+                data = await inbox.get()
+                if isinstance(data, Exception):
+                    raise data
+                if data.get("command") == "TURN_TIMEOUT" and (deadline is None or data is not expired):
+                    continue
+                return data
+        finally:
+            if deadline is not None:
+                deadline.cancel()
+
+    async def read_commands(self, client: str) -> None:
+        """
+        Read the commands of a client into its inbox
+        (every command restarts the idle timer of the client, HEARTBEAT is not put into the inbox)
+
+        Parameters
+        ----------
+        client : str
+            The client to read from
+
+        Returns
+        -------
+        None
+        """
+        reader = self.clients[client].reader
+        try:
+            while True:
+                data = await read_frame(reader)
+                if trace.level:
+                    trace.frame(client, RECEIVED, data)
+                command = decode_command(data, client, self.clients[client].codec, self.ENCODING)
+                if client in self.timers:
+                    self.timers[client].cancel()
+                    self.timers[client] = self.wheel.call_later(self.idle_timeout, self.fail, TimeoutError(f"{client} is idle"))
+                if command.get("command") != "HEARTBEAT":
+                    self.inboxes[client].put_nowait(command)
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError) as e:
+            self.fail(e)
+
+    def heartbeat(self) -> None:
+        """
+        Send a HEARTBEAT to every client and check if a client stopped reading
+
+        Returns
+        -------
+        None
+        """
+        for name, client in self.clients.items():
+            if client.writer.transport.get_write_buffer_size() > MAX_WRITE_BUFFER:
+                self.fail(TimeoutError(f"{name} does not read anymore"))
+                return
+        self.send_all("HEARTBEAT")
+        self.timers[""] = self.wheel.call_later(self.heartbeat_interval, self.heartbeat)
+
+    def fail(self, error: Exception) -> None:
+        """
+        Stop the table, the waiting receive_from_client raises the error
+
+        Parameters
+        ----------
+        error : Exception
+            The reason the table stops
+
+        Returns
+        -------
+        None
+        """
+        for inbox in self.inboxes.values():
+            inbox.put_nowait(error)
+
+    def close(self) -> None:
+        """
+        Close the connections to every client of the table
+
+        Returns
+        -------
+        None
+        """
+        for reader in self.readers:
+            reader.cancel()
+        for timer in self.timers.values():
+            timer.cancel()
+        for client in self.clients.values():
+            client.writer.close()
+
+
+class AsyncNetworkServer:
+    """
+    A class to host many tables in one process using asyncio
+
+    Every connection is handled by a StreamReader/StreamWriter,
+    the logged-in clients wait in the lobby until they are seated at a new table
+    that runs as its own task in the event loop
+
+    ...
+
+    Constants
+    ---------
+    ENCODING : str -> "utf-8"
+        The encoding when sending/receiving data
+
+    Attributes
+    ----------
+    db : Database
+        The database to verify the logins with
+    host : str
+        The IP-Address the server will be bind to
+    port : int
+        The Port the server will be bind to
+    stats_interval : float
+        Every how many seconds the stats of the lobby and the logins are printed (0 to never print them)
+    sessions : SessionTokens
+        Issues the session token of every login (a reconnecting client sends it instead of the password)
+    logins : LoginVerifier
+        Checks the tokens and passwords of the logins (bcrypt on a bounded thread pool, the event loop keeps running the tables)
+    table_options : dict[str, float | None]
+        The turn_timeout, idle_timeout and heartbeat_interval of every table
+    wheel : TimerWheel
+        The timers of every table of this process
+    seed : int | None
+        The seed the random generator of every table is derived from (None: the deals are not reproducible)
+    replay_log : ReplayLog | None
+        The log every point of this process is written to (None: the games are not recorded)
+    history : HistoryWriter | None
+        Writes the games, rounds, points and turns of every table to the database and rates the finished rounds
+        (None: neither the history nor the ratings are stored)
+    leaderboard : Leaderboard
+        Answers the LEADERBOARD requests of the players at the tables of this process from memory
+    bot_delay : float | None
+        The seconds a client waits in the lobby until bots fill the free seats of its table (None: never)
+    bot_budget : float
+        The seconds a bot thinks about one card
+    bots : set[asyncio.Task]
+        The tasks seating and playing the bots
+    checkpoints : Checkpointer | None
+        Writes the snapshots of the running tables (None: the tables are lost if the process dies)
+    checkpoint_interval : float
+        The seconds between two checkpoints
+    resume_timeout : float
+        The seconds the returned players of a table wait for the others until they join the lobby
+    snapshots : dict[int, bytes]
+        The tables of the last checkpoints that were not resumed yet
+    resumable : dict[str, int]
+        The snapshot of every player that has a table to return to
+    returning : dict[int, dict[str, ClientData]]
+        The players that already returned to every snapshot
+    party_timeout : float
+        The seconds a party waits for its missing clients until its clients wait for a table alone
+    players : set[str] (default: set())
+        The names of every client that is currently connected
+    watchers : dict[str, asyncio.Task] (default: {})
+        The task of every client that is not seated yet, it notices when the client disconnects
+    lobby : Lobby
+        The clients that logged in but are not seated at a table yet
+    tables : set[asyncio.Task] (default: set())
+        The tasks of the currently running tables
+
+    Methods
+    -------
+    serve_forever() -> None
+        Bind to the port and accept clients until the server is stopped
+    handle_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None
+        Verify the login of a new connection and let the client wait for a table
+        (the optional "party" and "party_size" of the login seat friends at the same table)
+    start_table(clients: list[ClientData], snapshot: bytes | None = None) -> None
+        Start a new table with the given clients as a task
+    run_table(table: AsyncTableServer, rng: random.Random, recorder: PointRecorder | None = None, number: int = 0,
+              snapshot: bytes | None = None) -> None
+        Play on the table until a client disconnects
+    wait_for_table(client: ClientData, party: str | None = None, party_size: int = 1) -> None
+        Let a client wait in the lobby until it is seated (or disconnects)
+    watch_waiting(client: ClientData) -> None
+        Remove a client from the lobby and the returning players once it disconnects
+    stop_watching(clients: list[ClientData]) -> None
+        Stop the watchers of the clients that are seated now (the table reads from them)
+    party_expired(party: str, clients: list[ClientData]) -> None
+        Let the clients of a party that is not complete in time wait alone
+    call_bots(name: str) -> None
+        Fill the table of a client that still waits in the lobby with bots
+    seat_bots(name: str) -> None
+        Add bots to the lobby until the client is seated
+    rejoin(client: ClientData) -> None
+        Seat a player at the table of the last checkpoint when every player of it returned
+    resume_expired(index: int) -> None
+        Let the returned players of a table join the lobby if the others did not return in time
+    report_stats() -> None
+        Print the queue depth and the time-to-table of the lobby, the login latency and the history queue
+        every stats_interval seconds
+    """
+    def __init__(self, db: Database, host: str = "127.0.0.2", port: int = 3333, stats_interval: float = 30,
+                 turn_timeout: float | None = 30, idle_timeout: float | None = 180, heartbeat_interval: float | None = 15,
+                 seed: int | None = None, replay_dir: str | None = None, bot_delay: float | None = None,
+                 bot_budget: float = 0.5, checkpoint_dir: str | None = None, checkpoint_interval: float = 5,
+                 resume_timeout: float = 60, login_workers: int | None = None, max_pending_logins: int = 1024,
+                 session_secret: bytes | None = None, session_lifetime: float = 12 * 60 * 60, history_queue: int = 10000,
+                 party_timeout: float = 120):
+        """
+        Initialize a new AsyncNetworkServer to handle the network
+
+        Parameters
+        ----------
+        db : Database
+            The database to verify the logins with
+        host : str
+            The IP-Address the server will be bind to
+        port : int
+            The Port the server will be bind to
+        stats_interval : float (default: 30)
+            Every how many seconds the stats of the lobby and the logins are printed (0 to never print them)
+        turn_timeout : float | None (default: 30)
+            The seconds a player has to play a card, then a card is played for the player (None: wait forever)
+        idle_timeout : float | None (default: 180)
+            A table is closed if one of its clients with the "heartbeat" feature sent nothing for this many seconds (None: never)
+        heartbeat_interval : float | None (default: 15)
+            Every how many seconds a HEARTBEAT is sent to the clients at a table (None: never)
+        seed : int | None (default: None)
+            The seed the random generator of every table is derived from (the n-th table always gets the same deals)
+        replay_dir : str | None (default: None)
+            The directory of the replay logs (None: the games are not recorded)
+        bot_delay : float | None (default: None)
+            The seconds a client waits in the lobby until bots fill the free seats of its table (None: never)
+        bot_budget : float (default: 0.5)
+            The seconds a bot thinks about one card
+        checkpoint_dir : str | None (default: None)
+            The directory of the checkpoints (the tables found there are resumed when their players log in again)
+        checkpoint_interval : float (default: 5)
+            The seconds between two checkpoints
+        resume_timeout : float (default: 60)
+            The seconds the returned players of a table wait for the others until they join the lobby
+        login_workers : int | None (default: None)
+            How many passwords are checked at once (one per core if not given)
+        max_pending_logins : int (default: 1024)
+            How many logins may wait for their check before new logins are refused
+        session_secret : bytes | None (default: None)
+            The key of the session tokens (a random one if not given, the tokens are not valid after a restart then)
+        session_lifetime : float (default: 12 hours)
+            The seconds a session token is valid
+        history_queue : int (default: 10000)
+            How many history records may wait for the database before new ones are dropped (0: the history is not stored)
+        party_timeout : float (default: 120)
+            The seconds a party waits for its missing clients until its clients wait for a table alone
+        """
+        self.db = db
+        self.host = host
+        self.port = port
+        self.stats_interval = stats_interval
+        self.ENCODING = "utf-8"
+        self.sessions: SessionTokens = SessionTokens(session_secret, session_lifetime)
+        self.logins: LoginVerifier = LoginVerifier(db, login_workers, max_pending_logins, sessions=self.sessions)
+
+        self.table_options: dict[str, float | None] = {
+            "turn_timeout": turn_timeout,
+            "idle_timeout": idle_timeout,
+            "heartbeat_interval": heartbeat_interval
+        }
+        self.wheel: TimerWheel = TimerWheel()
+        self.seed = seed
+        self.replay_log: ReplayLog | None = ReplayLog(replay_dir) if replay_dir else None
+        self.leaderboard: Leaderboard = Leaderboard(db)
+        self.history: HistoryWriter | None = HistoryWriter(db, history_queue, leaderboard=self.leaderboard) if history_queue else None
+        self.bot_delay = bot_delay
+        self.bot_budget = bot_budget
+        self.bots: set[asyncio.Task] = set()
+        self._bot_count: int = 0
+        self.checkpoints: Checkpointer | None = Checkpointer(checkpoint_dir) if checkpoint_dir else None
+        self.checkpoint_interval = checkpoint_interval
+        self.resume_timeout = resume_timeout
+        self.snapshots: dict[int, bytes] = dict(enumerate(load_checkpoints(checkpoint_dir))) if checkpoint_dir else {}
+        self.resumable: dict[str, int] = {name: index for index, snapshot in self.snapshots.items()
+                                          for name in snapshot_players(snapshot)}
+        self.returning: dict[int, dict[str, ClientData]] = {}
+        self.party_timeout = party_timeout
+        if self.snapshots:
+            print(f"[{'CHECKPOINT':<10}] {len(self.snapshots)} tables wait for their players")
+
+        self.players: set[str] = set()
+        self.watchers: dict[str, asyncio.Task] = {}
+        self.lobby: Lobby = Lobby(self.start_table)
+        self.tables: set[asyncio.Task] = set()
+
+    async def serve_forever(self) -> None:
+        """
+        Bind to the port and accept clients until the server is stopped
+
+        Returns
+        -------
+        None
+        """
+        server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+        print(f"[{'LISTENING':<10}] Bound to the port: {self.host}:{self.port}")
+        stats_task = asyncio.create_task(self.report_stats()) if self.stats_interval else None
+        wheel_task = asyncio.create_task(self.wheel.run())
+        replay_task = asyncio.create_task(self.replay_log.run()) if self.replay_log else None
+        checkpoint_task = asyncio.create_task(self.checkpoints.run(self.checkpoint_interval)) if self.checkpoints else None
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            wheel_task.cancel()
+            if replay_task is not None:
+                replay_task.cancel()
+                self.replay_log.close()
+            if checkpoint_task is not None:
+                # The tables are still running, a restarted server resumes them
+                checkpoint_task.cancel()
+                self.checkpoints.write(self.checkpoints.checkpoint())
+            if stats_task is not None:
+                stats_task.cancel()
+            if self.history is not None:
+                self.history.close()
+            self.logins.close()
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        Verify the login of a new connection and let the client wait for a table
+        (the optional "party" and "party_size" of the login seat friends at the same table)
+
+        Parameters
+        ----------
+        reader : asyncio.StreamReader
+            The stream to read from the new client
+        writer : asyncio.StreamWriter
+            The stream to write to the new client
+
+        Returns
+        -------
+        None
+        """
+        try:
+            login_credentials: dict = json.loads((await read_frame(reader)).decode(self.ENCODING))
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            writer.close()
+            return
+        if not valid_credentials(login_credentials):
+            writer.close()
+            return
+        name = login_credentials.get("user")
+
+        verified = False
+        if name not in self.players:
+            # A valid token is checked right away, a password on the pool (the tables keep playing in the meantime)
+            verified = await self.logins.verify(name, login_credentials.get("password"), login_credentials.get("token"))
+        if not verified or name in self.players:
+            refused = {"command": "CONNECTION_REFUSED"}
+            if verified is None:
+                # Too many logins were waiting, the password was not checked
+                refused["reason"] = "busy"
+            write_frame(writer, json.dumps(refused).encode(self.ENCODING))
+            writer.close()
+            return
+
+        client = ClientData.new_stream(name, reader, writer)
+        client.codec = negotiate_codec(login_credentials.get("codecs"))
+        client.features = negotiate_features(login_credentials.get("features"))
+        self.players.add(name)
+        print(f"[{'CONNECTION':<10}] {name} connected ({self.lobby.waiting + 1} waiting, {len(self.tables)} tables)")
+        write_frame(writer, json.dumps({"command": "CONNECTED", "to": name, "codec": client.codec, "features": client.features,
+                                        "token": self.sessions.issue(name)}).encode(self.ENCODING))
+
+        self.watchers[name] = asyncio.create_task(self.watch_waiting(client))
+        if name in self.resumable:
+            self.rejoin(client)
+            return
+        party, party_size = login_credentials.get("party"), login_credentials.get("party_size", 1)
+        self.wait_for_table(client, party if isinstance(party, str) else None, party_size if isinstance(party_size, int) else 1)
+        if self.bot_delay:
+            self.wheel.call_later(self.bot_delay, self.call_bots, name)
+
+    def wait_for_table(self, client: ClientData, party: str | None = None, party_size: int = 1) -> None:
+        """
+        Let a client wait in the lobby until it is seated (or disconnects)
+
+        Parameters
+        ----------
+        client : ClientData
+            The client that wants to play
+        party : str | None (default: None)
+            The id of the party of the client (None to play alone)
+        party_size : int (default: 1)
+            How many clients belong to the party (clamped to 1-4)
+
+        Returns
+        -------
+        None
+        """
+        self.lobby.join(client, party, party_size)
+        if party is not None and party in self.lobby.parties:
+            clients = self.lobby.parties[party][1]
+            if len(clients) == 1:
+                # The first client of the party starts its timer
+                self.wheel.call_later(self.party_timeout, self.party_expired, party, clients)
+
+    async def watch_waiting(self, client: ClientData) -> None:
+        """
+        Remove a client from the lobby and the returning players once it disconnects
+        (a client sends nothing before it is seated, a frame sent anyway is ignored)
+
+        Parameters
+        ----------
+        client : ClientData
+            The client that waits for a table
+
+        Returns
+        -------
+        None
+        """
+        try:
+            while True:
+                await read_frame(client.reader)
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        del self.watchers[client.name]
+
+        left = self.lobby.leave(client.name)
+        for index, returned in self.returning.items():
+            if returned.pop(client.name, None) is not None:
+                left.append(client)
+        client.writer.close()
+        self.players.discard(client.name)
+        print(f"[{'DISCONNECT':<10}] {client.name} left before it was seated ({self.lobby.waiting} waiting)")
+        for other in left:
+            if other is not client:
+                # The rest of the party waits alone
+                self.lobby.join(other)
+
+    def stop_watching(self, clients: list[ClientData]) -> None:
+        """
+        Stop the watchers of the clients that are seated now (the table reads from them)
+
+        Parameters
+        ----------
+        clients : list[ClientData]
+            The clients of the new table
+
+        Returns
+        -------
+        None
+        """
+        for client in clients:
+            watcher = self.watchers.pop(client.name, None)
+            if watcher is not None:
+                watcher.cancel()
+
+    def party_expired(self, party: str, clients: list[ClientData]) -> None:
+        """
+        Let the clients of a party that is not complete in time wait alone
+
+        Parameters
+        ----------
+        party : str
+            The id of the party
+        clients : list[ClientData]
+            The clients of the party when it was started
+
+        Returns
+        -------
+        None
+        """
+        names = [client.name for client in clients]
+        if self.lobby.expire_party(party, clients):
+            print(f"[{'PARTY':<10}] The party of {', '.join(names)} was not complete in time, they wait alone")
+
+    def call_bots(self, name: str) -> None:
+        """
+        Fill the table of a client that still waits in the lobby with bots
+
+        Parameters
+        ----------
+        name : str
+            The name of the client
+
+        Returns
+        -------
+        None
+        """
+        if name in self.lobby.entries:
+            task = asyncio.create_task(self.seat_bots(name))
+            self.bots.add(task)
+            task.add_done_callback(self.bots.discard)
+
+    async def seat_bots(self, name: str) -> None:
+        """
+        Add bots to the lobby until the client is seated
+        (the bots play in this process, their rollouts run on the shared process pool)
+
+        Parameters
+        ----------
+        name : str
+            The name of the client
+
+        Returns
+        -------
+        None
+        """
+        bots = []
+        for i in range(TABLE_SIZE - 1):
+            self._bot_count += 1
+            bot = BotPlayer(f"{BOT_PREFIX}{self._bot_count}", bot_pool(), self.bot_budget)
+            bots.append((bot, await bot.connect()))
+            self.bots.add(bot.task)
+            bot.task.add_done_callback(self.bots.discard)
+
+        # The bots join without awaiting anything, so no other bot or client can take the seats in between
+        for bot, client in bots:
+            if name not in self.lobby.entries:
+                # The bot is not needed anymore, it stops when its connection is closed
+                client.writer.close()
+                continue
+            self.players.add(bot.name)
+            print(f"[{'BOT':<10}] {bot.name} joined the lobby for {name}")
+            self.watchers[bot.name] = asyncio.create_task(self.watch_waiting(client))
+            self.lobby.join(client)
+
+    def rejoin(self, client: ClientData) -> None:
+        """
+        Seat a player at the table of the last checkpoint when every player of it returned
+
+        Parameters
+        ----------
+        client : ClientData
+            The player that logged in again
+
+        Returns
+        -------
+        None
+        """
+        index = self.resumable[client.name]
+        returned = self.returning.setdefault(index, {})
+        if not returned:
+            self.wheel.call_later(self.resume_timeout, self.resume_expired, index)
+        returned[client.name] = client
+
+        players = snapshot_players(self.snapshots[index])
+        if len(returned) < len(players):
+            print(f"[{'RESUME':<10}] {client.name} returned to a table ({len(returned)}/{len(players)} players)")
+            return
+        for name in players:
+            del self.resumable[name]
+        del self.returning[index]
+        # The resumed table gets a new number, the numbers of the last process are used again by new tables
+        self.lobby.tables += 1
+        print(f"[{'RESUME':<10}] Table {', '.join(players)} resumed")
+        self.start_table([returned[name] for name in players], self.snapshots.pop(index))
+
+    def resume_expired(self, index: int) -> None:
+        """
+        Let the returned players of a table join the lobby if the others did not return in time
+
+        Parameters
+        ----------
+        index : int
+            The index of the snapshot
+
+        Returns
+        -------
+        None
+        """
+        returned = self.returning.pop(index, None)
+        if returned is None:
+            return
+        for name in snapshot_players(self.snapshots.pop(index)):
+            del self.resumable[name]
+        print(f"[{'RESUME':<10}] Table {', '.join(returned)} was not resumed, the players join the lobby")
+        for client in returned.values():
+            self.lobby.join(client)
+
+    def start_table(self, clients: list[ClientData], snapshot: bytes | None = None) -> None:
+        """
+        Start a new table with the given clients as a task
+
+        Parameters
+        ----------
+        clients : list[ClientData]
+            The four clients to seat at the table
+        snapshot : bytes | None (default: None)
+            Continue the table of this snapshot (the clients are its players)
+
+        Returns
+        -------
+        None
+        """
+        self.stop_watching(clients)
+        table = AsyncTableServer(clients, self.wheel, **self.table_options)
+        number = self.lobby.tables
+        recorder = PointRecorder(self.replay_log, number) if self.replay_log else None
+        task = asyncio.create_task(self.run_table(table, table_rng(self.seed, number), recorder, number, snapshot))
+        self.tables.add(task)
+        task.add_done_callback(self.tables.discard)
+
+    async def run_table(self, table: AsyncTableServer, rng: random.Random, recorder: PointRecorder | None = None,
+                        number: int = 0, snapshot: bytes | None = None) -> None:
+        """
+        Play on the table until a client disconnects
+
+        Parameters
+        ----------
+        table : AsyncTableServer
+            The table to play on
+        rng : random.Random
+            The random generator of the table
+        recorder : PointRecorder | None (default: None)
+            Writes the points of the table to the replay log
+        number : int (default: 0)
+            The number of the table (in the checkpoints)
+        snapshot : bytes | None (default: None)
+            Continue the table of this snapshot
+
+        Returns
+        -------
+        None
+        """
+        try:
+            await play_table(table, self.db, rng, recorder, self.checkpoints, number, snapshot, self.history, self.leaderboard)
+        finally:
+            self.players.difference_update(table.clients)
+
+    async def report_stats(self) -> None:
+        """
+        Print the queue depth and the time-to-table of the lobby, the login latency and the history queue
+        every stats_interval seconds
+
+        Returns
+        -------
+        None
+        """
+        while True:
+            await asyncio.sleep(self.stats_interval)
+            stats = self.lobby.stats()
+            print(f"[{'LOBBY':<10}] {stats['waiting']} waiting, {stats['tables']} tables formed, "
+                  f"time-to-table mean {stats['mean']:.3f}s p50 {stats['p50']:.3f}s "
+                  f"p95 {stats['p95']:.3f}s max {stats['max']:.3f}s")
+            stats = self.logins.stats()
+            print(f"[{'LOGIN':<10}] {stats['pending']} pending, {stats['refused']} refused as busy, {stats['tokens']} by token, "
+                  f"latency mean {stats['mean']:.3f}s p50 {stats['p50']:.3f}s p95 {stats['p95']:.3f}s "
+                  f"p99 {stats['p99']:.3f}s max {stats['max']:.3f}s")
+            if self.history is not None:
+                stats = self.history.stats()
+                print(f"[{'HISTORY':<10}] {stats['queued']} queued, {stats['written']} written in {stats['batches']} "
+                      f"transactions, {stats['dropped']} dropped")
+
+
+async def play_table(table: AsyncTableServer, db: Database, rng: random.Random | None = None,
+                     recorder: PointRecorder | None = None, checkpoints: Checkpointer | None = None, number: int = 0,
+                     snapshot: bytes | None = None, history: HistoryWriter | None = None,
+                     leaderboard: Leaderboard | None = None) -> None:
+    """
+    Play on the table until a client disconnects or times out, then close the connections of the table
+
+    Parameters
+    ----------
+    table : AsyncTableServer
+        The table to play on
+    db : Database
+        The database shared by every table
+    rng : random.Random | None (default: None)
+        The random generator of the table
+    recorder : PointRecorder | None (default: None)
+        Writes the points of the table to the replay log (the unfinished point is written when the table closes)
+    checkpoints : Checkpointer | None (default: None)
+        Includes the table in the checkpoints while it is played
+    number : int (default: 0)
+        The number of the table
+    snapshot : bytes | None (default: None)
+        Continue the table of this snapshot instead of starting a new one
+    history : HistoryWriter | None (default: None)
+        Writes the history of the table to the database (the game is marked as ended when the table closes)
+    leaderboard : Leaderboard | None (default: None)
+        Answers the LEADERBOARD requests of the players
+
+    Returns
+    -------
+    None
+    """
+    table.start()
+    table_history = TableHistory(history, number) if history is not None else None
+    try:
+        game = AsyncGameLogic(table, db, rng, recorder, snapshot, table_history, leaderboard)
+        if checkpoints is not None:
+            checkpoints.add(number, game.engine)
+        await game.start_game_loop()
+    except (asyncio.IncompleteReadError, ConnectionError, ValueError, TimeoutError) as e:
+        print(f"[{'DISCONNECT':<10}] Table {', '.join(table.clients)} closed ({e!r})")
+        for name in table.clients:
+            trace.dump(name, e)
+    finally:
+        if checkpoints is not None:
+            checkpoints.discard(number)
+        table.close()
+        for name in table.clients:
+            trace.forget(name)
+        if recorder is not None:
+            recorder.finish_point()
+        if table_history is not None:
+            table_history.finish()
+
+
+async def read_frame(reader: asyncio.StreamReader) -> bytes:
+    """
+    Read one frame (first the 16 byte length, then the data) from the stream
+
+    Parameters
+    ----------
+    reader : asyncio.StreamReader
+        The stream to read from
+
+    Returns
+    -------
+    bytes : The data of the frame
+    """
+    length = int.from_bytes(await reader.readexactly(HEADER_SIZE), "big")
+    if length > MAX_FRAME_SIZE:
+        raise ValueError(f"Frame of {length} bytes exceeds the limit of {MAX_FRAME_SIZE} bytes")
+    return await reader.readexactly(length)
+
+
+def write_frame(writer: asyncio.StreamWriter, data: bytes) -> None:
+    """
+    Write one frame (first the 16 byte length, then the data) to the stream
+
+    Parameters
+    ----------
+    writer : asyncio.StreamWriter
+        The stream to write to
+    data : bytes
+        The data of the frame
+
+    Returns
+    -------
+    None
+    """
+    writer.write(encode_frame(data))
+
+
+if __name__ == '__main__':
+    HOST = "127.0.0.1"
+    PORT = 3333
+    server = AsyncNetworkServer(Database(), host=HOST, port=PORT)
+    asyncio.run(server.serve_forever())
@@ -0,0 +1,343 @@
+import json
+import time
+import random
+import socket
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, Executor
+
+from models import ClientData
+from cards_utils import CARD_AMOUNT, CARD_COLORS, COLOR_MASKS, CARD_MASKS, TRICK_RANKS, mask_ids
+from codec import BINARY, decode
+from framing import HEADER_SIZE, encode_frame
+
+SEATS = 4
+TRICKS = 5
+# A team that won this many turns won the point
+TURNS_TO_WIN = 3
+
+_pool: ProcessPoolExecutor | None = None
+
+
+def bot_pool(workers: int | None = None) -> ProcessPoolExecutor:
+    """
+    Get the process pool every bot of this process runs its rollouts on (created on the first call)
+
+    Parameters
+    ----------
+    workers : int | None (default: None)
+        The amount of processes of a new pool (one per core if not given)
+
+    Returns
+    -------
+    ProcessPoolExecutor : The shared pool
+    """
+    global _pool
+    if _pool is None:
+        # The pool is started from a running event loop, so the processes are spawned instead of forked
+        _pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def rollout_cards(hand: int, unknown: list[int], sizes: list[int], highest: int, trick: list[int],
+                  turns: list[int], candidates: list[int], deadline: float, seed: int) -> list[int]:
+    """
+    Play random points after every candidate until the deadline and count how often the team of the bot won
+
+    Every rollout deals the unknown cards to the other players (a determinization),
+    chooses the highest card if the bot does not know it
+    and lets every player play a random allowed card (the rules of check_available_mask).
+    The seats are relative to the bot: 0 is the bot, 2 its partner, 1 and 3 the other team.
+
+    Parameters
+    ----------
+    hand : int
+        The cards of the bot as a bit mask
+    unknown : list[int]
+        The cards the bot has not seen (neither in its hand nor played)
+    sizes : list[int]
+        The amount of cards of the players in the seats 1, 2 and 3
+    highest : int
+        The id of the highest card (-1 if the bot does not know it)
+    trick : list[int]
+        The cards already played in the current turn
+    turns : list[int]
+        The turns won by the team of the bot and by the other team
+    candidates : list[int]
+        The cards the bot is allowed to play
+    deadline : float
+        time.monotonic() at which the rollouts stop (at least one rollout per candidate is played)
+    seed : int
+        The seed of the random generator
+
+    Returns
+    -------
+    list[int] : The amount of won rollouts of every candidate (the same amount of rollouts each)
+    """
+    rng = random.Random(seed)
+    wins = [0] * len(candidates)
+    position = len(trick)
+    while True:
+        for index, card in enumerate(candidates):
+            rng.shuffle(unknown)
+            hands = [hand ^ CARD_MASKS[card], 0, 0, 0]
+            start = 0
+            for seat in (1, 2, 3):
+                for card_id in unknown[start:start + sizes[seat - 1]]:
+                    hands[seat] |= CARD_MASKS[card_id]
+                start += sizes[seat - 1]
+            wins[index] += _play_out(hands, trick + [card], position, highest if highest >= 0 else rng.randrange(CARD_AMOUNT),
+                                     list(turns), rng)
+        if time.monotonic() >= deadline:
+            return wins
+
+
+def _play_out(hands: list[int], trick: list[int], position: int, highest: int, turns: list[int], rng: random.Random) -> int:
+    # Finish the point with random allowed cards, 1 if the team of seat 0 won it
+    highest_color = CARD_COLORS[highest]
+    leader = -position % SEATS
+    while True:
+        for seat in range(leader + len(trick), leader + SEATS):
+            hand = hands[seat % SEATS]
+            allowed = hand
+            if len(trick) == SEATS - 1 and CARD_COLORS[trick[0]] == highest_color:
+                # Only the first and the last player of a turn know the highest card
+                allowed = hand & COLOR_MASKS[highest_color] or hand
+            card = rng.choice(mask_ids(allowed))
+            hands[seat % SEATS] = hand ^ CARD_MASKS[card]
+            trick.append(card)
+
+        offset = (highest * CARD_AMOUNT + trick[0]) * CARD_AMOUNT
+        winner, winner_rank = 0, TRICK_RANKS[offset + trick[0]]
+        for index in (1, 2, 3):
+            rank = TRICK_RANKS[offset + trick[index]]
+            if rank > winner_rank:
+                winner, winner_rank = index, rank
+        leader = (leader + winner) % SEATS
+        turns[leader % 2] += 1
+        if turns[0] >= TURNS_TO_WIN:
+            return 1
+        if turns[1] >= TURNS_TO_WIN:
+            return 0
+        trick = []
+
+
+class BotPlayer:
+    """
+    A class to play one seat with a bot instead of a human
+
+    The bot is a client like every other: the server gets one end of a socket pair as the connection of the bot,
+    the bot reads the commands of the table from the other end and answers PLAYER_TURN with PLAY_CARD.
+    It only knows what a client knows (its cards, the played cards, the highest card if it was shown)
+    and chooses from the allowed cards with determinized Monte Carlo rollouts on the shared process pool.
+
+    ...
+
+    Attributes
+    ----------
+    name : str
+        The name of the bot
+    pool : Executor
+        The pool the rollouts run on
+    budget : float
+        The seconds the bot thinks about one card
+    chunks : int
+        Into how many pool tasks the rollouts of one card are split
+    seats : list[str]
+        The names of the players (the bot first, then the players after it)
+    hand : int
+        The cards of the bot as a bit mask
+    gone : int
+        The cards played in the current point as a bit mask
+    highest : int
+        The id of the highest card (-1 if the bot does not know it)
+    trick : list[int]
+        The cards played in the current turn
+    turns : list[int]
+        The turns won by the team of the bot and by the other team in the current point
+    task : asyncio.Task | None
+        The task playing the seat
+
+    Methods
+    -------
+    connect() -> ClientData
+        Create the connection of the bot and start playing
+    play(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None
+        Answer the commands of the table until the connection is closed
+    handle(data: dict) -> None
+        Update what the bot knows about the point
+    choose(available: list[int]) -> int
+        Choose the card with the most won rollouts
+    """
+    def __init__(self, name: str, pool: Executor, budget: float = 0.5, chunks: int = 2):
+        """
+        Initialize a new bot
+
+        Parameters
+        ----------
+        name : str
+            The name of the bot
+        pool : Executor
+            The pool the rollouts run on
+        budget : float (default: 0.5)
+            The seconds the bot thinks about one card
+        chunks : int (default: 2)
+            Into how many pool tasks the rollouts of one card are split
+        """
+        self.name = name
+        self.pool = pool
+        self.budget = budget
+        self.chunks = chunks
+        self.seats: list[str] = [name]
+        self.hand: int = 0
+        self.gone: int = 0
+        self.highest: int = -1
+        self.trick: list[int] = []
+        self.turns: list[int] = [0, 0]
+        self.task: asyncio.Task | None = None
+
+    async def connect(self) -> ClientData:
+        """
+        Create the connection of the bot and start playing
+        (the client has no login, it can be put into the lobby directly)
+
+        Returns
+        -------
+        ClientData : The server side of the connection
+        """
+        server_side, bot_side = socket.socketpair()
+        reader, writer = await asyncio.open_connection(sock=server_side)
+        client = ClientData.new_stream(self.name, reader, writer)
+        client.codec = BINARY
+        self.task = asyncio.create_task(self.play(*await asyncio.open_connection(sock=bot_side)))
+        return client
+
+    async def play(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        Answer the commands of the table until the connection is closed
+
+        Parameters
+        ----------
+        reader : asyncio.StreamReader
+            The stream to read the commands from
+        writer : asyncio.StreamWriter
+            The stream to write the cards to
+
+        Returns
+        -------
+        None
+        """
+        try:
+            while True:
+                length = int.from_bytes(await reader.readexactly(HEADER_SIZE), "big")
+                data = decode(await reader.readexactly(length), self.name)
+                if data.get("command") != "PLAYER_TURN":
+                    self.handle(data)
+                    continue
+                card = await self.choose(data["available"])
+                writer.write(encode_frame(json.dumps({"command": "PLAY_CARD", "from": self.name, "card": card}).encode()))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def handle(self, data: dict) -> None:
+        """
+        Update what the bot knows about the point
+
+        Parameters
+        ----------
+        data : dict
+            A command of the table
+
+        Returns
+        -------
+        None
+        """
+        match data.get("command"):
+            case "PLAYER_NAMES":
+                self.seats = data["players"]
+            case "NEW_CARD":
+                self.hand = sum(CARD_MASKS[card] for card in data["cards"])
+                self.gone = 0
+                self.highest = -1
+                self.trick = []
+                self.turns = [0, 0]
+            case "HIGHEST":
+                self.highest = data["highest"]
+            case "UPDATE_TURN":
+                self.trick = list(data["played"])
+                self.gone |= CARD_MASKS[self.trick[-1]]
+                if data["last_played"] == self.name:
+                    self.hand &= ~CARD_MASKS[self.trick[-1]]
+            case "TURN_WINNER":
+                self.trick = []
+                mine, other = (data["team1"], data["team2"]) if self.name in data["team1"]["player"] else (data["team2"], data["team1"])
+                self.turns = [mine["turns"], other["turns"]]
+
+    async def choose(self, available: list[int]) -> int:
+        """
+        Choose the card with the most won rollouts
+        (the rollouts that did not finish in time are dropped, without any result the first card is played)
+
+        Parameters
+        ----------
+        available : list[int]
+            The cards the bot is allowed to play
+
+        Returns
+        -------
+        int : The id of the card
+        """
+        if len(available) == 1:
+            return available[0]
+
+        # The players before the bot in this turn already played one more card
+        played = sum(self.turns)
+        sizes = [TRICKS - played - (seat >= SEATS - len(self.trick)) for seat in (1, 2, 3)]
+        unknown = mask_ids((1 << CARD_AMOUNT) - 1 & ~self.hand & ~self.gone)
+        deadline = time.monotonic() + self.budget
+
+        loop = asyncio.get_running_loop()
+        try:
+            futures = [
+                loop.run_in_executor(self.pool, rollout_cards, self.hand, unknown, sizes, self.highest, self.trick,
+                                     self.turns, available, deadline, random.getrandbits(32))
+                for i in range(self.chunks)
+            ]
+        except RuntimeError as e:
+            # The pool is broken or shut down, the bot keeps playing without thinking
+            print(f"[{'BOT':<10}] {self.name} can not use the pool ({e!r})")
+            return available[0]
+        done, pending = await asyncio.wait(futures, timeout=self.budget * 2)
+        for future in pending:
+            future.cancel()
+
+        wins = [0] * len(available)
+        for future in done:
+            if future.exception() is None:
+                wins = [a + b for a, b in zip(wins, future.result())]
+        return available[max(range(len(available)), key=wins.__getitem__)]
+
+
+if __name__ == '__main__':
+    # Seat four bots at a table of the asyncio server and let them play one round
+    from database import Database
+    from async_network import AsyncTableServer
+    from game_logic import AsyncGameLogic
+
+    BUDGET = 0.05
+
+    async def benchmark():
+        bots = [BotPlayer(name, bot_pool(), BUDGET, chunks=4) for name in ["Marcel", "Daniel", "Thomas", "Christoph"]]
+        table = AsyncTableServer([await bot.connect() for bot in bots])
+        table.start()
+        game = AsyncGameLogic(table, Database())
+        start_time = time.perf_counter()
+        await game.start_new_round()
+        duration = time.perf_counter() - start_time
+        table.close()
+        print(f"[{'BENCHMARK':<10}] One round in {duration:.2f}s with a budget of {BUDGET * 1000:.0f}ms per card "
+              f"on {bot_pool()._max_workers} processes")
+
+    asyncio.run(benchmark())
@@ -4,6 +4,27 @@ from typing import Tuple
 COL = ["Schell", "Herz", "Eichel", "Laub"]
 NUM = ["VII", "VIII", "IX", "X", "Unter", "Ober", "König", "Ass"]
 
+CARD_AMOUNT = 33
+
+# The color and the number of every card id (the same values as CardBase.col()/num()),
+# the entry after the Weli (32) is the empty card (-1), so CARD_COLORS[-1] is its color as well
+CARD_COLORS = tuple([card // 8 + 1 for card in range(32)] + [1, -1])
+CARD_NUMBERS = tuple([card % 8 + 1 for card in range(32)] + [0, -1])
+
+# Hands are 33 bit masks (bit i is set if the hand contains the card with the ID i)
+CARD_MASKS = tuple(1 << card for card in range(CARD_AMOUNT))
+FULL_MASK = (1 << CARD_AMOUNT) - 1
+# The cards of every color (COLOR_MASKS[CARD_COLORS[card_id]]), the Weli is a Schell
+COLOR_MASKS = tuple(
+    sum(CARD_MASKS[card] for card in range(CARD_AMOUNT) if CARD_COLORS[card] == color) for color in range(5)
+)
+
+# The strength of a card in a turn (the strongest card wins, the first one on equal strength)
+RANK_HIGHEST = 40
+RANK_NUMBER = 30
+RANK_COLOR = 20
+RANK_LED = 10
+
 
 def convert_to_readable(card_id: int) -> tuple[str, str]:
     """
@@ -89,3 +110,66 @@ def get_card_num(card_id, representation: bool = True, integer: bool = False) ->
         return int(card_id) % 8
     else:
         return NUM[(int(card_id) % 8)]
+
+
+def trick_rank(card_id: int, led_id: int, highest_id: int) -> int:
+    """
+    Get the strength of a card in a turn
+
+    The highest card beats everything, then the cards with its number (the first one played wins),
+    then the cards with its color and then the cards with the color of the first card (by their number),
+    the other cards can not win the turn
+
+    Parameters
+    ----------
+    card_id : int
+        The ID of the card
+    led_id : int
+        The ID of the first card of the turn
+    highest_id : int
+        The ID of the highest card (Rechter)
+
+    Returns
+    -------
+    int : The strength of the card (0 if it can not win the turn)
+    """
+    if card_id == highest_id:
+        return RANK_HIGHEST
+    if CARD_NUMBERS[card_id] == CARD_NUMBERS[highest_id]:
+        return RANK_NUMBER
+    if CARD_COLORS[card_id] == CARD_COLORS[highest_id]:
+        return RANK_COLOR + CARD_NUMBERS[card_id]
+    if CARD_COLORS[card_id] == CARD_COLORS[led_id]:
+        return RANK_LED + CARD_NUMBERS[card_id]
+    return 0
+
+
+# The strength of every card for every highest and first card:
+# TRICK_RANKS[(highest_id * CARD_AMOUNT + led_id) * CARD_AMOUNT + card_id]
+TRICK_RANKS = tuple(
+    trick_rank(card, led, highest)
+    for highest in range(CARD_AMOUNT)
+    for led in range(CARD_AMOUNT)
+    for card in range(CARD_AMOUNT)
+)
+
+
+def mask_ids(mask: int) -> list[int]:
+    """
+    Get the IDs of the cards in a hand mask
+
+    Parameters
+    ----------
+    mask : int
+        The hand (bit i is set if the hand contains the card with the ID i)
+
+    Returns
+    -------
+    list[int] : The IDs of the cards (ascending)
+    """
+    ids = []
+    while mask:
+        lowest = mask & -mask
+        ids.append(lowest.bit_length() - 1)
+        mask ^= lowest
+    return ids
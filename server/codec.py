@@ -0,0 +1,340 @@
+import json
+import struct
+from typing import Any
+
+# The same module is used by the client (client/codec.py), keep both copies equal
+
+JSON = "json"
+BINARY = "binary"
+
+OPCODES = {
+    "PLAY_CARD": 1,
+    "PLAYER_TURN": 2,
+    "UPDATE_TURN": 3,
+    "TURN_WINNER": 4,
+    "NEW_CARD": 5,
+    "HIGHEST": 6
+}
+COMMANDS = {opcode: command for command, opcode in OPCODES.items()}
+
+# Commands of clients with the "delta" feature: opcode, opcode of the command, the named field, seq, changes
+DELTA_OPCODE = 7
+DELTA_FIELDS = {"UPDATE_TURN": "last_played", "TURN_WINNER": "winner"}
+
+# The commands the client sends have the name of the client in "from", the others in "to"
+CLIENT_COMMANDS = {"PLAY_CARD"}
+
+TEAM_STATS = struct.Struct(">HBB")
+SEQ = struct.Struct(">I")
+INT_VALUE = struct.Struct(">i")
+
+
+def negotiate_codec(offered: list[str] | None) -> str:
+    """
+    Choose the codec for a connection from the codecs the client offered at the login
+
+    Parameters
+    ----------
+    offered : list[str] | None
+        The "codecs" of the login credentials (None for old clients)
+
+    Returns
+    -------
+    str : BINARY if the client supports it, else JSON
+    """
+    if offered and BINARY in offered:
+        return BINARY
+    return JSON
+
+
+def is_binary(data: bytes) -> bool:
+    """
+    Check if the data of a frame is a binary command
+    (a json command always starts with '{')
+
+    Parameters
+    ----------
+    data : bytes
+        The data of the frame
+
+    Returns
+    -------
+    bool : If the frame has to be decoded with decode_binary
+    """
+    return bool(data) and (data[0] in COMMANDS or data[0] == DELTA_OPCODE)
+
+
+def encode_binary(command: str, data: dict[str, Any]) -> bytes | None:
+    """
+    Encode a hot command to its compact binary representation
+
+    Layout: 1 byte opcode, then the fields of the command (see Commands.md),
+    card ids are one byte, names are one byte length + utf-8
+
+    Parameters
+    ----------
+    command : str
+        The name of the command
+    data : dict[str, any]
+        The additional data of the command (without "to"/"from")
+
+    Returns
+    -------
+    bytes : The binary command
+    None : The command has no binary representation (has to be sent as json)
+    """
+    opcode = OPCODES.get(command)
+    if opcode is None:
+        return None
+    try:
+        match command:
+            case "PLAY_CARD" if data.keys() == {"card"}:
+                return bytes((opcode, data["card"]))
+            case "HIGHEST" if data.keys() == {"highest"}:
+                return bytes((opcode, data["highest"]))
+            case "PLAYER_TURN" if data.keys() == {"available"}:
+                return _encode_cards(opcode, data["available"])
+            case "NEW_CARD" if data.keys() == {"cards"}:
+                return _encode_cards(opcode, data["cards"])
+            case "UPDATE_TURN" if data.keys() == {"played", "last_played"}:
+                return _encode_cards(opcode, data["played"]) + _encode_name(data["last_played"])
+            case "TURN_WINNER" if data.keys() == {"winner", "team1", "team2"}:
+                return (bytes((opcode,)) + _encode_name(data["winner"])
+                        + _encode_team(data["team1"]) + _encode_team(data["team2"]))
+            case "UPDATE_TURN" | "TURN_WINNER" if data.keys() == {DELTA_FIELDS[command], "seq", "changes"}:
+                return (bytes((DELTA_OPCODE, opcode)) + _encode_name(data[DELTA_FIELDS[command]])
+                        + SEQ.pack(data["seq"]) + _encode_changes(data["changes"]))
+    except (ValueError, TypeError, KeyError, struct.error):
+        # Values out of range for the binary layout are sent as json
+        return None
+    return None
+
+
+def decode_binary(data: bytes, name: str) -> dict[str, Any]:
+    """
+    Decode a binary command to the same dict the json command would be
+    (a frame that does not match the layout of its opcode raises a ValueError)
+
+    Parameters
+    ----------
+    data : bytes
+        The binary command
+    name : str
+        The name of the client on the other side of the connection ("to"/"from")
+
+    Returns
+    -------
+    dict[str, any] : The command
+    """
+    try:
+        result, pos = _decode_binary(data, name)
+    except (IndexError, KeyError, struct.error, UnicodeDecodeError):
+        raise ValueError("malformed binary frame") from None
+    if pos != len(data):
+        raise ValueError("malformed binary frame")
+    return result
+
+
+def _decode_binary(data: bytes, name: str) -> tuple[dict[str, Any], int]:
+    # The command and the position after its last field, a missing byte raises IndexError, an unknown opcode KeyError
+    if data[0] == DELTA_OPCODE:
+        command = COMMANDS[data[1]]
+        result: dict[str, Any] = {"command": command, "to": name}
+        result[DELTA_FIELDS[command]], pos = _decode_name(data, 2)
+        result["seq"], = SEQ.unpack_from(data, pos)
+        result["changes"], pos = _decode_changes(data, pos + SEQ.size)
+        return result, pos
+
+    command = COMMANDS[data[0]]
+    result = {"command": command,
+              "from" if command in CLIENT_COMMANDS else "to": name}
+    match command:
+        case "PLAY_CARD":
+            result["card"] = data[1]
+            pos = 2
+        case "HIGHEST":
+            result["highest"] = data[1]
+            pos = 2
+        case "PLAYER_TURN":
+            result["available"], pos = _decode_cards(data, 1)
+        case "NEW_CARD":
+            result["cards"], pos = _decode_cards(data, 1)
+        case "UPDATE_TURN":
+            result["played"], pos = _decode_cards(data, 1)
+            result["last_played"], pos = _decode_name(data, pos)
+        case _:
+            result["winner"], pos = _decode_name(data, 1)
+            result["team1"], pos = _decode_team(data, pos)
+            result["team2"], pos = _decode_team(data, pos)
+    return result, pos
+
+
+def decode(data: bytes, name: str, encoding: str = "utf-8") -> dict[str, Any]:
+    """
+    Decode the data of a frame, no matter which codec was used
+
+    Parameters
+    ----------
+    data : bytes
+        The data of the frame
+    name : str
+        The name of the client on the other side of the connection
+    encoding : str (default: "utf-8")
+        The encoding of json commands
+
+    Returns
+    -------
+    dict[str, any] : The command
+    """
+    if is_binary(data):
+        return decode_binary(data, name)
+    return json.loads(data.decode(encoding))
+
+
+def decode_command(data: bytes, client: str, codec: str, encoding: str = "utf-8") -> dict[str, Any]:
+    """
+    Decode a frame a client sent to the server
+    (the sender is always the client of the connection, a "from" in a json command is overwritten,
+    binary commands are only accepted from clients that negotiated the binary codec)
+
+    Parameters
+    ----------
+    data : bytes
+        The data of the frame
+    client : str
+        The name of the client that sent the frame
+    codec : str
+        The codec negotiated at the login of the client
+    encoding : str (default: "utf-8")
+        The encoding of json commands
+
+    Returns
+    -------
+    dict[str, any] : The command
+    """
+    if codec != BINARY and is_binary(data):
+        raise ValueError(f"{client} sent a binary command without the binary codec")
+    command = decode(data, client, encoding)
+    if not isinstance(command, dict):
+        raise ValueError(f"{client} sent a command that is not an object")
+    command["from"] = client
+    return command
+
+
+def _encode_cards(opcode: int, cards: list[int]) -> bytes:
+    return bytes((opcode, len(cards), *cards))
+
+
+def _encode_name(name: str) -> bytes:
+    encoded = name.encode("utf-8")
+    return bytes((len(encoded),)) + encoded
+
+
+def _decode_name(data: bytes, pos: int) -> tuple[str, int]:
+    end = pos + 1 + data[pos]
+    if end > len(data):
+        raise IndexError("name out of the frame")
+    return data[pos + 1:end].decode("utf-8"), end
+
+
+def _decode_cards(data: bytes, pos: int) -> tuple[list[int], int]:
+    end = pos + 1 + data[pos]
+    if end > len(data):
+        raise IndexError("cards out of the frame")
+    return list(data[pos + 1:end]), end
+
+
+def _encode_team(team: dict[str, Any]) -> bytes:
+    if team.keys() != {"player", "rounds", "points", "turns"}:
+        raise KeyError("Unknown team attributes")
+    players = team["player"]
+    return (bytes((len(players),)) + b"".join(map(_encode_name, players))
+            + TEAM_STATS.pack(team["rounds"], team["points"], team["turns"]))
+
+
+def _decode_team(data: bytes, pos: int) -> tuple[dict[str, Any], int]:
+    players = []
+    count = data[pos]
+    pos += 1
+    for i in range(count):
+        player, pos = _decode_name(data, pos)
+        players.append(player)
+    rounds, points, turns = TEAM_STATS.unpack_from(data, pos)
+    return {"player": players, "rounds": rounds, "points": points, "turns": turns}, pos + TEAM_STATS.size
+
+
+def _encode_changes(changes: dict[str, Any]) -> bytes:
+    # Every change: key, type (0: int, 1: list of cards, 2: list of names), value
+    parts = [bytes((len(changes),))]
+    for key, value in changes.items():
+        parts.append(_encode_name(key))
+        if isinstance(value, int):
+            parts.append(b"\x00" + INT_VALUE.pack(value))
+        elif isinstance(value, list) and all(isinstance(item, int) for item in value):
+            parts.append(b"\x01" + bytes((len(value), *value)))
+        elif isinstance(value, list) and all(isinstance(item, str) for item in value):
+            parts.append(b"\x02" + bytes((len(value),)) + b"".join(map(_encode_name, value)))
+        else:
+            raise TypeError(f"{key} can not be encoded binary")
+    return b"".join(parts)
+
+
+def _decode_changes(data: bytes, pos: int) -> tuple[dict[str, Any], int]:
+    changes = {}
+    count = data[pos]
+    pos += 1
+    for i in range(count):
+        key, pos = _decode_name(data, pos)
+        kind = data[pos]
+        pos += 1
+        if kind == 0:
+            changes[key], = INT_VALUE.unpack_from(data, pos)
+            pos += INT_VALUE.size
+        elif kind == 1:
+            changes[key], pos = _decode_cards(data, pos)
+        elif kind == 2:
+            names = []
+            amount = data[pos]
+            pos += 1
+            for j in range(amount):
+                value, pos = _decode_name(data, pos)
+                names.append(value)
+            changes[key] = names
+        else:
+            raise KeyError(f"Unknown type of change {kind}")
+    return changes, pos
+
+
+if __name__ == '__main__':
+    import timeit
+
+    # Encode/decode micro-benchmarks of the binary codec against the json path
+    team1 = {"player": ["Marcel", "Daniel"], "rounds": 1, "points": 4, "turns": 2}
+    team2 = {"player": ["Thomas", "Christoph"], "rounds": 0, "points": 6, "turns": 1}
+    samples = {
+        "PLAY_CARD": {"card": 17},
+        "PLAYER_TURN": {"available": [3, 17, 25, 30, 32]},
+        "UPDATE_TURN": {"played": [3, 17, 25], "last_played": "Marcel"},
+        "TURN_WINNER": {"winner": "Marcel", "team1": team1, "team2": team2},
+        "UPDATE_TURN (delta)": {"last_played": "Marcel", "seq": 42, "changes": {"played+": [25]}},
+        "TURN_WINNER (delta)": {"winner": "Marcel", "seq": 43, "changes": {"team1.turns": 3, "played": []}},
+        "NEW_CARD": {"cards": [3, 17, 25, 30, 32]},
+        "HIGHEST": {"highest": 12}
+    }
+    AMOUNT = 200_000
+    print(f"{'command':<20} {'json B':>6} {'bin B':>6} {'json enc':>9} {'bin enc':>9} {'json dec':>9} {'bin dec':>9} (us)")
+    for name, sample in samples.items():
+        command = name.split()[0]
+        key = "from" if command in CLIENT_COMMANDS else "to"
+        full = {"command": command, key: "Marcel", **sample}
+        json_data = json.dumps(full).encode()
+        binary_data = encode_binary(command, sample)
+        assert decode(binary_data, "Marcel") == json.loads(json_data)
+
+        json_enc = timeit.timeit(lambda: json.dumps({"command": command, key: "Marcel", **sample}).encode(), number=AMOUNT)
+        bin_enc = timeit.timeit(lambda: encode_binary(command, sample), number=AMOUNT)
+        json_dec = timeit.timeit(lambda: decode(json_data, "Marcel"), number=AMOUNT)
+        bin_dec = timeit.timeit(lambda: decode(binary_data, "Marcel"), number=AMOUNT)
+        print(f"{name:<20} {len(json_data):>6} {len(binary_data):>6} "
+              f"{json_enc / AMOUNT * 1e6:>9.2f} {bin_enc / AMOUNT * 1e6:>9.2f} "
+              f"{json_dec / AMOUNT * 1e6:>9.2f} {bin_dec / AMOUNT * 1e6:>9.2f}")
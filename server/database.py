@@ -1,40 +1,561 @@
+import os
+import math
 import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Iterable, Iterator
+
 import bcrypt
 
+# Every version of the schema, a database is migrated from its user_version to the last one
+MIGRATIONS: list[tuple[str, ...]] = [
+    # 1: the accounts
+    ("""
+    CREATE TABLE IF NOT EXISTS accounts (
+        id INTEGER PRIMARY KEY,
+        username VARCHAR(255) NOT NULL,
+        password VARCHAR(255) NOT NULL,
+        email VARCHAR(255) NOT NULL)
+    """,),
+    # 2: unique usernames, a login looks the name up in the index instead of scanning the table
+    # (older databases could hold a name twice, see MIGRATION_CHECKS)
+    ("CREATE UNIQUE INDEX IF NOT EXISTS accounts_username ON accounts (username)",),
+    # 3: the history of the games (written behind the game loop, see history.HistoryWriter)
+    ("""
+    CREATE TABLE IF NOT EXISTS games (
+        id INTEGER PRIMARY KEY,
+        table_number INTEGER NOT NULL,
+        started REAL NOT NULL,
+        ended REAL)
+    """, """
+    CREATE TABLE IF NOT EXISTS game_players (
+        game INTEGER NOT NULL REFERENCES games (id),
+        seat INTEGER NOT NULL,
+        team INTEGER NOT NULL,
+        username VARCHAR(255) NOT NULL,
+        PRIMARY KEY (game, seat)) WITHOUT ROWID
+    """,
+     "CREATE INDEX IF NOT EXISTS game_players_username ON game_players (username)",
+     """
+    CREATE TABLE IF NOT EXISTS rounds (
+        game INTEGER NOT NULL REFERENCES games (id),
+        number INTEGER NOT NULL,
+        winner INTEGER NOT NULL,
+        team1_points INTEGER NOT NULL,
+        team2_points INTEGER NOT NULL,
+        finished REAL NOT NULL,
+        PRIMARY KEY (game, number)) WITHOUT ROWID
+    """, """
+    CREATE TABLE IF NOT EXISTS points (
+        game INTEGER NOT NULL REFERENCES games (id),
+        round INTEGER NOT NULL,
+        number INTEGER NOT NULL,
+        winner INTEGER NOT NULL,
+        team1_turns INTEGER NOT NULL,
+        team2_turns INTEGER NOT NULL,
+        team1_points INTEGER NOT NULL,
+        team2_points INTEGER NOT NULL,
+        PRIMARY KEY (game, round, number)) WITHOUT ROWID
+    """, """
+    CREATE TABLE IF NOT EXISTS tricks (
+        game INTEGER NOT NULL REFERENCES games (id),
+        round INTEGER NOT NULL,
+        point INTEGER NOT NULL,
+        number INTEGER NOT NULL,
+        leader VARCHAR(255) NOT NULL,
+        winner VARCHAR(255) NOT NULL,
+        cards BLOB NOT NULL,
+        PRIMARY KEY (game, round, point, number)) WITHOUT ROWID
+    """),
+    # 4: the ratings, updated with every finished round (see rate_round)
+    ("""
+    CREATE TABLE IF NOT EXISTS ratings (
+        username VARCHAR(255) PRIMARY KEY,
+        rating REAL NOT NULL,
+        rounds INTEGER NOT NULL,
+        wins INTEGER NOT NULL) WITHOUT ROWID
+    """,
+     "CREATE INDEX IF NOT EXISTS ratings_rating ON ratings (rating)",
+     # How many players have a rating in [bucket, bucket + 1), the rank of a player sums the buckets above
+     "CREATE TABLE IF NOT EXISTS rating_buckets (bucket INTEGER PRIMARY KEY, players INTEGER NOT NULL)",
+     # The best LEADERBOARD_SIZE players, rebuilt when a rating in it (or above its last one) changed
+     """
+    CREATE TABLE IF NOT EXISTS leaderboard (
+        position INTEGER PRIMARY KEY,
+        rank INTEGER NOT NULL,
+        username VARCHAR(255) NOT NULL,
+        rating REAL NOT NULL)
+    """,
+     # Raised with every change of the ratings / of the leaderboard (the caches of every process compare them)
+     "CREATE TABLE IF NOT EXISTS rating_versions (id INTEGER PRIMARY KEY, ratings INTEGER NOT NULL, leaderboard INTEGER NOT NULL)",
+     "INSERT OR IGNORE INTO rating_versions VALUES (1, 0, 0)"),
+]
+
+# Rows that stop a migration (version before the migration -> query, problem), nothing is changed or deleted,
+# the database has to be fixed by hand and the server started again
+MIGRATION_CHECKS: dict[int, tuple[str, str]] = {
+    1: ("SELECT username, COUNT(*) FROM accounts GROUP BY username HAVING COUNT(*) > 1 ORDER BY username",
+        "usernames with more than one account (rename or delete the newer accounts, the login always used the oldest one)"),
+}
+
+# Set on every new connection: readers do not block the writer (WAL), a commit does not wait for the disk
+# (the last commits are only lost if the machine crashes), 16MB page cache, memory mapped reads
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -16000",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA mmap_size = 268435456",
+    "PRAGMA busy_timeout = 5000",
+)
+
+# The statements are constant strings, so sqlite3 reuses the prepared statement of every connection
+SELECT_PASSWORD = "SELECT password FROM accounts WHERE username = ?"
+INSERT_ACCOUNT = "INSERT INTO accounts (email, username, password) VALUES (?, ?, ?)"
+INSERT_ACCOUNTS = "INSERT OR IGNORE INTO accounts (email, username, password) VALUES (?, ?, ?)"
+INSERT_GAME = "INSERT INTO games (table_number, started) VALUES (?, ?)"
+INSERT_GAME_PLAYER = "INSERT INTO game_players (game, seat, team, username) VALUES (?, ?, ?, ?)"
+INSERT_ROUND = "INSERT INTO rounds VALUES (?, ?, ?, ?, ?, ?)"
+INSERT_POINT = "INSERT INTO points VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+INSERT_TRICK = "INSERT INTO tricks VALUES (?, ?, ?, ?, ?, ?, ?)"
+UPDATE_GAME_ENDED = "UPDATE games SET ended = ? WHERE id = ?"
+SELECT_RATING = "SELECT rating, rounds, wins FROM ratings WHERE username = ?"
+UPSERT_RATING = ("INSERT INTO ratings VALUES (?, ?, 1, ?) "
+                 "ON CONFLICT (username) DO UPDATE SET rating = excluded.rating, rounds = rounds + 1, wins = wins + excluded.wins")
+ADD_TO_BUCKET = ("INSERT INTO rating_buckets VALUES (?, ?) "
+                 "ON CONFLICT (bucket) DO UPDATE SET players = players + excluded.players")
+SELECT_PLAYERS_ABOVE = "SELECT COALESCE(SUM(players), 0) FROM rating_buckets WHERE bucket > ?"
+SELECT_BUCKET_ABOVE = "SELECT COUNT(*) FROM ratings WHERE rating > ? AND rating < ?"
+SELECT_LEADERBOARD = "SELECT rank, username, rating FROM leaderboard ORDER BY position"
+SELECT_LEADERBOARD_LAST = "SELECT COUNT(*), MIN(rating) FROM leaderboard"
+# Only the best players are read (from the end of the index), players with the same rating share the rank
+FILL_LEADERBOARD = ("INSERT INTO leaderboard SELECT ROW_NUMBER() OVER best, RANK() OVER best, username, rating "
+                    "FROM (SELECT username, rating FROM ratings ORDER BY rating DESC LIMIT ?) WINDOW best AS (ORDER BY rating DESC)")
+SELECT_RATING_VERSIONS = "SELECT ratings, leaderboard FROM rating_versions WHERE id = 1"
+UPDATE_RATING_VERSIONS = "UPDATE rating_versions SET ratings = ratings + 1, leaderboard = leaderboard + ? WHERE id = 1"
+
+# Elo: the rating of a new player, how many points a round moves at most, the size of the leaderboard
+START_RATING = 1500.0
+K_FACTOR = 32.0
+LEADERBOARD_SIZE = 100
+STATEMENT_CACHE = 256
+
+# The bots are named "Bot#<number>", no account may contain "#", so a bot never has the name of a player
+BOT_PREFIX = "Bot#"
+MAX_USERNAME = 32
+
+
+def valid_username(username: str) -> bool:
+    """
+    Check if a name may be used by an account (registration and login)
+
+    Parameters
+    ----------
+    username : str
+        The name of the user
+
+    Returns
+    -------
+    bool : If the name is 1-32 printable characters without surrounding spaces and without "#" (reserved for the bots)
+    """
+    return (isinstance(username, str) and 0 < len(username) <= MAX_USERNAME and username.isprintable()
+            and username == username.strip() and "#" not in username)
+
+
+def elo_change(winner: float, loser: float, k: float = K_FACTOR) -> float:
+    """
+    The points the winner of a round gains (and the loser loses)
+
+    Parameters
+    ----------
+    winner : float
+        The rating of the winning team
+    loser : float
+        The rating of the losing team
+    k : float (default: K_FACTOR)
+        The most points a round moves a rating
+
+    Returns
+    -------
+    float : The change of the ratings
+    """
+    expected = 1 / (1 + 10 ** ((loser - winner) / 400))
+    return k * (1 - expected)
+
+
 class Database:
-    def __init__(self):
-        self.conn = sqlite3.connect("watten_py.db")
-        self.c = self.conn.cursor()
-
-        self.c.execute("""
-        CREATE TABLE IF NOT EXISTS accounts (
-            id INTEGER PRIMARY KEY,
-            username VARCHAR(255) NOT NULL,
-            password VARCHAR(255) NOT NULL,
-            email VARCHAR(255) NOT NULL)
-        """)
-
-    def register_user(self, email, username, password):
-        self.c.execute("INSERT INTO accounts (email, username, password) VALUES (?, ?, ?)", (email, username, password))
-        self.conn.commit()
-    
-    def verify_user(self, username:str, password:str):
-        self.c.execute("SELECT password FROM accounts WHERE username = ?", (username,))
-        db_entry = self.c.fetchone()
-        if db_entry:
-            db_password = db_entry[0]
-            successful_login = bcrypt.checkpw(password.encode(), db_password)
-            return successful_login
-        else:
+    """
+    A class to store the accounts (and everything else the server keeps) in SQLite
+
+    Every thread (and every forked process) gets its own connection on first use,
+    the connections are opened in autocommit mode, several writes are grouped with transaction().
+    The schema is migrated to the newest version when the database is opened.
+
+    ...
+
+    Attributes
+    ----------
+    path : str
+        The file of the database
+
+    Methods
+    -------
+    connection() -> sqlite3.Connection
+        The connection of the calling thread
+    transaction(immediate: bool = False) -> Iterator[sqlite3.Connection]
+        Run the statements of the with block in one transaction
+    migrate() -> int
+        Bring the schema to the newest version
+    register_user(email: str, username: str, password: bytes) -> bool
+        Add a new account
+    register_users(accounts: Iterable[tuple[str, str, bytes]]) -> int
+        Add many accounts in one transaction
+    password_hash(username: str) -> bytes | None
+        Look up the password hash of a user
+    verify_user(username: str, password: str) -> bool
+        Check the password of a user (blocking, see login_pool for the servers)
+    add_game(table: int, started: float, players: list[tuple[int, str]]) -> int
+        Add a new game and its players (inside a transaction)
+    add_history(rounds: list[tuple], points: list[tuple], tricks: list[tuple], ended: list[tuple[float, int]]) -> None
+        Add finished rounds, points and tricks and mark ended games (inside a transaction)
+    rate_round(winners: list[str], losers: list[str], k: float = K_FACTOR) -> bool
+        Update the ratings of the players of a finished round (inside a transaction)
+    player_rank(username: str) -> tuple[int, float, int, int] | None
+        Look up the rank, rating, rounds and won rounds of a player
+    leaderboard() -> list[tuple[int, str, float]]
+        The rank, name and rating of the best players
+    rating_versions() -> tuple[int, int]
+        How often the ratings and the leaderboard changed
+    close() -> None
+        Close every connection
+    """
+    def __init__(self, path: str = "watten_py.db"):
+        """
+        Open the database and migrate it to the newest schema
+
+        Parameters
+        ----------
+        path : str (default: "watten_py.db")
+            The file of the database
+        """
+        self.path = path
+        self._local = threading.local()
+        self._connections: list[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self.migrate()
+
+    def connection(self) -> sqlite3.Connection:
+        """
+        The connection of the calling thread (opened on the first call)
+
+        Returns
+        -------
+        sqlite3.Connection : The connection
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+
+        # A connection must neither be used by another thread nor by a forked process
+        # (only close() touches the connections of other threads)
+        conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False, cached_statements=STATEMENT_CACHE)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        with self._lock:
+            self._connections.append(conn)
+        return conn
+
+    @contextmanager
+    def transaction(self, immediate: bool = False) -> Iterator[sqlite3.Connection]:
+        """
+        Run the statements of the with block in one transaction (rolled back if the block raises)
+
+        Parameters
+        ----------
+        immediate : bool (default: False)
+            Take the write lock at the start (for read-then-write blocks)
+
+        Returns
+        -------
+        Iterator[sqlite3.Connection] : The connection of the calling thread
+        """
+        conn = self.connection()
+        conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def migrate(self) -> int:
+        """
+        Bring the schema to the newest version (every missing migration runs in its own transaction)
+        (raises sqlite3.IntegrityError if the data does not allow a migration, see MIGRATION_CHECKS)
+
+        Returns
+        -------
+        int : The version of the schema
+        """
+        while True:
+            # Several processes may open the database at once, the write lock decides who migrates
+            with self.transaction(immediate=True) as conn:
+                version = conn.execute("PRAGMA user_version").fetchone()[0]
+                if version >= len(MIGRATIONS):
+                    return version
+                if version in MIGRATION_CHECKS:
+                    query, problem = MIGRATION_CHECKS[version]
+                    rows = conn.execute(query).fetchall()
+                    if rows:
+                        found = ", ".join(" x".join(map(str, row)) for row in rows[:20])
+                        raise sqlite3.IntegrityError(f"{self.path} can not be migrated to version {version + 1}, "
+                                                     f"{len(rows)} {problem}: {found}{', ...' if len(rows) > 20 else ''}")
+                for statement in MIGRATIONS[version]:
+                    conn.execute(statement)
+                conn.execute(f"PRAGMA user_version = {version + 1}")
+
+    def register_user(self, email: str, username: str, password: bytes) -> bool:
+        """
+        Add a new account
+
+        Parameters
+        ----------
+        email : str
+            The email address of the user
+        username : str
+            The name of the user
+        password : bytes
+            The bcrypt hash of the password
+
+        Returns
+        -------
+        bool : If the account was added (False: the name is taken or not allowed, see valid_username)
+        """
+        if not valid_username(username):
             return False
+        try:
+            self.connection().execute(INSERT_ACCOUNT, (email, username, password))
+        except sqlite3.IntegrityError:
+            return False
+        return True
+
+    def register_users(self, accounts: Iterable[tuple[str, str, bytes]]) -> int:
+        """
+        Add many accounts in one transaction (names that are taken or not allowed are skipped)
+
+        Parameters
+        ----------
+        accounts : Iterable[tuple[str, str, bytes]]
+            The email, name and password hash of every account
+
+        Returns
+        -------
+        int : The amount of added accounts
+        """
+        with self.transaction() as conn:
+            return conn.executemany(INSERT_ACCOUNTS, (account for account in accounts if valid_username(account[1]))).rowcount
+
+    def password_hash(self, username: str) -> bytes | None:
+        """
+        Look up the password hash of a user (only the lookup, the slow bcrypt check is done by the caller)
+
+        Parameters
+        ----------
+        username : str
+            The name of the user
+
+        Returns
+        -------
+        bytes | None : The bcrypt hash (None: there is no such user)
+        """
+        db_entry = self.connection().execute(SELECT_PASSWORD, (username,)).fetchone()
+        return db_entry[0] if db_entry else None
+
+    def verify_user(self, username: str, password: str) -> bool:
+        """
+        Check the password of a user (blocking, see login_pool for the servers)
+
+        Parameters
+        ----------
+        username : str
+            The name of the user
+        password : str
+            The password the client sent
+
+        Returns
+        -------
+        bool : If the password is correct
+        """
+        db_password = self.password_hash(username)
+        if db_password:
+            return bcrypt.checkpw(password.encode(), db_password)
+        return False
+
+    def add_game(self, table: int, started: float, players: list[tuple[int, str]]) -> int:
+        """
+        Add a new game and its players (call it inside transaction(), together with the rest of the batch)
+
+        Parameters
+        ----------
+        table : int
+            The number of the table in the server
+        started : float
+            The unix time the game started
+        players : list[tuple[int, str]]
+            The team (1 or 2) and the name of every player in the order they were seated
+
+        Returns
+        -------
+        int : The id of the game
+        """
+        conn = self.connection()
+        game = conn.execute(INSERT_GAME, (table, started)).lastrowid
+        conn.executemany(INSERT_GAME_PLAYER, [(game, seat, team, name) for seat, (team, name) in enumerate(players)])
+        return game
+
+    def add_history(self, rounds: list[tuple], points: list[tuple], tricks: list[tuple],
+                    ended: list[tuple[float, int]]) -> None:
+        """
+        Add finished rounds, points and tricks and mark ended games (call it inside transaction())
+
+        Parameters
+        ----------
+        rounds : list[tuple]
+            game, number, winning team, points of team1 and team2, unix time it finished
+        points : list[tuple]
+            game, round, number, winning team, turns of team1 and team2, points of team1 and team2 afterwards
+        tricks : list[tuple]
+            game, round, point, number, the player that played first, the winner, the played cards (ids in playing order)
+        ended : list[tuple[float, int]]
+            The unix time every game ended and its id
+
+        Returns
+        -------
+        None
+        """
+        conn = self.connection()
+        conn.executemany(INSERT_ROUND, rounds)
+        conn.executemany(INSERT_POINT, points)
+        conn.executemany(INSERT_TRICK, tricks)
+        conn.executemany(UPDATE_GAME_ENDED, ended)
+
+    def rate_round(self, winners: list[str], losers: list[str], k: float = K_FACTOR) -> bool:
+        """
+        Update the ratings of the players of a finished round (call it inside transaction(), the ratings are read
+        and written in the same transaction, so rounds finished in other processes are not lost)
+
+        Elo with the mean rating of each team, every player of a team gains or loses the same amount.
+        The rating buckets are moved along and the leaderboard is rebuilt if one of the players is or was in it.
+
+        Parameters
+        ----------
+        winners : list[str]
+            The players of the team that won the round
+        losers : list[str]
+            The players of the other team
+        k : float (default: K_FACTOR)
+            The most points a round moves a rating
+
+        Returns
+        -------
+        bool : If the leaderboard changed
+        """
+        conn = self.connection()
+        old: dict[str, float | None] = {}
+        for name in winners + losers:
+            row = conn.execute(SELECT_RATING, (name,)).fetchone()
+            old[name] = row[0] if row else None
+
+        def team_rating(team: list[str]) -> float:
+            return sum(START_RATING if old[name] is None else old[name] for name in team) / len(team)
+
+        gain = elo_change(team_rating(winners), team_rating(losers), k)
+        count, last = conn.execute(SELECT_LEADERBOARD_LAST).fetchone()
+        threshold = last if count >= LEADERBOARD_SIZE else float("-inf")
+        changed = False
+        for names, change, won in ((winners, gain, 1), (losers, -gain, 0)):
+            for name in names:
+                rating = (START_RATING if old[name] is None else old[name]) + change
+                conn.execute(UPSERT_RATING, (name, rating, won))
+                if old[name] is not None:
+                    conn.execute(ADD_TO_BUCKET, (math.floor(old[name]), -1))
+                conn.execute(ADD_TO_BUCKET, (math.floor(rating), 1))
+                changed |= rating >= threshold or (old[name] is not None and old[name] >= threshold)
+
+        if changed:
+            conn.execute("DELETE FROM leaderboard")
+            conn.execute(FILL_LEADERBOARD, (LEADERBOARD_SIZE,))
+        conn.execute(UPDATE_RATING_VERSIONS, (int(changed),))
+        return changed
+
+    def player_rank(self, username: str) -> tuple[int, float, int, int] | None:
+        """
+        Look up the rank, rating, rounds and won rounds of a player
+        (players with the same rating share the rank)
+
+        Parameters
+        ----------
+        username : str
+            The name of the player
+
+        Returns
+        -------
+        tuple[int, float, int, int] | None : The rank, rating, rounds and won rounds (None: the player has no rating yet)
+        """
+        conn = self.connection()
+        row = conn.execute(SELECT_RATING, (username,)).fetchone()
+        if row is None:
+            return None
+        rating, rounds, wins = row
+        bucket = math.floor(rating)
+        above = conn.execute(SELECT_PLAYERS_ABOVE, (bucket,)).fetchone()[0]
+        above += conn.execute(SELECT_BUCKET_ABOVE, (rating, bucket + 1)).fetchone()[0]
+        return above + 1, rating, rounds, wins
+
+    def leaderboard(self) -> list[tuple[int, str, float]]:
+        """
+        The rank, name and rating of the best players (at most LEADERBOARD_SIZE)
+
+        Returns
+        -------
+        list[tuple[int, str, float]] : The players, the best first
+        """
+        return self.connection().execute(SELECT_LEADERBOARD).fetchall()
+
+    def rating_versions(self) -> tuple[int, int]:
+        """
+        How often the ratings and the leaderboard changed (to check if a cache is still valid)
+
+        Returns
+        -------
+        tuple[int, int] : The version of the ratings and of the leaderboard
+        """
+        return self.connection().execute(SELECT_RATING_VERSIONS).fetchone()
+
+    def close(self) -> None:
+        """
+        Close every connection (the threads open new ones when they use the database again)
+
+        Returns
+        -------
+        None
+        """
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
 
 
 if __name__ == "__main__":
     db = Database()
-    
-    db.register_user("admin@admin", "admin", bcrypt.hashpw("admin".encode(), bcrypt.gensalt()))
 
-    db.register_user("none", "Marcel", bcrypt.hashpw("toasttoast1".encode(), bcrypt.gensalt()))
-    db.register_user("none", "Thomas", bcrypt.hashpw("toasttoast2".encode(), bcrypt.gensalt()))
-    db.register_user("none", "Daniel", bcrypt.hashpw("toasttoast3".encode(), bcrypt.gensalt()))
-    db.register_user("none", "Christoph", bcrypt.hashpw("toasttoast4".encode(), bcrypt.gensalt()))
\ No newline at end of file
+    db.register_users([
+        ("admin@admin", "admin", bcrypt.hashpw("admin".encode(), bcrypt.gensalt())),
+        ("none", "Marcel", bcrypt.hashpw("toasttoast1".encode(), bcrypt.gensalt())),
+        ("none", "Thomas", bcrypt.hashpw("toasttoast2".encode(), bcrypt.gensalt())),
+        ("none", "Daniel", bcrypt.hashpw("toasttoast3".encode(), bcrypt.gensalt())),
+        ("none", "Christoph", bcrypt.hashpw("toasttoast4".encode(), bcrypt.gensalt()))
+    ])
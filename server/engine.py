@@ -0,0 +1,371 @@
+import random
+import time
+from typing import Callable, Any
+
+from models import GameData, CardBase, CardDek, PlayerData
+from models.cards import ALL_CARDS
+from cards_utils import CARD_AMOUNT, CARD_MASKS, mask_ids
+from server_utils import check_available_mask, check_winner
+
+# The engine waits for the cards to be dealt / for the current player to play a card
+DEAL = "deal"
+PLAY = "play"
+
+TRICKS = 5
+POINTS_TO_WIN = 11
+
+
+class GameEngine:
+    """
+    A class to play Watten without any network (the rules of one table as a state machine)
+
+    The engine only changes its GameData and reports what happened as events,
+    the same commands the server sends to the clients
+    (NEW_CARD, HIGHEST, PLAYER_TURN, UPDATE_TURN, TURN_WINNER, POINT_WINNER, ROUND_WINNER).
+    GameLogic sends the events to the clients, bots and simulations call deal/play directly.
+
+    ...
+
+    Attributes
+    ----------
+    game_data : GameData
+        The state of the table
+    rng : random.Random
+        The random generator of the table (mixing the dek, choosing the start player of a new round)
+    on_event : Callable[[str, dict], Any] | None
+        Is called with every event while the state is changed (None: no events are created)
+    phase : str (default: DEAL)
+        DEAL: the next point has to be dealt, PLAY: the current player has to play a card
+    tricks : int (default: 0)
+        The amount of turns played in the current point
+    round_over : bool (default: False)
+        If the last point finished a round
+    shown : list[str] (default: [])
+        The players the highest card was shown to in the current point (the last and the first player)
+    recorder : PointRecorder | None
+        Records the deals, plays and winners for the replay log (None: nothing is recorded)
+
+    Methods
+    -------
+    seat(players: list[str]) -> None
+        Divide the players into teams (the first player starts)
+    deal(dek: CardDek | None = None) -> None
+        Deal five cards to every player and choose the highest card
+    current_player() -> str
+        The name of the player that has to play a card
+    available() -> list[CardBase]
+        The cards the current player is allowed to play
+    available_mask() -> int
+        The cards the current player is allowed to play as a bit mask
+    play(player: str, card: int) -> None
+        Play a card of the current player and finish the turn, point and round if they are over
+    better_cards() -> None
+        Deal new cards to the first and the last player
+    """
+    def __init__(self, on_event: Callable[[str, dict], Any] | None = None, rng: random.Random | None = None,
+                 game_data: GameData | None = None, recorder: Any = None):
+        """
+        Initialize a new engine
+
+        Parameters
+        ----------
+        on_event : Callable[[str, dict], Any] | None (default: None)
+            Is called with the command and the data of every event (None: events are skipped)
+        rng : random.Random | None (default: None)
+            The random generator (a new one if not given)
+        game_data : GameData | None (default: None)
+            The state to play on (a new one if not given)
+        recorder : PointRecorder | None (default: None)
+            Records the points of the table (see replay_log)
+        """
+        self.game_data: GameData = game_data if game_data is not None else GameData()
+        self.rng: random.Random = rng if rng is not None else random.Random()
+        self.on_event = on_event
+        self.phase: str = DEAL
+        self.tricks: int = 0
+        self.round_over: bool = False
+        self.shown: list[str] = []
+        self.recorder = recorder
+
+    def seat(self, players: list[str]) -> None:
+        """
+        Divide the players into teams (the first and the third player play together)
+
+        Parameters
+        ----------
+        players : list[str]
+            The names of the four players in the order they will play
+
+        Returns
+        -------
+        None
+        """
+        self.game_data.turn_loop = list(players)
+        self.game_data.team1["player"] = [players[0], players[2]]
+        self.game_data.team2["player"] = [players[1], players[3]]
+        for player in players:
+            self.game_data.game_player[player] = PlayerData(player)
+        if self.recorder is not None:
+            self.recorder.seat(players)
+
+    def deal(self, dek: CardDek | None = None) -> None:
+        """
+        Deal five cards to every player (first 3 then 2) and choose the highest card
+
+        Parameters
+        ----------
+        dek : CardDek | None (default: None)
+            The dek to deal from (a new dek mixed with rng if not given)
+
+        Returns
+        -------
+        None
+        """
+        if self.phase != DEAL:
+            raise ValueError("The current point is not finished yet")
+        game_data = self.game_data
+        game_data.card_dek = dek if dek is not None else CardDek.get_mixed_dek(self.rng)
+        players = game_data.game_player
+        loop = game_data.turn_loop
+
+        dealt: dict[str, list[CardBase]] = {player: [] for player in loop}
+        for cards in (3, 2):
+            for player in loop:
+                dealt[player].extend(game_data.card_dek.deal_top_card(cards))
+        for player in loop:
+            players[player].cards = dealt[player]
+
+        # The first card dealt to the last player gives the color, the one of the first player the number
+        game_data.highest = CardBase.new_card(dealt[loop[-1]][0].color, dealt[loop[0]][0].number)
+        game_data.played_cards = []
+        self.phase = PLAY
+        self.tricks = 0
+        self.round_over = False
+        self.shown = [loop[-1], loop[0]]
+
+        if self.recorder is not None:
+            self.recorder.deal(loop, dealt, int(game_data.highest))
+        if self.on_event is not None:
+            for player in loop:
+                self.on_event("NEW_CARD", {"to": player, "cards": list(map(int, dealt[player]))})
+            self.on_event("HIGHEST", {"to": list(self.shown), "highest": int(game_data.highest)})
+            self._offer_turn()
+
+    def current_player(self) -> str:
+        """
+        The name of the player that has to play a card
+
+        Returns
+        -------
+        str : The name of the player
+        """
+        return self.game_data.turn_loop[len(self.game_data.played_cards)]
+
+    def available(self) -> list[CardBase]:
+        """
+        The cards the current player is allowed to play
+
+        Returns
+        -------
+        list[CardBase] : The allowed cards (ordered by their ID)
+        """
+        return [ALL_CARDS[card_id] for card_id in mask_ids(self.available_mask())]
+
+    def available_mask(self) -> int:
+        """
+        The cards the current player is allowed to play as a bit mask
+
+        Returns
+        -------
+        int : The allowed cards (bit i is set if the card with the ID i may be played)
+        """
+        game_data = self.game_data
+        index = len(game_data.played_cards)
+        return check_available_mask(
+            game_data.game_player[game_data.turn_loop[index]].hand,
+            game_data.played_cards,
+            game_data.highest,
+            index in (0, 3)
+        )
+
+    def play(self, player: str, card: int) -> None:
+        """
+        Play a card of the current player and finish the turn, point and round if they are over
+
+        Parameters
+        ----------
+        player : str
+            The name of the player that plays the card
+        card : int
+            The id of the card
+
+        Returns
+        -------
+        None
+        """
+        if self.phase != PLAY or player != self.current_player():
+            raise ValueError(f"It is not the turn of {player}")
+        game_data = self.game_data
+        if not isinstance(card, int) or not 0 <= card < CARD_AMOUNT or not self.available_mask() & CARD_MASKS[card]:
+            raise ValueError(f"{player} is not allowed to play the card {card!r}")
+
+        game_data.game_player[player].hand ^= CARD_MASKS[card]
+        game_data.played_cards.append(ALL_CARDS[card])
+        if self.recorder is not None:
+            self.recorder.play(card)
+        if self.on_event is not None:
+            self.on_event("UPDATE_TURN", {"last_played": player})
+
+        if len(game_data.played_cards) < len(game_data.turn_loop):
+            self._offer_turn()
+            return
+
+        self._finish_turn()
+        self.tricks += 1
+        if self.tricks < TRICKS:
+            self._offer_turn()
+            return
+
+        self._finish_point()
+        if game_data.team1["points"] >= POINTS_TO_WIN or game_data.team2["points"] >= POINTS_TO_WIN:
+            self._finish_round()
+        self.phase = DEAL
+
+    def better_cards(self) -> None:
+        """
+        Deal new cards to the first and the last player
+
+        The players did not like their cards
+
+        Returns
+        -------
+        None
+        """
+        loop = self.game_data.turn_loop
+        for cards in [3, 2]:
+            for player in [loop[0], loop[-1]]:
+                self.game_data.game_player[player].cards = self.game_data.card_dek.deal_top_card(cards)
+
+    def _offer_turn(self) -> None:
+        if self.on_event is not None:
+            self.on_event("PLAYER_TURN", {"to": self.current_player(), "available": mask_ids(self.available_mask())})
+
+    def _finish_turn(self) -> None:
+        # The winner of the turn gets the turn for their team and plays first
+        game_data = self.game_data
+        winner_index = check_winner(game_data.played_cards, game_data.highest)
+        winner = game_data.turn_loop[winner_index]
+        if self.recorder is not None:
+            self.recorder.turn(winner)
+        if winner in game_data.team1["player"]:
+            game_data.team1["turns"] += 1
+        else:
+            game_data.team2["turns"] += 1
+
+        if self.on_event is not None:
+            self.on_event("TURN_WINNER", {"winner": winner})
+        game_data.turn_loop = game_data.turn_loop[winner_index:] + game_data.turn_loop[:winner_index]
+        game_data.played_cards = []
+
+    def _finish_point(self) -> None:
+        # The team with more turns gets two points, the next player deals
+        game_data = self.game_data
+        team = game_data.team1 if game_data.team1["turns"] > game_data.team2["turns"] else game_data.team2
+        team["points"] += 2
+        if self.recorder is not None:
+            self.recorder.finish_point()
+        if self.on_event is not None:
+            self.on_event("POINT_WINNER", {"winner": team["player"]})
+
+        game_data.team1["turns"] = 0
+        game_data.team2["turns"] = 0
+        game_data.turn_loop = game_data.turn_loop[1:] + game_data.turn_loop[:1]
+
+    def _finish_round(self) -> None:
+        # The team with more points gets the round, a player of the other team starts the next round
+        game_data = self.game_data
+        if game_data.team1["points"] > game_data.team2["points"]:
+            winner, loser = game_data.team1, game_data.team2
+        else:
+            winner, loser = game_data.team2, game_data.team1
+            game_data.last_won_point = game_data.team2["player"]
+        winner["rounds"] += 1
+
+        start_index = game_data.turn_loop.index(self.rng.choice(loser["player"]))
+        game_data.turn_loop = game_data.turn_loop[start_index:] + game_data.turn_loop[:start_index]
+        if self.on_event is not None:
+            self.on_event("ROUND_WINNER", {"winner": winner["player"]})
+
+        game_data.team1["points"] = 0
+        game_data.team2["points"] = 0
+        self.round_over = True
+
+
+def table_rng(seed: int | None, table: int) -> random.Random:
+    """
+    Get the random generator of a table
+
+    Every table of a seeded server has its own stream,
+    so the deals of a table can be reproduced no matter how many tables run next to it
+
+    Parameters
+    ----------
+    seed : int | None
+        The seed of the server (None: the table is not reproducible)
+    table : int
+        The number of the table
+
+    Returns
+    -------
+    random.Random : The random generator of the table
+    """
+    if seed is None:
+        return random.Random()
+    return random.Random(f"{seed}/{table}")
+
+
+def play_random_round(engine: GameEngine, rng: random.Random) -> int:
+    """
+    Play one round (until a team has 11 points) with players that play a random allowed card
+
+    This does not reach the target of 100000 simulated games per second per core:
+    the benchmark below plays about 2000 rounds (20000 points) per second with CPython,
+    every play is checked like a play of a client (see GameEngine.play)
+
+    Parameters
+    ----------
+    engine : GameEngine
+        The engine to play on (the players have to be seated)
+    rng : random.Random
+        The random generator of the players
+
+    Returns
+    -------
+    int : The amount of points played
+    """
+    engine.deal()
+    points = 1
+    while True:
+        engine.play(engine.current_player(), rng.choice(mask_ids(engine.available_mask())))
+        if engine.phase == DEAL:
+            if engine.round_over:
+                return points
+            engine.deal()
+            points += 1
+
+
+if __name__ == '__main__':
+    # Play random rounds without any network to measure the speed of the rules
+    AMOUNT = 2000
+    TARGET = 100000
+    rng = table_rng(1, 0)
+    engine = GameEngine(rng=rng)
+    engine.seat(["Marcel", "Daniel", "Thomas", "Christoph"])
+    start_time = time.perf_counter()
+    points = sum(play_random_round(engine, rng) for i in range(AMOUNT))
+    duration = time.perf_counter() - start_time
+    print(f"[{'BENCHMARK':<10}] {AMOUNT} rounds ({points} points) in {duration:.3f}s: "
+          f"{AMOUNT / duration:.0f} rounds/s, {points / duration:.0f} points/s")
+    if AMOUNT / duration < TARGET:
+        print(f"[{'BENCHMARK':<10}] the target of {TARGET} games/s per core is not met "
+              f"({AMOUNT / duration / TARGET:.1%} of it, counting a point as a game {points / duration / TARGET:.0%})")
@@ -0,0 +1,156 @@
+import socket
+from collections import deque
+
+# The same module is used by the client (client/framing.py), keep both copies equal
+
+HEADER_SIZE = 16
+MAX_FRAME_SIZE = 1 << 20
+READ_SIZE = 65536
+
+
+def encode_frame(data: bytes) -> bytes:
+    """
+    Put the 16 byte big-endian length in front of the data
+
+    Parameters
+    ----------
+    data : bytes
+        The data of the frame
+
+    Returns
+    -------
+    bytes : The header and the data as one frame
+    """
+    return len(data).to_bytes(HEADER_SIZE, "big") + data
+
+
+def send_frame_parts(conn: socket.socket, parts: list[bytes]) -> None:
+    """
+    Send one frame whose data is split into parts with a single gathered write
+    (the header and the parts are not joined in python)
+
+    Parameters
+    ----------
+    conn : socket.socket
+        The connection to send the frame to
+    parts : list[bytes]
+        The parts that form the data of the frame
+
+    Returns
+    -------
+    None
+    """
+    length = sum(map(len, parts))
+    buffers = [length.to_bytes(HEADER_SIZE, "big"), *parts]
+    if not hasattr(conn, "sendmsg"):
+        # sendmsg is not available on every platform (e.g. Windows)
+        conn.sendall(b"".join(buffers))
+        return
+    sent = conn.sendmsg(buffers)
+    if sent < HEADER_SIZE + length:
+        conn.sendall(b"".join(buffers)[sent:])
+
+
+class FrameDecoder:
+    """
+    A class to split a stream of bytes into the frames sent by the other side
+
+    Every frame is a 16 byte big-endian length followed by the data,
+    the bytes that do not form a complete frame yet are kept until the next read
+
+    ...
+
+    Attributes
+    ----------
+    buffer : bytearray
+        The received bytes that do not form a complete frame yet
+    frames : collections.deque[bytes]
+        The complete frames that were decoded but not requested yet
+
+    Methods
+    -------
+    feed(data: bytes) -> list[bytes]
+        Add received bytes and return every frame that is complete now
+    recv(conn: socket.socket) -> bytes
+        Return the next frame, read from the connection until it is complete
+    """
+    def __init__(self):
+        """
+        Initialize a new FrameDecoder with an empty buffer
+        """
+        self.buffer: bytearray = bytearray()
+        self.frames: deque[bytes] = deque()
+
+    def feed(self, data: bytes) -> list[bytes]:
+        """
+        Add received bytes and return every frame that is complete now
+
+        Parameters
+        ----------
+        data : bytes
+            The bytes that were received
+
+        Returns
+        -------
+        list[bytes] : The data of every completed frame (can be empty)
+        """
+        buffer = self.buffer
+        buffer += data
+        frames = []
+        pos = 0
+        end = len(buffer)
+        while end - pos >= HEADER_SIZE:
+            length = int.from_bytes(buffer[pos:pos + HEADER_SIZE], "big")
+            if length > MAX_FRAME_SIZE:
+                raise ValueError(f"Frame of {length} bytes exceeds the limit of {MAX_FRAME_SIZE} bytes")
+            start = pos + HEADER_SIZE
+            if end - start < length:
+                break
+            pos = start + length
+            frames.append(bytes(buffer[start:pos]))
+        if pos:
+            del buffer[:pos]
+        return frames
+
+    def recv(self, conn: socket.socket) -> bytes:
+        """
+        Return the next frame, read from the connection until it is complete
+        (additional frames of the same read are kept for the next call)
+
+        Parameters
+        ----------
+        conn : socket.socket
+            The connection to read from
+
+        Returns
+        -------
+        bytes : The data of the frame
+        """
+        while not self.frames:
+            data = conn.recv(READ_SIZE)
+            if not data:
+                raise ConnectionError("The connection was closed by the other side")
+            self.frames.extend(self.feed(data))
+        return self.frames.popleft()
+
+
+if __name__ == '__main__':
+    import time
+    import json
+
+    # Throughput of many small frames, received in chunks like a busy socket would deliver them
+    AMOUNT = 1_000_000
+    payload = encode_frame(json.dumps({"command": "PLAY_CARD", "from": "Marcel", "card": 17}).encode())
+    stream = payload * AMOUNT
+    chunks = [stream[i:i + READ_SIZE] for i in range(0, len(stream), READ_SIZE)]
+
+    decoder = FrameDecoder()
+    start_time = time.perf_counter()
+    decoded = 0
+    for chunk in chunks:
+        decoded += len(decoder.feed(chunk))
+    duration = time.perf_counter() - start_time
+
+    assert decoded == AMOUNT and not decoder.buffer
+    print(f"[{'BENCHMARK':<10}] {decoded} frames ({len(stream) / 1e6:.1f} MB) in {duration:.3f}s "
+          f"-> {decoded / duration / 1e6:.2f}M frames/s")
@@ -1,16 +1,28 @@
-import random
 import time
-
-from models import GameData, CardBase, PlayerData
-from server_utils import check_available, check_winner
+import random
+import asyncio
+from typing import Any
+
+from models import GameData
+from engine import GameEngine, PLAY
+from replay_log import PointRecorder
+from history import TableHistory
+from leaderboard import Leaderboard
+from snapshot import load_table
+from cards_utils import mask_ids
 from server_network import NetworkServer
 from database import Database
+from state_delta import DELTA, StateStream
+from protocol_trace import trace
 
 
 class GameLogic:
     """
     A class to handle the logic of the game
 
+    The rules are played by a GameEngine,
+    the GameLogic sends its events to the clients and passes the cards of the clients to it
+
     Synonyms:
         round -> playing until one team has 11 points
         point -> playing five turns -> all cards (team with 3 turns won get a point)
@@ -22,33 +34,49 @@ class GameLogic:
     ----------
     server : NetworkServer
     game_data : GameData
+    engine : GameEngine
+        The rules of the table (changes game_data)
+    state_stream : StateStream
+        The versioned public state of the table (for clients with the "delta" feature)
+    history : TableHistory | None
+        Stores the winners of the turns, points and rounds in the database (None: the history is not stored)
+    leaderboard : Leaderboard | None
+        Answers the LEADERBOARD requests of the players (None: the requests are ignored)
 
     Methods
     -------
     setup() -> None
         Setup the game
+    seat_players(gl: list[str]) -> None
+        Divide the players into teams and send the names to every player
+    resume(snapshot: bytes) -> None
+        Continue a table from a snapshot and send every player what they knew
     start_game_loop() -> None
         Start rounds until the players stop playing
     start_new_round(self) -> None
-        Check if a team won 11 points and start new points
+        Play points until a team won 11 points
+    round_finished() -> bool
+        Check if the last point finished the round
     start_for_new_points() -> None
         Mixing the dek, dealing the cards and playing one point
     start_player_turns() -> None
         Wait for every client to do their turn
-    deal_round() -> None
-        Deal 5 cards to the clients
-    get_highest(send: bool = True) -> None
-        Update the current highest card and send it if wanted
+    handle_event(command: str, data: dict) -> None
+        Send an event of the engine to the clients
     ask_for_start(delay: int = 10) -> None
         Wait 'delay' seconds for the first and the last player to approve their cards
     handle_all_responses(self) -> None
         Handle every open command from the queue
-    handle_response(data: dict) -> None
-        Handle a command received from a client
+    handle_response(data: dict) -> bool
+        Handle a command received from a client (True if it played a card)
+    send_state(command: str, full: tuple[str, ...], **data) -> None
+        Send a command that changes the state of the table (full values or a delta)
     better_cards() -> None
         The server deals new cards to the first and the last player
     """
-    def __init__(self, auto_setup: bool = True):
+    def __init__(self, auto_setup: bool = True, db: Database | None = None, server: NetworkServer | None = None,
+                 rng: random.Random | None = None, recorder: PointRecorder | None = None,
+                 history: TableHistory | None = None, leaderboard: Leaderboard | None = None):
         """
         Initialize a new Game
 
@@ -56,10 +84,26 @@ class GameLogic:
         ----------
         auto_setup : bool (default: True)
             If the setup method should start automatically
+        db : Database | None (default: None)
+            The database to verify the logins with (a new one is opened if not given)
+        server : NetworkServer | None (default: None)
+            The network part of the table (a new NetworkServer is bound if not given)
+        rng : random.Random | None (default: None)
+            The random generator of the table (a seeded one makes the deals reproducible)
+        recorder : PointRecorder | None (default: None)
+            Writes the points of the table to the replay log (None: the game is not recorded)
+        history : TableHistory | None (default: None)
+            Stores the winners of the turns, points and rounds in the database (None: the history is not stored)
+        leaderboard : Leaderboard | None (default: None)
+            Answers the LEADERBOARD requests of the players (None: the requests are ignored)
         """
-        self.db = Database()
-        self.server = NetworkServer(self.db)
+        self.db = db if db is not None else Database()
+        self.server = server if server is not None else NetworkServer(self.db)
         self.game_data = GameData()
+        self.engine = GameEngine(self.handle_event, rng=rng, game_data=self.game_data, recorder=recorder)
+        self.state_stream = StateStream()
+        self.history = history
+        self.leaderboard = leaderboard
 
         if auto_setup:
             self.setup()
@@ -75,60 +119,110 @@ class GameLogic:
 
         """
         self.server.accept_clients()
-        gl = list(self.server.clients)
-        self.game_data.turn_loop = gl
-        self.game_data.turn_loop = gl
-        self.game_data.team1["player"] = [gl[0], gl[2]]
-        self.game_data.team2["player"] = [gl[1], gl[3]]
+        self.seat_players(list(self.server.clients))
+
+    def seat_players(self, gl: list[str]) -> None:
+        """
+        Divide the given players into teams and send the names of the players to every player
+
+        Parameters
+        ----------
+        gl : list[str]
+            The names of the four players in the order they will play
+
+        Returns
+        -------
+        None
+        """
+        self.engine.seat(gl)
+        if self.history is not None:
+            self.history.start(self.game_data)
 
         for index, client in enumerate(self.game_data.turn_loop):
             self.server.send_to("PLAYER_NAMES", client, players=self.game_data.turn_loop[index:] + self.game_data.turn_loop[:index])
 
+        self.state_stream.update(self.game_data.public_state())
+        delta = [name for name, client in self.server.clients.items() if DELTA in client.features]
+        self.server.broadcast("STATE_SNAPSHOT", delta, **self.state_stream.snapshot())
+
+    def resume(self, snapshot: bytes) -> None:
+        """
+        Continue a table from a snapshot and send every player what they knew
+        (the names, their cards, the highest card to the players that saw it and the state of the table)
+
+        Parameters
+        ----------
+        snapshot : bytes
+            The snapshot of the table (see snapshot.dump_table)
+
+        Returns
+        -------
+        None
+        """
+        load_table(self.engine, snapshot)
+        loop = self.game_data.turn_loop
+        if self.engine.recorder is not None:
+            self.engine.recorder.seat(loop)
+        if self.history is not None:
+            self.history.start(self.game_data)
+
+        for index, client in enumerate(loop):
+            self.server.send_to("PLAYER_NAMES", client, players=loop[index:] + loop[:index])
+        self.state_stream.update(self.game_data.public_state())
+        delta = [name for name, client in self.server.clients.items() if DELTA in client.features]
+        self.server.broadcast("STATE_SNAPSHOT", delta, **self.state_stream.snapshot())
+        if self.engine.phase != PLAY:
+            return
+
+        for name, player in self.game_data.game_player.items():
+            self.server.send_to("NEW_CARD", name, cards=player.dealt_cards(self.game_data.card_dek))
+        if self.engine.shown:
+            self.server.broadcast("HIGHEST", self.engine.shown, highest=int(self.game_data.highest))
+        self.handle_event("PLAYER_TURN", {"to": self.engine.current_player(), "available": mask_ids(self.engine.available_mask())})
+
     def start_game_loop(self) -> None:
         """
         Start rounds until the players stop playing
+        (a resumed table finishes its point first)
 
         Returns
         -------
         None
         """
+        while self.engine.phase == PLAY:
+            self.start_player_turns()
+        if self.round_finished() and self.history is not None:
+            self.history.rate_round()
         while True:
             self.start_new_round()
 
     def start_new_round(self) -> None:
         """
-        Check if a team won 11 points and start new points
+        Play points until a team won 11 points
 
         when 11 points are reached,
-        the round attribute of the team is raised and another round starts
+        the round attribute of the team is raised, the ratings of the players are updated and another round starts
 
         Returns
         -------
         None
         """
-        while not (self.game_data.team1.get("points") >= 11 or self.game_data.team2.get("points") >= 11):
+        while True:
             self.start_for_new_points()
+            if self.round_finished():
+                if self.history is not None:
+                    self.history.rate_round()
+                return
 
-        if self.game_data.team1.get("points") > self.game_data.team2.get("points"):
-            self.game_data.team1["rounds"] += 1
-
-            start_player: str = random.choice(self.game_data.team2.get("player"))
-            start_index = self.game_data.turn_loop.index(start_player)
-            self.game_data.turn_loop = self.game_data.turn_loop[start_index:] + self.game_data.turn_loop[:start_index]
-
-            self.server.send_all("ROUND_WINNER", winner=self.game_data.team1.get("player"), team1=self.game_data.team1, team2=self.game_data.team2)
-        else:
-            self.game_data.team2["rounds"] += 1
-            self.game_data.last_won_point = self.game_data.team2.get("player")
-
-            start_player: str = random.choice(self.game_data.team1.get("player"))
-            start_index = self.game_data.turn_loop.index(start_player)
-            self.game_data.turn_loop = self.game_data.turn_loop[start_index:] + self.game_data.turn_loop[:start_index]
-
-            self.server.send_all("ROUND_WINNER", winner=self.game_data.team2.get("player"), team1=self.game_data.team1, team2=self.game_data.team2)
+    def round_finished(self) -> bool:
+        """
+        Check if the last point finished the round (one of the teams reached 11 points)
 
-        self.game_data.team1["points"] = 0
-        self.game_data.team2["points"] = 0
+        Returns
+        -------
+        bool : If the current round is over
+        """
+        return self.engine.round_over
 
     def start_for_new_points(self) -> None:
         """
@@ -138,25 +232,10 @@ class GameLogic:
         -------
         None
         """
-        self.game_data.mixed_dek()
-        self.deal_round()
-        self.get_highest()
+        self.engine.deal()
         # self.ask_for_start()
-        for i in range(5):
+        while self.engine.phase == PLAY:
             self.start_player_turns()
-            self.resolve_turn_winner()
-
-        self.game_data.team1["turns"] = 0
-        self.game_data.team2["turns"] = 0            
-
-        if self.game_data.team1.get("turns") > self.game_data.team2.get("turns"):
-            self.game_data.team1["points"] += 2
-            self.server.send_all("POINT_WINNER", winner=self.game_data.team1.get("player"), team1=self.game_data.team1, team2=self.game_data.team2)
-        else:
-            self.game_data.team2["points"] += 2
-            self.server.send_all("POINT_WINNER", winner=self.game_data.team2.get("player"), team1=self.game_data.team1, team2=self.game_data.team2)
-
-        self.game_data.turn_loop = self.game_data.turn_loop[1:] + self.game_data.turn_loop[0]
 
     def start_player_turns(self) -> None:
         """
@@ -167,63 +246,47 @@ class GameLogic:
         -------
         None
         """
-        for client in self.game_data.turn_loop:
-            available_cards = check_available(
-                self.game_data.game_player.get(client).cards,
-                self.game_data.played_cards,
-                self.game_data.highest,
-                True if list(self.game_data.turn_loop).index(client) in [0, 3] else False
-            )
-            self.server.send_to("PLAYER_TURN", client, available=list(map(int, available_cards)))
-            data = self.server.receive_from_client(client)
-            self.handle_response(data)
-            # input("turn")
-
-    def deal_round(self) -> None:
-        """
-        Deal 5 cards to the clients
-        (First 3 then 2)
-
-        Returns
-        -------
-        None
-        """
-        # Dealing the cards to the client (serverside)
-        for cards in [3, 2]:
-            for client in self.game_data.turn_loop:
-                deal_cards = self.game_data.card_dek.deal_top_card(cards)
+        for i in range(len(self.game_data.turn_loop) - len(self.game_data.played_cards)):
+            client = self.engine.current_player()
+            # Other commands (e.g. STATE_REQUEST) are handled while waiting for the card
+            while True:
                 try:
-                    self.game_data.game_player[client].cards.extend(deal_cards)
-                except KeyError:
-                    data = PlayerData(client)
-                    data.cards.extend(deal_cards)
-                    self.game_data.game_player[client] = data
-
-        # sending cards to clients
-        for client in self.server.clients:
-            cards_to_send = self.game_data.game_player[client].cards
-            self.server.send_to("NEW_CARD", client, cards=list(map(int, cards_to_send)))
-
-    def get_highest(self, send: bool = True) -> None:
+                    command = self.server.receive_from_client(client)
+                except ValueError as e:
+                    # A frame that can not be decoded is ignored like a card that is not allowed
+                    if trace.level:
+                        trace.event(client, f"frame rejected ({e})")
+                    continue
+                if self.handle_response(command):
+                    break
+
+    def handle_event(self, command: str, data: dict[str, Any]) -> None:
         """
-        Update the current highest card and send it if wanted
+        Send an event of the engine to the clients
 
         Parameters
         ----------
-        send : bool (default: True)
-            If the highest card should be sent to the first and the last player
+        command : str
+            The command of the event
+        data : dict[str, any]
+            The data of the event ("to" if only some clients receive it)
 
         Returns
         -------
         None
         """
-        self.game_data.highest = CardBase.new_card(
-            self.game_data.game_player[self.game_data.turn_loop[-1]].cards[0].col(),
-            self.game_data.game_player[self.game_data.turn_loop[0]].cards[0].num()
-        )
-        if send:
-            self.server.send_to("HIGHEST", self.game_data.turn_loop[-1], highest=int(self.game_data.highest))
-            self.server.send_to("HIGHEST", self.game_data.turn_loop[0], highest=int(self.game_data.highest))
+        if self.history is not None and "winner" in data:
+            # Before the engine resets the turn, point or round
+            self.history.record(command, data["winner"], self.game_data)
+        match command:
+            case "NEW_CARD" | "PLAYER_TURN":
+                self.server.send_to(command, data.pop("to"), **data)
+            case "HIGHEST":
+                self.server.broadcast(command, data.pop("to"), **data)
+            case "UPDATE_TURN":
+                self.send_state(command, ("played",), **data)
+            case _:
+                self.send_state(command, **data)
 
     def ask_for_start(self, delay: int = 10) -> None:
         """
@@ -247,12 +310,13 @@ class GameLogic:
         -------
         None
         """
-        while self.server.que.not_empty:
+        while not self.server.que.empty():
             self.handle_response(self.server.que.get())
 
-    def handle_response(self, data: dict) -> None:
+    def handle_response(self, data: dict) -> bool:
         """
         Handle a command received from a client
+        (a card that is not allowed is ignored, the table keeps waiting for an allowed card)
 
         Parameters
         ----------
@@ -261,20 +325,60 @@ class GameLogic:
 
         Returns
         -------
-        None
+        bool : If the command played a card
         """
-        print(data)
         if not data:
-            return
+            return False
         match data.get("command"):
             case "PLAY_CARD":
-                self.game_data.played_cards.append(CardBase(data.get("card")))
-                int_cards = list(map(int, self.game_data.game_player.get(data.get("from")).cards))
-                index = int_cards.index(data.get("card"))
-                self.game_data.game_player.get(data.get("from")).cards.pop(index)
-                self.server.send_all("UPDATE_TURN", played=tuple(map(int, self.game_data.played_cards)), last_played=data.get("from"))
+                try:
+                    self.engine.play(data.get("from"), data.get("card"))
+                except ValueError as e:
+                    if trace.level:
+                        trace.event(data.get("from"), f"card rejected ({e})")
+                    return False
+                return True
+            case "STATE_REQUEST":
+                self.server.send_to("STATE_SNAPSHOT", data.get("from"), **self.state_stream.snapshot())
+            case "LEADERBOARD":
+                if self.leaderboard is not None:
+                    self.server.send_to("LEADERBOARD", data.get("from"), **self.leaderboard.request(data.get("from")))
             case "BETTER_CARDS":
                 pass
+        return False
+
+    def send_state(self, command: str, full: tuple[str, ...] = ("team1", "team2"), **data: Any) -> None:
+        """
+        Send a command that changes the state of the table
+
+        Clients with the "delta" feature receive the sequence number and only the changed values,
+        the other clients receive the whole values named in 'full'
+
+        Parameters
+        ----------
+        command : str
+            The command every client should receive
+        full : tuple[str, ...] (default: ("team1", "team2"))
+            The values old clients need with this command ("team1", "team2", "played")
+        data : any
+            Additional data every client should receive
+
+        Returns
+        -------
+        None
+        """
+        changes = self.state_stream.update(self.game_data.public_state())
+        legacy, delta = [], []
+        for name, client in self.server.clients.items():
+            (delta if DELTA in client.features else legacy).append(name)
+
+        if legacy:
+            values = {"team1": self.game_data.team1,
+                      "team2": self.game_data.team2,
+                      "played": tuple(map(int, self.game_data.played_cards))}
+            self.server.broadcast(command, legacy, **data, **{key: values[key] for key in full})
+        if delta:
+            self.server.broadcast(command, delta, **data, seq=self.state_stream.seq, changes=changes)
 
     def better_cards(self) -> None:
         """
@@ -286,21 +390,134 @@ class GameLogic:
         -------
         None
         """
-        for cards in [3, 2]:
-            for client in [self.game_data.turn_loop[0], self.game_data.turn_loop[-1]]:
-                deal_cards = self.game_data.card_dek.deal_top_card(cards)
-                self.game_data.game_player[client].cards = []
-                self.game_data.game_player[client].cards.extend(deal_cards)
+        self.engine.better_cards()
+
+
+class AsyncGameLogic(GameLogic):
+    """
+    A class to handle the logic of one table inside the asyncio server
+
+    The rules are the ones of GameLogic,
+    only waiting for a card of a client is awaited instead of blocking,
+    so one event loop can run many tables at once
+
+    ...
+
+    Attributes
+    ----------
+    server : AsyncTableServer
+        The connections of the four players of this table
+    game_data : GameData
+
+    Methods
+    -------
+    start_game_loop() -> None
+        Start rounds until the players stop playing
+    start_new_round(self) -> None
+        Play points until a team won 11 points
+    start_for_new_points() -> None
+        Mixing the dek, dealing the cards and playing one point
+    start_player_turns() -> None
+        Wait for every client to do their turn
+    """
+    def __init__(self, server, db: Database, rng: random.Random | None = None, recorder: PointRecorder | None = None,
+                 snapshot: bytes | None = None, history: TableHistory | None = None, leaderboard: Leaderboard | None = None):
+        """
+        Initialize a new table
 
-    def resolve_turn_winner(self):
-        winner_index = check_winner(self.game_data.played_cards, self.game_data.highest)
-        winner_name=list(self.game_data.turn_loop)[winner_index]
+        Parameters
+        ----------
+        server : AsyncTableServer
+            The connections of the four players of this table
+        db : Database
+            The database shared by every table
+        rng : random.Random | None (default: None)
+            The random generator of the table
+        recorder : PointRecorder | None (default: None)
+            Writes the points of the table to the replay log
+        snapshot : bytes | None (default: None)
+            Continue the table of this snapshot instead of seating the players at a new one
+        history : TableHistory | None (default: None)
+            Stores the winners of the turns, points and rounds in the database
+        leaderboard : Leaderboard | None (default: None)
+            Answers the LEADERBOARD requests of the players
+        """
+        super().__init__(auto_setup=False, db=db, server=server, rng=rng, recorder=recorder, history=history,
+                         leaderboard=leaderboard)
+        if snapshot is not None:
+            self.resume(snapshot)
+        else:
+            self.seat_players(list(self.server.clients))
 
-        if winner_name in self.game_data.team1.get("player"):
-            self.game_data.team1["turns"] += 1
-        elif winner_name in self.game_data.team2.get("player"):
-            self.game_data.team2["turns"] += 1
+    async def start_game_loop(self) -> None:
+        """
+        Start rounds until the players stop playing
+        (a resumed table finishes its point first)
 
-        self.server.send_all("TURN_WINNER", winner=winner_name, team1=self.game_data.team1, team2=self.game_data.team2)
-        self.game_data.turn_loop = self.game_data.turn_loop[winner_index:] + self.game_data.turn_loop[:winner_index]
-        self.game_data.played_cards = []
+        Returns
+        -------
+        None
+        """
+        while self.engine.phase == PLAY:
+            await self.start_player_turns()
+        if self.round_finished() and self.history is not None:
+            self.history.rate_round()
+        while True:
+            await self.start_new_round()
+
+    async def start_new_round(self) -> None:
+        """
+        Play points until a team won 11 points
+        (then the ratings of the players are updated)
+
+        Returns
+        -------
+        None
+        """
+        while True:
+            await self.start_for_new_points()
+            if self.round_finished():
+                if self.history is not None:
+                    self.history.rate_round()
+                return
+
+    async def start_for_new_points(self) -> None:
+        """
+        Mixing the dek, dealing the cards and playing one point
+
+        Returns
+        -------
+        None
+        """
+        self.engine.deal()
+        while self.engine.phase == PLAY:
+            await self.start_player_turns()
+
+    async def start_player_turns(self) -> None:
+        """
+        Wait for every client to do their turn
+        (order: game_loop)
+
+        Returns
+        -------
+        None
+        """
+        loop = asyncio.get_running_loop()
+        for i in range(len(self.game_data.turn_loop) - len(self.game_data.played_cards)):
+            client = self.engine.current_player()
+            available = list(map(int, self.engine.available()))
+            timeout = self.server.turn_timeout
+            end = loop.time() + timeout if timeout else None
+            while True:
+                remaining = max(0.001, end - loop.time()) if end else None
+                data = await self.server.receive_from_client(client, remaining)
+                if data.get("command") == "TURN_TIMEOUT":
+                    # The player was too slow, the first allowed card is played instead
+                    if trace.level:
+                        trace.event(client, f"did not play a card in {timeout}s, {available[0]} was played")
+                    data = {"command": "PLAY_CARD", "from": client, "card": available[0]}
+                if data.get("command") == "PLAY_CARD" and data.get("card") in available:
+                    break
+                # Other commands (e.g. STATE_REQUEST) are handled while waiting for the card, other cards are rejected
+                self.handle_response(data)
+            self.handle_response(data)
@@ -0,0 +1,414 @@
+import os
+import time
+import queue
+import sqlite3
+import threading
+from itertools import count
+
+from models import GameData
+from database import Database, BOT_PREFIX
+from leaderboard import Leaderboard
+
+# The kinds of the records (the ones from POINT on are dropped first)
+GAME_STARTED = 0
+GAME_ENDED = 1
+ROUND = 2
+RATING = 3
+POINT = 4
+TRICK = 5
+KINDS = ("games", "ended", "rounds", "ratings", "points", "tricks")
+
+
+class HistoryWriter:
+    """
+    A class to write the history of every table of this process to the database behind the game loop
+
+    The tables only put their records into a bounded queue (microseconds, never blocking),
+    a background thread takes everything that piled up while it wrote the last batch
+    and writes it in one transaction, so the game loop never waits for the disk.
+
+    Overflow: if the database falls behind and the queue is full, new records are dropped (and counted) instead of
+    waiting. The last tenth of the queue is reserved for the results (games, rounds and ratings),
+    so points and tricks are dropped first. The records of a game whose start was dropped are dropped as well.
+    The thread is started with the first record, so every forked worker runs its own writer.
+    Records still queued when the process dies are lost.
+
+    ...
+
+    Attributes
+    ----------
+    db : Database
+        The database the history is written to
+    batch_size : int
+        The most records written in one transaction
+    queue : queue.Queue
+        The records that were not written yet
+    reserve : int
+        The free places in the queue that only the results may take
+    thread : threading.Thread | None (default: None)
+        The writer of this process (None until the first record)
+    written : int (default: 0)
+        The amount of written records
+    batches : int (default: 0)
+        The amount of written transactions
+    dropped : dict[str, int]
+        The amount of dropped records of every kind
+    leaderboard : Leaderboard | None
+        The cache that is invalidated when the ratings changed (None: there is no cache in this process)
+
+    Methods
+    -------
+    start_game(table: int, players: list[tuple[int, str]]) -> int
+        Queue a new game
+    put(kind: int, game: int, row: tuple) -> bool
+        Queue a record without waiting
+    stats() -> dict[str, int]
+        Get the queued, written and dropped records
+    close(timeout: float = 10) -> None
+        Write the queued records and stop the thread
+    """
+    def __init__(self, db: Database, max_queue: int = 10000, batch_size: int = 1000, leaderboard: Leaderboard | None = None):
+        """
+        Initialize a new writer
+
+        Parameters
+        ----------
+        db : Database
+            The database the history is written to
+        max_queue : int (default: 10000)
+            How many records may wait for the writer before new records are dropped
+        batch_size : int (default: 1000)
+            The most records written in one transaction
+        leaderboard : Leaderboard | None (default: None)
+            The cache that is invalidated when the ratings changed
+        """
+        self.db = db
+        self.batch_size = batch_size
+        self.queue: queue.Queue = queue.Queue(max_queue)
+        self.reserve: int = max_queue // 10
+        self.thread: threading.Thread | None = None
+        self.written: int = 0
+        self.batches: int = 0
+        self.dropped: dict[str, int] = dict.fromkeys(KINDS, 0)
+        self.leaderboard = leaderboard
+        self._games = count(1)
+        self._pid: int | None = None
+
+    def start_game(self, table: int, players: list[tuple[int, str]]) -> int:
+        """
+        Queue a new game (the id in the database is assigned by the writer)
+
+        Parameters
+        ----------
+        table : int
+            The number of the table
+        players : list[tuple[int, str]]
+            The team (1 or 2) and the name of every player in the order they were seated
+
+        Returns
+        -------
+        int : The key of the game in this writer (for the records of the game)
+        """
+        game = next(self._games)
+        self.put(GAME_STARTED, game, (table, time.time(), players))
+        return game
+
+    def put(self, kind: int, game: int, row: tuple) -> bool:
+        """
+        Queue a record without waiting
+
+        Parameters
+        ----------
+        kind : int
+            GAME_STARTED, GAME_ENDED, ROUND, RATING, POINT or TRICK
+        game : int
+            The key of the game (see start_game)
+        row : tuple
+            The values of the record (without the game)
+
+        Returns
+        -------
+        bool : If the record was queued (False: the queue is full, the record is dropped)
+        """
+        if self._pid != os.getpid():
+            # The thread of the parent does not exist in a forked process
+            self._pid = os.getpid()
+            self.thread = threading.Thread(target=self._run, name="history", daemon=True)
+            self.thread.start()
+
+        if kind >= POINT and self.queue.qsize() >= self.queue.maxsize - self.reserve:
+            self.dropped[KINDS[kind]] += 1
+            return False
+        try:
+            self.queue.put_nowait((kind, game, row))
+        except queue.Full:
+            self.dropped[KINDS[kind]] += 1
+            return False
+        return True
+
+    def stats(self) -> dict[str, int]:
+        """
+        Get the queued, written and dropped records
+
+        Returns
+        -------
+        dict[str, int] : queued, written, batches and dropped (all kinds together)
+        """
+        return {"queued": self.queue.qsize(), "written": self.written, "batches": self.batches,
+                "dropped": sum(self.dropped.values())}
+
+    def close(self, timeout: float = 10) -> None:
+        """
+        Write the queued records and stop the thread
+
+        Parameters
+        ----------
+        timeout : float (default: 10)
+            The most seconds to wait for the writer
+
+        Returns
+        -------
+        None
+        """
+        if self.thread is None or self._pid != os.getpid():
+            return
+        try:
+            self.queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self.thread.join(timeout)
+        self.thread = None
+        self._pid = None
+
+    def _run(self) -> None:
+        # The ids of the games of this writer in the database
+        games: dict[int, int] = {}
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in batch
+            try:
+                self._write([record for record in batch if record is not None], games)
+            except sqlite3.Error as e:
+                print(f"[{'HISTORY':<10}] {len(batch)} records were not written ({e!r})")
+            if stop:
+                return
+
+    def _write(self, batch: list[tuple[int, int, tuple]], games: dict[int, int]) -> None:
+        # Every batch is one transaction, the games are added first, the other rows reference them
+        # (the ids of the games only count once the transaction is committed,
+        # the write lock is taken at the start, the ratings are read and written inside)
+        rows: tuple[list, ...] = ([], [], [], [], [], [])
+        started: dict[int, int] = {}
+        ended: list[int] = []
+        unknown = 0
+        rated = False
+        with self.db.transaction(immediate=True):
+            for kind, game, row in batch:
+                if kind == GAME_STARTED:
+                    started[game] = self.db.add_game(*row)
+                    continue
+                if kind == RATING:
+                    # The ratings do not need the game, they are read and written in this transaction
+                    self.db.rate_round(*row)
+                    rated = True
+                    continue
+                game_id = started.get(game, games.get(game))
+                if game_id is None:
+                    self.dropped[KINDS[kind]] += 1
+                    unknown += 1
+                elif kind == GAME_ENDED:
+                    rows[kind].append((row[0], game_id))
+                    ended.append(game)
+                else:
+                    rows[kind].append((game_id, *row))
+            self.db.add_history(rows[ROUND], rows[POINT], rows[TRICK], rows[GAME_ENDED])
+        games.update(started)
+        for game in ended:
+            games.pop(game, None)
+        if rated and self.leaderboard is not None:
+            self.leaderboard.invalidate()
+        self.written += len(batch) - unknown
+        self.batches += 1
+
+
+class TableHistory:
+    """
+    A class to collect the history of one table for the HistoryWriter
+
+    A table resumed from a snapshot is a new game (its first round may have started before)
+
+    ...
+
+    Attributes
+    ----------
+    writer : HistoryWriter
+        The writer of this process
+    table : int
+        The number of the table
+    game : int | None (default: None)
+        The key of the current game (None until the players are seated)
+    round : int (default: 1)
+        The number of the current round of the game
+    point : int (default: 1)
+        The number of the current point of the round
+    trick : int (default: 1)
+        The number of the current turn of the point
+    round_result : tuple[list[str], list[str]] | None (default: None)
+        The winners and the losers of the last round that was not rated yet
+
+    Methods
+    -------
+    start(game_data: GameData) -> None
+        Start a new game with the seated players
+    record(command: str, winner: str | list[str], game_data: GameData) -> None
+        Record a TURN_WINNER, POINT_WINNER or ROUND_WINNER (before the engine resets the state for the next one)
+    rate_round() -> None
+        Queue the rating update of the last finished round
+    finish() -> None
+        Mark the game as ended
+    """
+    def __init__(self, writer: HistoryWriter, table: int):
+        """
+        Initialize the history of a table
+
+        Parameters
+        ----------
+        writer : HistoryWriter
+            The writer of this process
+        table : int
+            The number of the table
+        """
+        self.writer = writer
+        self.table = table
+        self.game: int | None = None
+        self.round: int = 1
+        self.point: int = 1
+        self.trick: int = 1
+        self.round_result: tuple[list[str], list[str]] | None = None
+
+    def start(self, game_data: GameData) -> None:
+        """
+        Start a new game with the seated players
+
+        Parameters
+        ----------
+        game_data : GameData
+            The data of the table (after the players were seated)
+
+        Returns
+        -------
+        None
+        """
+        team1 = game_data.team1["player"]
+        players = [(1 if name in team1 else 2, name) for name in game_data.turn_loop]
+        self.game = self.writer.start_game(self.table, players)
+        self.round = self.point = self.trick = 1
+
+    def record(self, command: str, winner: str | list[str], game_data: GameData) -> None:
+        """
+        Record a TURN_WINNER, POINT_WINNER or ROUND_WINNER
+        (called with the event, before the engine resets the state for the next turn, point or round)
+
+        Parameters
+        ----------
+        command : str
+            The command of the event (other commands are ignored)
+        winner : str | list[str]
+            The player that won the turn or the players of the team that won the point or the round
+        game_data : GameData
+            The data of the table
+
+        Returns
+        -------
+        None
+        """
+        if self.game is None:
+            return
+        team1, team2 = game_data.team1, game_data.team2
+        match command:
+            case "TURN_WINNER":
+                cards = bytes(map(int, game_data.played_cards))
+                self.writer.put(TRICK, self.game, (self.round, self.point, self.trick, game_data.turn_loop[0], winner, cards))
+                self.trick += 1
+            case "POINT_WINNER":
+                self.writer.put(POINT, self.game, (self.round, self.point, 1 if winner == team1["player"] else 2,
+                                                   team1["turns"], team2["turns"], team1["points"], team2["points"]))
+                self.point += 1
+                self.trick = 1
+            case "ROUND_WINNER":
+                self.writer.put(ROUND, self.game, (self.round, 1 if winner == team1["player"] else 2,
+                                                   team1["points"], team2["points"], time.time()))
+                self.round_result = (list(winner), list(team2["player"] if winner == team1["player"] else team1["player"]))
+                self.round += 1
+                self.point = 1
+
+    def rate_round(self) -> None:
+        """
+        Queue the rating update of the last finished round
+        (the ratings are read and changed by the writer, the game loop does not wait for them)
+        The bots are not rated, a round without a human player on both sides is not rated at all
+
+        Returns
+        -------
+        None
+        """
+        if self.game is None or self.round_result is None:
+            return
+        winners, losers = ([name for name in team if not name.startswith(BOT_PREFIX)] for team in self.round_result)
+        self.round_result = None
+        if winners and losers:
+            self.writer.put(RATING, self.game, (winners, losers))
+
+    def finish(self) -> None:
+        """
+        Mark the game as ended (the table was closed)
+
+        Returns
+        -------
+        None
+        """
+        if self.game is not None:
+            self.writer.put(GAME_ENDED, self.game, (time.time(),))
+            self.game = None
+
+
+if __name__ == '__main__':
+    # Random games on one thread while the writer stores them: how long does the game loop wait per record?
+    import random
+    import tempfile
+    from engine import GameEngine, table_rng, play_random_round
+
+    ROUNDS = 200
+    directory = tempfile.mkdtemp()
+    writer = HistoryWriter(Database(os.path.join(directory, "history.db")))
+    waits = []
+
+    def on_event(command, data):
+        if command in ("TURN_WINNER", "POINT_WINNER", "ROUND_WINNER"):
+            start = time.perf_counter()
+            history.record(command, data["winner"], engine.game_data)
+            waits.append(time.perf_counter() - start)
+
+    start_time = time.perf_counter()
+    for table in range(ROUNDS // 10):
+        rng = table_rng(1, table)
+        engine = GameEngine(on_event, rng=rng)
+        engine.seat(["Marcel", "Daniel", "Thomas", "Christoph"])
+        history = TableHistory(writer, table)
+        history.start(engine.game_data)
+        for i in range(10):
+            play_random_round(engine, random.Random(i))
+        history.finish()
+    duration = time.perf_counter() - start_time
+    writer.close()
+
+    waits.sort()
+    stats = writer.stats()
+    print(f"[{'BENCHMARK':<10}] {stats['written']} records of {ROUNDS} rounds in {stats['batches']} transactions, "
+          f"{stats['dropped']} dropped, game loop {duration:.2f}s, per record p50 {waits[len(waits) // 2] * 1e6:.1f}µs "
+          f"max {waits[-1] * 1e6:.1f}µs")
@@ -0,0 +1,187 @@
+import time
+
+from database import Database
+
+
+class Leaderboard:
+    """
+    A class to answer leaderboard requests from memory
+
+    The best players and the looked up ranks are cached,
+    SQLite is only asked if the ratings changed: the versions of the ratings and the leaderboard are read
+    at most once every ttl seconds (however many requests arrive), a cached entry is dropped when its version moved.
+    The HistoryWriter of this process invalidates the cache right after it rated a round,
+    rounds rated in other processes are seen after at most ttl seconds.
+
+    ...
+
+    Attributes
+    ----------
+    db : Database
+        The database with the ratings
+    ttl : float
+        The most seconds a cached leaderboard is used without checking the versions
+    max_players : int
+        How many player ranks are cached at most
+    hits : int (default: 0)
+        The lookups (leaderboard or rank) answered from the cache
+    misses : int (default: 0)
+        The lookups that had to read the database
+
+    Methods
+    -------
+    top() -> list[tuple[int, str, float]]
+        The rank, name and rating of the best players
+    rank(username: str) -> tuple[int, float, int, int] | None
+        The rank, rating, rounds and won rounds of a player
+    request(username: str) -> dict
+        The data of the LEADERBOARD command for a player
+    invalidate() -> None
+        Check the versions on the next request
+    """
+    def __init__(self, db: Database, ttl: float = 1.0, max_players: int = 10000):
+        """
+        Initialize a new leaderboard cache
+
+        Parameters
+        ----------
+        db : Database
+            The database with the ratings
+        ttl : float (default: 1.0)
+            The most seconds a cached leaderboard is used without checking the versions
+        max_players : int (default: 10000)
+            How many player ranks are cached at most
+        """
+        self.db = db
+        self.ttl = ttl
+        self.max_players = max_players
+        self.hits: int = 0
+        self.misses: int = 0
+        self._top: list[tuple[int, str, float]] | None = None
+        self._top_data: tuple[list, list[list]] = ([], [])
+        self._ranks: dict[str, tuple[int, float, int, int] | None] = {}
+        self._versions: tuple[int, int] = (-1, -1)
+        self._checked: float = float("-inf")
+
+    def top(self) -> list[tuple[int, str, float]]:
+        """
+        The rank, name and rating of the best players
+
+        Returns
+        -------
+        list[tuple[int, str, float]] : The players, the best first
+        """
+        self._check()
+        if self._top is None:
+            self.misses += 1
+            self._top = self.db.leaderboard()
+        else:
+            self.hits += 1
+        return self._top
+
+    def rank(self, username: str) -> tuple[int, float, int, int] | None:
+        """
+        The rank, rating, rounds and won rounds of a player
+
+        Parameters
+        ----------
+        username : str
+            The name of the player
+
+        Returns
+        -------
+        tuple[int, float, int, int] | None : The rank, rating, rounds and won rounds (None: the player has no rating yet)
+        """
+        self._check()
+        if username in self._ranks:
+            self.hits += 1
+            return self._ranks[username]
+        self.misses += 1
+        if len(self._ranks) >= self.max_players:
+            self._ranks.clear()
+        rank = self._ranks[username] = self.db.player_rank(username)
+        return rank
+
+    def request(self, username: str) -> dict:
+        """
+        The data of the LEADERBOARD command for a player
+
+        Parameters
+        ----------
+        username : str
+            The name of the player that asked
+
+        Returns
+        -------
+        dict : "top" (rank, name and rounded rating of the best players) and "player" (rank, rating, rounds, wins or None)
+        """
+        rank = self.rank(username)
+        top = self.top()
+        if self._top_data[0] is not top:
+            # Formatted once per cached leaderboard
+            self._top_data = (top, [[position, name, round(rating)] for position, name, rating in top])
+        player = None
+        if rank is not None:
+            player = {"rank": rank[0], "rating": round(rank[1]), "rounds": rank[2], "wins": rank[3]}
+        return {"top": self._top_data[1], "player": player}
+
+    def invalidate(self) -> None:
+        """
+        Check the versions on the next request (called by the HistoryWriter after it rated a round)
+
+        Returns
+        -------
+        None
+        """
+        self._checked = float("-inf")
+
+    def _check(self) -> None:
+        # Drop what changed since the last check (at most one query every ttl seconds)
+        now = time.monotonic()
+        if now - self._checked < self.ttl:
+            return
+        self._checked = now
+        versions = self.db.rating_versions()
+        if versions[0] != self._versions[0]:
+            self._ranks.clear()
+        if versions[1] != self._versions[1]:
+            self._top = None
+        self._versions = versions
+
+
+if __name__ == '__main__':
+    # Rate rounds of many players, then answer leaderboard requests with and without the cache
+    import os
+    import random
+    import tempfile
+
+    PLAYERS = 100000
+    ROUNDS = 20000
+    REQUESTS = 100000
+    db = Database(os.path.join(tempfile.mkdtemp(), "ratings.db"))
+    rng = random.Random(1)
+
+    start_time = time.perf_counter()
+    with db.transaction():
+        for i in range(ROUNDS):
+            players = [f"Player {rng.randrange(PLAYERS)}" for j in range(4)]
+            if len(set(players)) == 4:
+                db.rate_round(players[:2], players[2:])
+    rate_duration = time.perf_counter() - start_time
+
+    names = [f"Player {rng.randrange(PLAYERS)}" for i in range(1000)]
+    start_time = time.perf_counter()
+    for i in range(REQUESTS // 100):
+        db.leaderboard()
+        db.player_rank(names[i % len(names)])
+    direct_duration = time.perf_counter() - start_time
+
+    leaderboard = Leaderboard(db)
+    start_time = time.perf_counter()
+    for i in range(REQUESTS):
+        leaderboard.request(names[i % len(names)])
+    cached_duration = time.perf_counter() - start_time
+
+    print(f"[{'BENCHMARK':<10}] rate a round {rate_duration / ROUNDS * 1e6:.0f}µs, "
+          f"request from SQLite {direct_duration / (REQUESTS // 100) * 1e6:.0f}µs, "
+          f"from the cache {cached_duration / REQUESTS * 1e6:.2f}µs ({leaderboard.hits} hits, {leaderboard.misses} misses)")
@@ -0,0 +1,289 @@
+import time
+from collections import deque
+from typing import Callable, Any
+
+from models import ClientData
+
+TABLE_SIZE = 4
+
+# The ways to fill the seats left next to the oldest group
+COMPOSITIONS = {
+    0: [()],
+    1: [(1,)],
+    2: [(2,), (1, 1)],
+    3: [(3,), (2, 1), (1, 1, 1)]
+}
+
+# Seats in the order they are filled, 0/2 and 1/3 are the teams
+SEAT_ORDER = [0, 2, 1, 3]
+
+
+class LobbyEntry:
+    """
+    A class to represent a group of clients waiting for a table (one client or a whole party)
+
+    ...
+
+    Attributes
+    ----------
+    clients : list[ClientData]
+        The clients of the group
+    joined : list[float]
+        The time every client of the group joined the lobby (time.monotonic)
+    ticket : int
+        The position in the lobby (lower tickets are seated first)
+    """
+    def __init__(self, clients: list[ClientData], joined: list[float], ticket: int):
+        """
+        Initialize a new entry of the lobby
+
+        Parameters
+        ----------
+        clients : list[ClientData]
+            The clients of the group
+        joined : list[float]
+            The time every client of the group joined the lobby
+        ticket : int
+            The position in the lobby
+        """
+        self.clients: list[ClientData] = clients
+        self.joined: list[float] = joined
+        self.ticket: int = ticket
+
+
+class Lobby:
+    """
+    A class to group the logged-in clients into tables of four
+
+    Clients are seated first come first served,
+    the clients of a party wait until the whole party joined and are seated at the same table
+    (a party of two plays in one team).
+    A table is formed when a client joins, nothing polls the waiting clients.
+
+    ...
+
+    Attributes
+    ----------
+    on_table : Callable[[list[ClientData]], Any]
+        Is called with the four clients of every new table (in seating order)
+    queues : dict[int, collections.deque[LobbyEntry]]
+        The waiting groups by their size
+    parties : dict[str, tuple[int, list[ClientData], list[float]]]
+        The parties that are not complete yet (size, clients, join times)
+    entries : dict[str, LobbyEntry]
+        The entry of every waiting client
+    waiting : int (default: 0)
+        The amount of clients that wait for a table (queue depth)
+    wait_times : collections.deque[float]
+        The time-to-table of the last seated clients in seconds
+    tables : int (default: 0)
+        The amount of tables formed
+
+    Methods
+    -------
+    join(client: ClientData, party: str | None = None, party_size: int = 1) -> None
+        Add a logged-in client to the lobby
+    leave(name: str) -> list[ClientData]
+        Remove a client (and its party) from the lobby
+    expire_party(party: str, clients: list[ClientData]) -> bool
+        Let the clients of a party that is still not complete wait alone
+    form_tables() -> None
+        Seat the waiting groups at new tables as long as possible
+    stats() -> dict[str, float]
+        Get the queue depth and the time-to-table of the last seated clients
+    """
+    def __init__(self, on_table: Callable[[list[ClientData]], Any], history: int = 10000):
+        """
+        Initialize a new empty lobby
+
+        Parameters
+        ----------
+        on_table : Callable[[list[ClientData]], Any]
+            Is called with the four clients of every new table
+        history : int (default: 10000)
+            How many time-to-table values are kept for the stats
+        """
+        self.on_table = on_table
+        self.queues: dict[int, deque[LobbyEntry]] = {size: deque() for size in range(1, TABLE_SIZE + 1)}
+        self.parties: dict[str, tuple[int, list[ClientData], list[float]]] = {}
+        self.entries: dict[str, LobbyEntry] = {}
+        self.waiting: int = 0
+        self.wait_times: deque[float] = deque(maxlen=history)
+        self.tables: int = 0
+        self._tickets: int = 0
+
+    def join(self, client: ClientData, party: str | None = None, party_size: int = 1) -> None:
+        """
+        Add a logged-in client to the lobby
+
+        Parameters
+        ----------
+        client : ClientData
+            The client that wants to play
+        party : str | None (default: None)
+            The id of the party of the client (None to play alone)
+        party_size : int (default: 1)
+            How many clients belong to the party (clamped to 1-4)
+
+        Returns
+        -------
+        None
+        """
+        now = time.monotonic()
+        self.waiting += 1
+        party_size = min(max(party_size, 1), TABLE_SIZE)
+        if party is None or party_size == 1:
+            self._enqueue([client], [now])
+        else:
+            size, clients, joined = self.parties.setdefault(party, (party_size, [], []))
+            clients.append(client)
+            joined.append(now)
+            if len(clients) < size:
+                return
+            del self.parties[party]
+            self._enqueue(clients, joined)
+
+        self.form_tables()
+
+    def leave(self, name: str) -> list[ClientData]:
+        """
+        Remove a client (and its party) from the lobby
+
+        Parameters
+        ----------
+        name : str
+            The name of the client that left
+
+        Returns
+        -------
+        list[ClientData] : The clients that are not waiting anymore
+        """
+        entry = self.entries.pop(name, None)
+        if entry is not None:
+            # Leaving is rare compared to joining, so the entry is searched in its queue
+            self.queues[len(entry.clients)].remove(entry)
+            for client in entry.clients:
+                self.entries.pop(client.name, None)
+            self.waiting -= len(entry.clients)
+            return entry.clients
+
+        for party, (size, clients, joined) in self.parties.items():
+            if any(client.name == name for client in clients):
+                del self.parties[party]
+                self.waiting -= len(clients)
+                return clients
+        return []
+
+    def expire_party(self, party: str, clients: list[ClientData]) -> bool:
+        """
+        Let the clients of a party that is still not complete wait alone
+        (the time-to-table still counts from the time they joined)
+
+        Parameters
+        ----------
+        party : str
+            The id of the party
+        clients : list[ClientData]
+            The clients of the party when it was started (a new party with the same id is not expired)
+
+        Returns
+        -------
+        bool : If the party was still waiting for clients
+        """
+        if party not in self.parties or self.parties[party][1] is not clients:
+            return False
+        size, clients, joined = self.parties.pop(party)
+        for client, time_joined in zip(clients, joined):
+            self._enqueue([client], [time_joined])
+        self.form_tables()
+        return True
+
+    def form_tables(self) -> None:
+        """
+        Seat the waiting groups at new tables as long as possible
+
+        The oldest group that can be completed to four clients is seated
+        together with the oldest groups that fill the remaining seats
+
+        Returns
+        -------
+        None
+        """
+        while True:
+            groups = self._next_table()
+            if groups is None:
+                return
+
+            now = time.monotonic()
+            players: list[ClientData] = []
+            # Bigger groups first, so a party of two gets the seats of one team
+            for entry in sorted(groups, key=lambda entry: -len(entry.clients)):
+                players.extend(entry.clients)
+                self.wait_times.extend(now - joined for joined in entry.joined)
+                for client in entry.clients:
+                    del self.entries[client.name]
+            self.waiting -= TABLE_SIZE
+            self.tables += 1
+
+            seats: list[ClientData] = [None] * TABLE_SIZE
+            for seat, client in zip(SEAT_ORDER, players):
+                seats[seat] = client
+            self.on_table(seats)
+
+    def stats(self) -> dict[str, float]:
+        """
+        Get the queue depth and the time-to-table of the last seated clients
+
+        Returns
+        -------
+        dict[str, float] : waiting, tables, and the mean, p50, p95 and max time-to-table in seconds
+        """
+        times = sorted(self.wait_times)
+        if not times:
+            return {"waiting": self.waiting, "tables": self.tables, "mean": 0.0, "p50": 0.0, "p95": 0.0, "max": 0.0}
+        return {
+            "waiting": self.waiting,
+            "tables": self.tables,
+            "mean": sum(times) / len(times),
+            "p50": times[len(times) // 2],
+            "p95": times[min(len(times) - 1, int(len(times) * 0.95))],
+            "max": times[-1]
+        }
+
+    def _enqueue(self, clients: list[ClientData], joined: list[float]) -> None:
+        entry = LobbyEntry(clients, joined, self._tickets)
+        self._tickets += 1
+        for client in clients:
+            self.entries[client.name] = entry
+        self.queues[len(clients)].append(entry)
+
+    def _head(self, size: int, skip: int = 0) -> LobbyEntry | None:
+        # The oldest waiting group of the size (after 'skip' groups)
+        queue = self.queues[size]
+        if len(queue) <= skip:
+            return None
+        return queue[skip]
+
+    def _next_table(self) -> list[LobbyEntry] | None:
+        # Try the oldest group of every size as the first group of the table, oldest first
+        anchors = [entry for entry in map(self._head, self.queues) if entry is not None]
+        for anchor in sorted(anchors, key=lambda entry: entry.ticket):
+            best = None
+            for composition in COMPOSITIONS[TABLE_SIZE - len(anchor.clients)]:
+                used = {size: 1 if size == len(anchor.clients) else 0 for size in self.queues}
+                groups = [anchor]
+                for size in composition:
+                    entry = self._head(size, used[size])
+                    if entry is None:
+                        break
+                    used[size] += 1
+                    groups.append(entry)
+                else:
+                    age = max(entry.ticket for entry in groups)
+                    if best is None or age < best[0]:
+                        best = (age, groups)
+            if best is not None:
+                for entry in best[1]:
+                    self.queues[len(entry.clients)].popleft()
+                return best[1]
+        return None
@@ -0,0 +1,259 @@
+import os
+import time
+import asyncio
+from typing import Any
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+from database import Database, valid_username
+from session import SessionTokens
+
+
+class LoginVerifier:
+    """
+    A class to check the passwords of the logins outside of the event loop
+
+    bcrypt takes 100-300ms per password on purpose, checked inline every table of the process would stop that long.
+    The password hash is read from the database in the calling thread (a fast indexed lookup),
+    only bcrypt.checkpw runs on a bounded thread pool (bcrypt releases the GIL, so the threads run in parallel).
+    At most 'workers' passwords are checked at once, the other logins wait in the queue of the pool.
+    If more than max_pending logins wait, new logins are refused right away instead of queueing without bound.
+    A login with a valid session token is accepted without the database and bcrypt.
+
+    ...
+
+    Attributes
+    ----------
+    db : Database
+        The database with the password hashes
+    workers : int
+        How many passwords are checked at once (the concurrency cap)
+    max_pending : int
+        How many logins may wait or be checked at once before new logins are refused
+    pool : ThreadPoolExecutor
+        The threads running bcrypt
+    sessions : SessionTokens | None
+        Checks the session tokens (None: every login needs the password)
+    pending : int (default: 0)
+        The amount of logins that wait or are checked right now
+    refused : int (default: 0)
+        The amount of logins refused because too many were pending
+    token_logins : int (default: 0)
+        The amount of logins accepted by their session token
+    latencies : collections.deque[float]
+        The seconds the last logins took (waiting in the queue included)
+
+    Methods
+    -------
+    verify(username: str, password: str, token: str | None = None) -> bool | None
+        Check the token or the password of a login without blocking the event loop
+    verify_blocking(username: str, password: str, token: str | None = None) -> bool | None
+        Check the token or the password of a login on the pool and wait for it (servers without an event loop)
+    stats() -> dict[str, float]
+        Get the pending logins and the latency percentiles of the last logins
+    close() -> None
+        Stop the threads of the pool
+    """
+    def __init__(self, db: Database, workers: int | None = None, max_pending: int = 1024, history: int = 10000,
+                 sessions: SessionTokens | None = None):
+        """
+        Initialize a new LoginVerifier
+
+        Parameters
+        ----------
+        db : Database
+            The database with the password hashes
+        workers : int | None (default: None)
+            How many passwords are checked at once (one per core if not given)
+        max_pending : int (default: 1024)
+            How many logins may wait or be checked at once before new logins are refused
+        history : int (default: 10000)
+            How many login latencies are kept for the stats
+        sessions : SessionTokens | None (default: None)
+            Checks the session tokens (None: every login needs the password)
+        """
+        self.db = db
+        self.workers: int = workers or os.cpu_count() or 1
+        self.max_pending = max_pending
+        self.pool: ThreadPoolExecutor = ThreadPoolExecutor(self.workers, thread_name_prefix="login")
+        self.sessions = sessions
+        self.pending: int = 0
+        self.refused: int = 0
+        self.token_logins: int = 0
+        self.latencies: deque[float] = deque(maxlen=history)
+
+    async def verify(self, username: str, password: str, token: str | None = None) -> bool | None:
+        """
+        Check the token or the password of a login without blocking the event loop
+
+        Parameters
+        ----------
+        username : str
+            The name of the user
+        password : str
+            The password the client sent
+        token : str | None (default: None)
+            The session token the client sent (the password is checked if it is not valid)
+
+        Returns
+        -------
+        bool | None : If the password is correct (None: too many logins are pending, try again later)
+        """
+        if not valid_username(username):
+            return False
+        if self._valid_token(username, token):
+            return True
+        hashed = self._hash(username, password)
+        if hashed is None:
+            return False
+        if self.pending >= self.max_pending:
+            self.refused += 1
+            return None
+
+        start_time = time.monotonic()
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.pool, bcrypt.checkpw, password.encode(), hashed)
+        finally:
+            self.pending -= 1
+            self.latencies.append(time.monotonic() - start_time)
+
+    def verify_blocking(self, username: str, password: str, token: str | None = None) -> bool | None:
+        """
+        Check the token or the password of a login on the pool and wait for it (servers without an event loop)
+
+        Parameters
+        ----------
+        username : str
+            The name of the user
+        password : str
+            The password the client sent
+        token : str | None (default: None)
+            The session token the client sent (the password is checked if it is not valid)
+
+        Returns
+        -------
+        bool | None : If the password is correct (None: too many logins are pending)
+        """
+        if not valid_username(username):
+            return False
+        if self._valid_token(username, token):
+            return True
+        hashed = self._hash(username, password)
+        if hashed is None:
+            return False
+        if self.pending >= self.max_pending:
+            self.refused += 1
+            return None
+
+        start_time = time.monotonic()
+        self.pending += 1
+        try:
+            return self.pool.submit(bcrypt.checkpw, password.encode(), hashed).result()
+        finally:
+            self.pending -= 1
+            self.latencies.append(time.monotonic() - start_time)
+
+    def stats(self) -> dict[str, float]:
+        """
+        Get the pending logins and the latency percentiles of the last logins
+
+        Returns
+        -------
+        dict[str, float] : pending, refused, tokens, logins, and the mean, p50, p95, p99 and max latency in seconds
+        (of the password checks, token logins take microseconds)
+        """
+        times = sorted(self.latencies)
+        stats = {"pending": self.pending, "refused": self.refused, "tokens": self.token_logins, "logins": len(times)}
+        if not times:
+            return {**stats, "mean": 0.0, "p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+        return {
+            **stats,
+            "mean": sum(times) / len(times),
+            "p50": times[len(times) // 2],
+            "p95": times[min(len(times) - 1, int(len(times) * 0.95))],
+            "p99": times[min(len(times) - 1, int(len(times) * 0.99))],
+            "max": times[-1]
+        }
+
+    def close(self) -> None:
+        """
+        Stop the threads of the pool (running checks are finished)
+
+        Returns
+        -------
+        None
+        """
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+    def _valid_token(self, username: str, token: str | None) -> bool:
+        # A valid session token replaces the password
+        if token is None or self.sessions is None or not self.sessions.verify(token, username):
+            return False
+        self.token_logins += 1
+        return True
+
+    def _hash(self, username: str, password: str) -> bytes | None:
+        # The hash of the user (None: unknown user or no password sent)
+        if not isinstance(username, str) or not isinstance(password, str):
+            return None
+        return self.db.password_hash(username)
+
+
+def valid_credentials(credentials: Any) -> bool:
+    """
+    Check the types of the login credentials a client sent before they are used
+
+    Parameters
+    ----------
+    credentials : any
+        The decoded json of the login
+
+    Returns
+    -------
+    bool : If the login is an object with a str "user", a str or missing "password" and "token"
+           and lists or missing "codecs" and "features"
+    """
+    if not isinstance(credentials, dict) or not isinstance(credentials.get("user"), str):
+        return False
+    return (all(isinstance(credentials.get(key), str | None) for key in ("password", "token"))
+            and all(isinstance(credentials.get(key), list | None) for key in ("codecs", "features")))
+
+
+if __name__ == '__main__':
+    # A login burst (e.g. after a restart) while a table waits for timers on the same event loop
+    AMOUNT = 64
+    COST = 10
+    hashed = bcrypt.hashpw(b"toasttoast1", bcrypt.gensalt(COST))
+
+    class BurstDatabase:
+        def password_hash(self, username: str) -> bytes:
+            return hashed
+
+    async def benchmark():
+        verifier = LoginVerifier(BurstDatabase())
+        stalls = []
+
+        async def table():
+            # A running table: how late are its timers while the logins are checked?
+            loop = asyncio.get_running_loop()
+            while True:
+                start = loop.time()
+                await asyncio.sleep(0.01)
+                stalls.append(loop.time() - start - 0.01)
+
+        ticker = asyncio.create_task(table())
+        start_time = time.perf_counter()
+        results = await asyncio.gather(*[verifier.verify(f"Player {i}", "toasttoast1") for i in range(AMOUNT)])
+        duration = time.perf_counter() - start_time
+        ticker.cancel()
+        verifier.close()
+
+        stats = verifier.stats()
+        print(f"[{'BENCHMARK':<10}] {AMOUNT} logins (bcrypt cost {COST}) on {verifier.workers} threads in {duration:.2f}s, "
+              f"{sum(map(bool, results))} accepted, latency p50 {stats['p50'] * 1000:.0f}ms p95 {stats['p95'] * 1000:.0f}ms "
+              f"p99 {stats['p99'] * 1000:.0f}ms, longest stall of the event loop {max(stalls) * 1000:.1f}ms")
+
+    asyncio.run(benchmark())
@@ -1,5 +1,93 @@
+import asyncio
+import argparse
+
 from game_logic import GameLogic
+from database import Database
+from async_network import AsyncNetworkServer
+from supervisor import Supervisor
+from protocol_trace import LEVELS, trace
+from engine import table_rng
+from replay_log import ReplayLog, PointRecorder
+from session import load_secret
+from history import HistoryWriter, TableHistory
+from leaderboard import Leaderboard
 
 if __name__ == '__main__':
-    game = GameLogic()
-    game.start_game_loop()
+    parser = argparse.ArgumentParser(description="The watten.py server")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="host as many tables as players connect in one process")
+    parser.add_argument("--workers", type=int, nargs="?", const=0, default=None,
+                        help="hand the tables to WORKERS processes (one per core if no number is given)")
+    parser.add_argument("--turn-timeout", type=float, default=30,
+                        help="seconds a player has to play a card before a card is played for them (0 to wait forever)")
+    parser.add_argument("--idle-timeout", type=float, default=180,
+                        help="seconds without a HEARTBEAT answer until a table is closed (0 to never close it)")
+    parser.add_argument("--trace", choices=LEVELS, default=None,
+                        help="errors: print the last frames of a failed connection, frames: print every frame")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="derive the deals of every table from this seed (the n-th table always gets the same deals)")
+    parser.add_argument("--replay-dir", default=None,
+                        help="append every deal, play and turn winner to a bit-packed replay log in this directory")
+    parser.add_argument("--bots", type=float, default=None, metavar="SECONDS",
+                        help="fill the free seats with bots after a player waited SECONDS (--async/--workers only)")
+    parser.add_argument("--bot-budget", type=float, default=0.5,
+                        help="seconds a bot thinks about one card")
+    parser.add_argument("--checkpoint-dir", default=None,
+                        help="snapshot the running tables into this directory and resume the tables found there "
+                             "when their players log in again (--async/--workers only)")
+    parser.add_argument("--checkpoint-interval", type=float, default=5,
+                        help="seconds between two checkpoints")
+    parser.add_argument("--login-workers", type=int, default=None,
+                        help="passwords checked at once (one per core if not given, --async/--workers only)")
+    parser.add_argument("--max-pending-logins", type=int, default=1024,
+                        help="logins waiting for their password check before new logins are refused as busy")
+    parser.add_argument("--session-secret", default=None, metavar="FILE",
+                        help="read the key of the session tokens from FILE (created if missing), "
+                             "so the tokens stay valid after a restart (--async/--workers only)")
+    parser.add_argument("--session-lifetime", type=float, default=12 * 60 * 60,
+                        help="seconds a session token is valid")
+    parser.add_argument("--history-queue", type=int, default=10000,
+                        help="history records (games, rounds, ratings, points, turns) that may wait for the database "
+                             "before new ones are dropped (0 to store neither the history nor the ratings)")
+    parser.add_argument("--party-timeout", type=float, default=120,
+                        help="seconds a party waits for its missing players until they wait alone (--async/--workers only)")
+    args = parser.parse_args()
+    if args.trace is not None:
+        trace.configure(args.trace)
+    try:
+        session_secret = load_secret(args.session_secret) if args.session_secret else None
+    except ValueError as e:
+        parser.error(str(e))
+    server_options = {"turn_timeout": args.turn_timeout or None, "idle_timeout": args.idle_timeout or None, "seed": args.seed,
+                      "replay_dir": args.replay_dir, "bot_delay": args.bots, "bot_budget": args.bot_budget,
+                      "checkpoint_dir": args.checkpoint_dir, "checkpoint_interval": args.checkpoint_interval,
+                      "login_workers": args.login_workers, "max_pending_logins": args.max_pending_logins,
+                      "session_secret": session_secret,
+                      "session_lifetime": args.session_lifetime, "history_queue": args.history_queue,
+                      "party_timeout": args.party_timeout}
+
+    if args.workers is not None:
+        # The supervisor runs the lobby, the tables are played in the worker processes
+        server = Supervisor(Database(), workers=args.workers or None, **server_options)
+        server.start_workers()
+        asyncio.run(server.serve_forever())
+    elif args.use_async:
+        # One process hosts as many tables as players connect
+        server = AsyncNetworkServer(Database(), **server_options)
+        asyncio.run(server.serve_forever())
+    else:
+        db = Database()
+        replay_log = ReplayLog(args.replay_dir) if args.replay_dir else None
+        leaderboard = Leaderboard(db)
+        history = HistoryWriter(db, args.history_queue, leaderboard=leaderboard) if args.history_queue else None
+        game = GameLogic(db=db, rng=table_rng(args.seed, 1), recorder=PointRecorder(replay_log, 1) if replay_log else None,
+                         history=TableHistory(history, 1) if history else None, leaderboard=leaderboard)
+        try:
+            game.start_game_loop()
+        finally:
+            if replay_log is not None:
+                game.engine.recorder.finish_point()
+                replay_log.close()
+            if history is not None:
+                game.history.finish()
+                history.close()
@@ -1,7 +1,7 @@
 import random
-import queue
 
-from typing import Union
+from itertools import islice
+from typing import Union, Iterator
 from enum import Enum
 
 from cards_utils import *
@@ -30,6 +30,9 @@ class CardBase:
     """
     A class to represent a Card
 
+    There is only one immutable instance of every card (flyweight),
+    CardBase(card_id) and new_card return the shared instance
+
     Color-Code:
      0 - Schell
      1 - Herz
@@ -53,6 +56,10 @@ class CardBase:
     ----------
     card_id : int
         The ID of the Card this object represents
+    color : int
+        The color of the card (the same as col())
+    number : int
+        The number of the card (the same as num())
 
     Methods
     -------
@@ -67,16 +74,31 @@ class CardBase:
     new_card(col: int, num: int) -> CardBase
         Get a new Card with the given number and Color
     """
-    def __init__(self, card_id: int):
+    __slots__ = ("card_id", "color", "number")
+
+    def __new__(cls, card_id: int) -> "CardBase":
         """
-        The initialization of a Card to represent a Playing-Card
+        Get the shared instance of a Card to represent a Playing-Card
 
         Parameters
         ----------
         card_id : int
-            The ID of the Card
+            The ID of the Card (0-32, -1 for no card)
         """
-        self.card_id: int = card_id
+        card = _CARDS.get(card_id)
+        if card is None:
+            raise ValueError(f"There is no card with the ID {card_id!r}")
+        return card
+
+    def __setattr__(self, name: str, value: object) -> None:
+        raise AttributeError("CardBase is immutable")
+
+    def __delattr__(self, name: str) -> None:
+        raise AttributeError("CardBase is immutable")
+
+    def __reduce__(self) -> tuple:
+        # Unpickled and copied cards are the shared instances as well
+        return CardBase, (self.card_id,)
 
     def __int__(self) -> int:
         """
@@ -113,15 +135,9 @@ class CardBase:
         bool : If the cards have the same color
         """
         if isinstance(other, CardBase):
-            if math.floor(self.col()) == math.floor(other.col()):
-                return True
-            else:
-                return False
+            return self.color == other.color
         elif isinstance(other, int):
-            if math.floor(self.card_id / 8) == math.floor(other / 8):
-                return True
-            else:
-                return False
+            return self.card_id // 8 == other // 8
         else:
             raise NotImplementedError
 
@@ -139,15 +155,9 @@ class CardBase:
         bool : If the cards have the same color
         """
         if isinstance(other, CardBase):
-            if math.floor(self.col()) != math.floor(other.col()):
-                return True
-            else:
-                return False
+            return self.color != other.color
         elif isinstance(other, int):
-            if math.floor(self.card_id / 8) != math.floor(other / 8):
-                return True
-            else:
-                return False
+            return self.card_id // 8 != other // 8
         else:
             raise NotImplementedError
 
@@ -168,12 +178,7 @@ class CardBase:
         bool : If other card beats the given card
         """
         if isinstance(other, CardBase):
-            if other == self:
-                if (self.num()) > (other.num()):
-                    return True
-                else:
-                    return False
-            return False
+            return self.color == other.color and self.number > other.number
 
     def __lt__(self, other: "CardBase") -> bool:
         """
@@ -192,47 +197,32 @@ class CardBase:
         bool : If other card doesn't beat the given card
         """
         if isinstance(other, CardBase):
-            if other == self:
-                if (self.num()) < (other.num()):
-                    return True
-                else:
-                    return False
-            return False
+            return self.color == other.color and self.number < other.number
 
     def col(self) -> int:
         """
-        Resolve the Color of the given card
+        Resolve the Color of the given card (precomputed)
 
         Returns
         -------
         int : The Color of the Card
         """
-        if self.card_id == -1:
-            return -1
-        elif self.card_id == 32:
-            return 1
-        else:
-            return math.floor(int(self.card_id)/8) + 1
+        return self.color
 
     def num(self) -> int:
         """
-        Resolve the Number of the given card
+        Resolve the Number of the given card (precomputed)
 
         Returns
         -------
         int : The Number of the Card
         """
-        if self.card_id == -1:
-            return -1
-        elif self.card_id == 32:
-            return 0
-        else:
-            return (int(self.card_id) % 8) + 1
+        return self.number
 
     @classmethod
     def new_card(cls, col: int | CardColor, num: int | CardNumber) -> "CardBase":
         """
-        Get a new card with the given color and number
+        Get the card with the given color and number (the shared instance)
 
         Parameters
         ----------
@@ -254,18 +244,35 @@ class CardBase:
             return cls((col - 1) * 8 + num - 1)
 
 
+def _create_card(card_id: int) -> CardBase:
+    # The only place a CardBase is allocated, the attributes are set past the immutable __setattr__
+    card = object.__new__(CardBase)
+    object.__setattr__(card, "card_id", card_id)
+    object.__setattr__(card, "color", CARD_COLORS[card_id])
+    object.__setattr__(card, "number", CARD_NUMBERS[card_id])
+    return card
+
+
+_CARDS: dict[int, CardBase] = {card_id: _create_card(card_id) for card_id in range(-1, CARD_AMOUNT)}
+# Every card of a dek in the order of the ids
+ALL_CARDS: tuple[CardBase, ...] = tuple(_CARDS[card_id] for card_id in range(CARD_AMOUNT))
+
+
 class CardDek:
     """
     A class to represent a CardDek
 
+    The cards are kept in one list and dealt from a cursor,
+    so dealing k cards is O(k) without locks or copies of the dek
+
     ...
 
     Attributes
     ----------
     cards : list[CardBase]
-        A list of all the cards in the dek
-    cards_queue : queue.Queue
-        A queue of all the cards in the dek (necessary to deal the top cards)
+        A list of all the cards in the dek (in the order they are dealt)
+    position : int (default: 0)
+        The index of the next card to deal (the cards before were dealt already)
 
     Methods
     -------
@@ -274,12 +281,12 @@ class CardDek:
 
     StaticMethods
     -------------
-    mix(cards: list[CardBase]) -> list[CardBase]
+    mix(cards: list[CardBase], rng: random.Random | None = None) -> list[CardBase]
         Mix a dek of cards and return the list
 
     ClassMethods
     ------------
-    get_mixed_dek() -> CardDek
+    get_mixed_dek(rng: random.Random | None = None) -> CardDek
         Get a new mixed dek of cards
     """
     def __init__(self, cards: list[CardBase]):
@@ -289,9 +296,7 @@ class CardDek:
         :param cards: The list of cards a Dek includes
         """
         self.cards: list[CardBase] = cards
-        self.cards_queue: queue.Queue = queue.Queue()
-        for card in cards:
-            self.cards_queue.put(card)
+        self.position: int = 0
 
     def __repr__(self) -> str:
         """
@@ -301,21 +306,21 @@ class CardDek:
         -------
             str: The representation of the card dek
         """
-        return f"<CardDek cards=len({len(self.cards)})>"
+        return f"<CardDek cards=len({len(self)})>"
 
-    def __iter__(self) -> list:
+    def __iter__(self) -> Iterator[CardBase]:
         """
-        Get the list of the Cards as an iterable
+        Iterate over the cards that were not dealt yet
 
         Returns
         -------
-            list[CardBase]: The current cards of the player
+            Iterator[CardBase]: The remaining cards of the dek
         """
-        return self.cards
+        return islice(self.cards, self.position, None)
 
     def __getitem__(self, item: int) -> CardBase:
         """
-        Get the 'item' list of the cards list
+        Get the 'item' card of the cards that were not dealt yet
 
         Parameters
         ----------
@@ -326,17 +331,21 @@ class CardDek:
         -------
             CardBase: The card you wanted to get
         """
-        return self.cards[item]
+        if item < 0:
+            item += len(self)
+        if not 0 <= item < len(self):
+            raise IndexError("CardDek index out of range")
+        return self.cards[self.position + item]
 
     def __len__(self) -> int:
         """
-        Get the length of the cards list
+        Get the amount of cards that were not dealt yet
 
         Returns
         -------
-            int: The length of the cards list
+            int: The amount of remaining cards
         """
-        return len(self.cards)
+        return len(self.cards) - self.position
 
     def deal_top_card(self, cards=1) -> list[CardBase]:
         """
@@ -352,14 +361,15 @@ class CardDek:
         -------
             list[CardBase]: The cards that were delt
         """
-        tc = []
-        for i in range(cards):
-            tc.append(self.cards_queue.get())
-        self.cards = self.cards[cards:]
+        end = self.position + cards
+        if end > len(self.cards):
+            raise ValueError(f"Only {len(self)} cards are left in the dek")
+        tc = self.cards[self.position:end]
+        self.position = end
         return tc
 
     @staticmethod
-    def mix(cards: list[CardBase]) -> list[CardBase]:
+    def mix(cards: list[CardBase], rng: random.Random | None = None) -> list[CardBase]:
         """
         Mix the current dek of cards
 
@@ -367,22 +377,29 @@ class CardDek:
         ----------
         cards: list[CardBase]
             The dek of cards to mix
+        rng: random.Random | None (default: None)
+            The random generator to mix with (the global one if not given)
 
         Returns
         -------
             list[CardBase] : The mixed card dek
         """
-        random.shuffle(cards)
+        (rng or random).shuffle(cards)
         return cards
 
     @classmethod
-    def get_mixed_dek(cls):
+    def get_mixed_dek(cls, rng: random.Random | None = None):
         """
         Returns mixed Card Dek
 
+        Parameters
+        ----------
+        rng: random.Random | None (default: None)
+            The random generator to mix with (a seeded one makes the deals reproducible)
+
         Returns
         -------
             CardDek: Mixed card Dek
         """
-        cards = cls.mix([CardBase(i) for i in range(33)])
+        cards = cls.mix(list(ALL_CARDS), rng)
         return cls(cards=cards)
@@ -1,6 +1,10 @@
+import json
 import socket
+import asyncio
+from typing import Any
 
-from models.cards import CardDek, CardBase
+from models.cards import CardDek, CardBase, ALL_CARDS
+from cards_utils import CARD_MASKS, mask_ids
 
 
 class GameData:
@@ -40,6 +44,8 @@ class GameData:
     -------
     mixed_dek():
         Receive a new mixed dek of cards and overwrite the old one
+    public_state() -> dict[str, any]
+        The state every player is allowed to see as a flat dict
     """
     def __init__(self):
         """
@@ -79,6 +85,21 @@ class GameData:
         """
         self.card_dek = CardDek.get_mixed_dek()
 
+    def public_state(self) -> dict[str, Any]:
+        """
+        The state every player is allowed to see as a flat dict
+        ("played", "team1.player", "team1.points", ...)
+
+        Returns
+        -------
+        dict[str, any] : The public state of the table
+        """
+        state: dict[str, Any] = {"played": list(map(int, self.played_cards))}
+        for name, team in (("team1", self.team1), ("team2", self.team2)):
+            for key, value in team.items():
+                state[f"{name}.{key}"] = list(value) if isinstance(value, list) else value
+        return state
+
 
 class PlayerData:
     """
@@ -90,8 +111,16 @@ class PlayerData:
     ----------
     name : str
         The name of the Player
+    hand : int (default: 0)
+        The current cards of the player as a bit mask (bit i is set if the player has the card with the ID i)
     cards : list[CardBase] (default: [])
-        The list of the current cards of the player
+        The current cards of the player ordered by their ID (read from and written to hand,
+        every read is a new list: changing it does not change the hand, assign a new list instead)
+
+    Methods
+    -------
+    dealt_cards(dek: CardDek) -> list[int]
+        The IDs of the current cards of the player in the order they were dealt
     """
     def __init__(self, name: str):
         """
@@ -103,7 +132,55 @@ class PlayerData:
                 the name of the player
         """
         self.name: str = name
-        self.cards: list[CardBase] | None = []
+        self.hand: int = 0
+
+    @property
+    def cards(self) -> list[CardBase]:
+        """
+        The current cards of the player ordered by their ID
+        (a new list, changing it does not change the hand, assign a new list instead)
+
+        Returns
+        -------
+        list[CardBase] : The cards of the hand
+        """
+        return [ALL_CARDS[card_id] for card_id in mask_ids(self.hand)]
+
+    @cards.setter
+    def cards(self, cards: list[CardBase]) -> None:
+        """
+        Replace the cards of the player
+
+        Parameters
+        ----------
+        cards : list[CardBase]
+            The new cards of the player
+
+        Returns
+        -------
+        None
+        """
+        hand = 0
+        for card in cards:
+            hand |= CARD_MASKS[card.card_id]
+        self.hand = hand
+
+    def dealt_cards(self, dek: CardDek) -> list[int]:
+        """
+        The IDs of the current cards of the player in the order they were dealt (like NEW_CARD sent them)
+
+        Parameters
+        ----------
+        dek : CardDek
+            The dek the cards were dealt from
+
+        Returns
+        -------
+        list[int] : The IDs of the cards of the hand
+        """
+        # The cards are dealt from the top of the dek, so the dealt order is the order in the dek
+        position = {card.card_id: index for index, card in enumerate(dek.cards)}
+        return sorted(mask_ids(self.hand), key=position.__getitem__)
 
 
 class ClientData:
@@ -120,13 +197,26 @@ class ClientData:
         The connection to the Client
     addr : tuple[str, int] (default: None)
         The address the connection was established to (client side)
+    reader : asyncio.StreamReader (default: None)
+        The stream to read from the Client (asyncio server only)
+    writer : asyncio.StreamWriter (default: None)
+        The stream to write to the Client (asyncio server only)
+    encoded_name : bytes
+        The name as encoded json string (spliced into broadcasts as the "to" value)
+    codec : str (default: "json")
+        The codec negotiated at the login ("json" or "binary")
+    features : list[str] (default: [])
+        The protocol features negotiated at the login (e.g. "delta")
 
     ClassMethod
     -----------
     new_conn(name: str, conn: socket.socket, addr: tuple[str, int]) -> ClientData
         Create a new Data object using the given parameters
+    new_stream(name: str, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> ClientData
+        Create a new Data object for a connection of the asyncio server
     """
-    def __init__(self, name: str, conn: socket.socket = None, addr: tuple[str, int] = None):
+    def __init__(self, name: str, conn: socket.socket = None, addr: tuple[str, int] = None,
+                 reader: asyncio.StreamReader = None, writer: asyncio.StreamWriter = None):
         """
         Initialize all necessary attributes for the client object
 
@@ -138,10 +228,19 @@ class ClientData:
             The connection to the Client
         addr : tuple[str, int] (default: None)
             The address the connection was established to (client side)
+        reader : asyncio.StreamReader (default: None)
+            The stream to read from the Client
+        writer : asyncio.StreamWriter (default: None)
+            The stream to write to the Client
         """
         self.name: str = name
         self.conn: socket.socket | None = conn
         self.addr: tuple[str, int] | None = addr
+        self.reader: asyncio.StreamReader | None = reader
+        self.writer: asyncio.StreamWriter | None = writer
+        self.encoded_name: bytes = json.dumps(name).encode("utf-8")
+        self.codec: str = "json"
+        self.features: list[str] = []
 
     @classmethod
     def new_conn(cls, name: str, conn: socket.socket, addr: tuple[str, int]) -> "ClientData":
@@ -166,3 +265,29 @@ class ClientData:
             conn,
             addr
         )
+
+    @classmethod
+    def new_stream(cls, name: str, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> "ClientData":
+        """
+        A new connection was accepted by the asyncio server and the streams are saved in this object
+
+        Parameters
+        ----------
+        name : str
+            The name of the Client
+        reader : asyncio.StreamReader
+            The stream to read from the Client
+        writer : asyncio.StreamWriter
+            The stream to write to the Client
+
+        Returns
+        -------
+        ClientData : The new ClientData object
+        """
+        return cls(
+            name,
+            None,
+            writer.get_extra_info("peername"),
+            reader,
+            writer
+        )
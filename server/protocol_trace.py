@@ -0,0 +1,200 @@
+import os
+import struct
+from collections import deque
+
+from codec import decode
+
+# The same module is used by the client (client/protocol_trace.py), keep both copies equal
+
+# OFF: nothing is recorded, ERRORS: the last frames of a connection are dumped when it fails, FRAMES: every frame is printed
+OFF = 0
+ERRORS = 1
+FRAMES = 2
+LEVELS = {"off": OFF, "errors": ERRORS, "frames": FRAMES}
+
+SENT = "SENDING"
+RECEIVED = "RECEIVED"
+EVENT = "EVENT"
+
+
+class ProtocolTrace:
+    """
+    A class to trace the frames sent and received on every connection
+
+    Tracing is off by default, the call sites check 'level' first,
+    so a disabled trace does not format, copy or store anything.
+    When enabled the frames are only stored (as the bytes that were sent),
+    they are formatted when they are printed or a connection is dumped.
+
+    ...
+
+    Attributes
+    ----------
+    level : int (default: OFF)
+        OFF, ERRORS or FRAMES
+    history : int (default: 32)
+        How many frames are kept per connection
+    rings : dict[str, collections.deque[tuple[str, bytes | tuple[bytes, ...] | str]]]
+        The last frames and events of every connection (direction or EVENT, data or message)
+
+    Methods
+    -------
+    configure(level: int | str, history: int | None = None) -> None
+        Change the level (and the history) of the trace
+    frame(connection: str, direction: str, data: bytes | tuple[bytes, ...]) -> None
+        Record a frame of a connection
+    event(connection: str, message: str) -> None
+        Record something that happened to a connection besides its frames (e.g. a turn timeout)
+    dump(connection: str, reason: object = None) -> None
+        Print the last frames of a connection
+    forget(connection: str) -> None
+        Drop the frames of a closed connection
+    """
+    def __init__(self, level: int | str = OFF, history: int = 32):
+        """
+        Initialize a new trace
+
+        Parameters
+        ----------
+        level : int | str (default: OFF)
+            OFF, ERRORS or FRAMES (or their names)
+        history : int (default: 32)
+            How many frames are kept per connection
+        """
+        self.level: int = OFF
+        self.history: int = history
+        self.rings: dict[str, deque[tuple[str, bytes | tuple[bytes, ...] | str]]] = {}
+        self.configure(level)
+
+    def configure(self, level: int | str, history: int | None = None) -> None:
+        """
+        Change the level (and the history) of the trace
+
+        Parameters
+        ----------
+        level : int | str
+            OFF, ERRORS or FRAMES (or their names "off", "errors", "frames")
+        history : int | None (default: None)
+            How many frames are kept per connection (None: keep the current history)
+
+        Returns
+        -------
+        None
+        """
+        self.level = LEVELS[level.lower()] if isinstance(level, str) else level
+        if history is not None:
+            self.history = history
+        self.rings.clear()
+
+    def frame(self, connection: str, direction: str, data: bytes | tuple[bytes, ...]) -> None:
+        """
+        Record a frame of a connection (only call it if 'level' is not OFF)
+
+        Parameters
+        ----------
+        connection : str
+            The name of the client
+        direction : str
+            SENT or RECEIVED
+        data : bytes | tuple[bytes, ...]
+            The data of the frame (a broadcast is passed as its parts)
+
+        Returns
+        -------
+        None
+        """
+        ring = self.rings.get(connection)
+        if ring is None:
+            ring = self.rings[connection] = deque(maxlen=self.history)
+        ring.append((direction, data))
+        if self.level >= FRAMES:
+            print(f"[{direction:<10}] {connection}: {format_frame(data, connection)}")
+
+    def event(self, connection: str, message: str) -> None:
+        """
+        Record something that happened to a connection besides its frames, e.g. a turn timeout
+        (only call it if 'level' is not OFF)
+
+        Parameters
+        ----------
+        connection : str
+            The name of the client
+        message : str
+            What happened
+
+        Returns
+        -------
+        None
+        """
+        ring = self.rings.get(connection)
+        if ring is None:
+            ring = self.rings[connection] = deque(maxlen=self.history)
+        ring.append((EVENT, message))
+        if self.level >= FRAMES:
+            print(f"[{EVENT:<10}] {connection}: {message}")
+
+    def dump(self, connection: str, reason: object = None) -> None:
+        """
+        Print the last frames of a connection (e.g. when it failed)
+
+        Parameters
+        ----------
+        connection : str
+            The name of the client
+        reason : object (default: None)
+            Why the frames are dumped
+
+        Returns
+        -------
+        None
+        """
+        ring = self.rings.get(connection)
+        if self.level < ERRORS or not ring:
+            return
+        print(f"[{'TRACE':<10}] Last {len(ring)} frames of {connection} ({reason!r})")
+        for direction, data in ring:
+            print(f"[{direction:<10}] {format_frame(data, connection)}")
+
+    def forget(self, connection: str) -> None:
+        """
+        Drop the frames of a closed connection
+
+        Parameters
+        ----------
+        connection : str
+            The name of the client
+
+        Returns
+        -------
+        None
+        """
+        self.rings.pop(connection, None)
+
+
+def format_frame(data: bytes | tuple[bytes, ...] | str, connection: str) -> str:
+    """
+    Format a recorded frame to a readable command
+
+    Parameters
+    ----------
+    data : bytes | tuple[bytes, ...] | str
+        The data of the frame (or its parts, or the message of an event)
+    connection : str
+        The name of the client (binary commands do not contain it)
+
+    Returns
+    -------
+    str : The command (or the raw bytes if it can not be decoded)
+    """
+    if isinstance(data, str):
+        return data
+    if isinstance(data, tuple):
+        data = b"".join(data)
+    try:
+        return str(decode(data, connection))
+    except (ValueError, KeyError, IndexError, struct.error):
+        return repr(data)
+
+
+# The trace of this process (WATTEN_TRACE=errors|frames enables it without changing the code)
+trace = ProtocolTrace(LEVELS.get(os.environ.get("WATTEN_TRACE", "off").lower(), OFF))
@@ -0,0 +1,553 @@
+import os
+import time
+import random
+import struct
+import asyncio
+from typing import Iterator
+
+from models import GameData, CardDek
+from models.cards import ALL_CARDS
+from engine import GameEngine, DEAL, table_rng, play_random_round
+from server_utils import check_winner, np, check_winner_batch
+
+# Every record: type, number of the table, length of the data
+RECORD_HEADER = struct.Struct(">BIH")
+TABLE_RECORD = 1
+POINT_RECORD = 2
+
+SEATS = 4
+HAND_SIZE = 5
+CARD_BITS = 6
+SEAT_BITS = 2
+COUNT_BITS = 5
+
+
+class PointRecord:
+    """
+    A class to represent one point of a table in the replay log
+
+    Bit layout of the data (least significant bits first):
+    first seat (2 bits), highest card (6), amount of plays (5),
+    the 20 dealt cards in dealing order of the players (6 each, 5 per player),
+    the played cards (6 each) and the seat that won every complete turn (2 each)
+
+    ...
+
+    Attributes
+    ----------
+    first_seat : int
+        The seat of the player that played first in the point
+    highest : int
+        The id of the highest card
+    hands : list[list[int]]
+        The five cards dealt to every player (in the order the players play, starting with first_seat)
+    plays : list[int]
+        The played cards in the order they were played
+    winners : list[int]
+        The seat that won every complete turn
+
+    Methods
+    -------
+    pack() -> bytes
+        The bit-packed data of the record
+
+    ClassMethods
+    ------------
+    unpack(data: bytes) -> PointRecord
+        Read a record from its bit-packed data
+    """
+    __slots__ = ("first_seat", "highest", "hands", "plays", "winners")
+
+    def __init__(self, first_seat: int, highest: int, hands: list[list[int]], plays: list[int], winners: list[int]):
+        """
+        Initialize a new record of a point
+
+        Parameters
+        ----------
+        first_seat : int
+            The seat of the player that played first in the point
+        highest : int
+            The id of the highest card
+        hands : list[list[int]]
+            The five cards dealt to every player
+        plays : list[int]
+            The played cards in the order they were played
+        winners : list[int]
+            The seat that won every complete turn
+        """
+        self.first_seat = first_seat
+        self.highest = highest
+        self.hands = hands
+        self.plays = plays
+        self.winners = winners
+
+    def pack(self) -> bytes:
+        """
+        The bit-packed data of the record
+
+        Returns
+        -------
+        bytes : The data (33 bytes for a whole point)
+        """
+        value = self.first_seat | self.highest << SEAT_BITS | len(self.plays) << (SEAT_BITS + CARD_BITS)
+        shift = SEAT_BITS + CARD_BITS + COUNT_BITS
+        for hand in self.hands:
+            for card in hand:
+                value |= card << shift
+                shift += CARD_BITS
+        for card in self.plays:
+            value |= card << shift
+            shift += CARD_BITS
+        for seat in self.winners:
+            value |= seat << shift
+            shift += SEAT_BITS
+        return value.to_bytes((shift + 7) // 8, "little")
+
+    @classmethod
+    def unpack(cls, data: bytes) -> "PointRecord":
+        """
+        Read a record from its bit-packed data
+
+        Parameters
+        ----------
+        data : bytes
+            The data of the record
+
+        Returns
+        -------
+        PointRecord : The record
+        """
+        value = int.from_bytes(data, "little")
+        first_seat = value & 0b11
+        highest = value >> SEAT_BITS & 0b111111
+        amount = value >> (SEAT_BITS + CARD_BITS) & 0b11111
+        value >>= SEAT_BITS + CARD_BITS + COUNT_BITS
+
+        cards = []
+        for i in range(SEATS * HAND_SIZE + amount):
+            cards.append(value & 0b111111)
+            value >>= CARD_BITS
+        winners = []
+        for i in range(amount // SEATS):
+            winners.append(value & 0b11)
+            value >>= SEAT_BITS
+
+        hands = [cards[seat * HAND_SIZE:(seat + 1) * HAND_SIZE] for seat in range(SEATS)]
+        return cls(first_seat, highest, hands, cards[SEATS * HAND_SIZE:], winners)
+
+
+class ReplayLog:
+    """
+    A class to append the records of every table of this process to one log file
+
+    The records are collected in a buffer and written in batches,
+    the file is opened on the first write, so every forked worker writes its own log
+
+    ...
+
+    Attributes
+    ----------
+    directory : str
+        The directory of the log files
+    batch_size : int (default: 65536)
+        The buffer is written to the file when it is bigger than this many bytes
+    buffer : bytearray
+        The records that were not written yet
+    file : BinaryIO | None (default: None)
+        The log file of this process (None until the first write)
+
+    Methods
+    -------
+    append(kind: int, table: int, data: bytes) -> None
+        Add a record to the log
+    flush() -> None
+        Write the buffered records to the file
+    close() -> None
+        Write the buffered records and close the file
+    run(interval: float = 5) -> None
+        Flush the log every interval seconds inside the event loop
+    """
+    def __init__(self, directory: str, batch_size: int = 65536):
+        """
+        Initialize a new replay log
+
+        Parameters
+        ----------
+        directory : str
+            The directory of the log files
+        batch_size : int (default: 65536)
+            The buffer is written to the file when it is bigger than this many bytes
+        """
+        self.directory = directory
+        self.batch_size = batch_size
+        self.buffer = bytearray()
+        self.file = None
+
+    def append(self, kind: int, table: int, data: bytes) -> None:
+        """
+        Add a record to the log
+
+        Parameters
+        ----------
+        kind : int
+            TABLE_RECORD or POINT_RECORD
+        table : int
+            The number of the table
+        data : bytes
+            The data of the record
+
+        Returns
+        -------
+        None
+        """
+        self.buffer += RECORD_HEADER.pack(kind, table, len(data))
+        self.buffer += data
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Write the buffered records to the file
+
+        Returns
+        -------
+        None
+        """
+        if not self.buffer:
+            return
+        if self.file is None:
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, f"replay-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.wlog")
+            self.file = open(path, "ab")
+        self.file.write(self.buffer)
+        self.file.flush()
+        self.buffer.clear()
+
+    def close(self) -> None:
+        """
+        Write the buffered records and close the file
+
+        Returns
+        -------
+        None
+        """
+        self.flush()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    async def run(self, interval: float = 5) -> None:
+        """
+        Flush the log every interval seconds inside the event loop
+
+        Parameters
+        ----------
+        interval : float (default: 5)
+            The seconds between two flushes
+
+        Returns
+        -------
+        None
+        """
+        while True:
+            await asyncio.sleep(interval)
+            self.flush()
+
+
+class PointRecorder:
+    """
+    A class to record the points of one table (the recorder of a GameEngine)
+
+    ...
+
+    Attributes
+    ----------
+    log : ReplayLog
+        The log the records are appended to
+    table : int
+        The number of the table
+    seats : list[str]
+        The names of the players in the order they were seated
+    point : PointRecord | None
+        The point that is currently played
+
+    Methods
+    -------
+    seat(players: list[str]) -> None
+        Record the players of the table
+    deal(loop: list[str], dealt: dict[str, list[CardBase]], highest: int) -> None
+        Start the record of a new point
+    play(card: int) -> None
+        Record a played card
+    turn(winner: str) -> None
+        Record the winner of a turn
+    finish_point() -> None
+        Append the record of the point to the log
+    """
+    def __init__(self, log: ReplayLog, table: int):
+        """
+        Initialize a new recorder of a table
+
+        Parameters
+        ----------
+        log : ReplayLog
+            The log the records are appended to
+        table : int
+            The number of the table
+        """
+        self.log = log
+        self.table = table
+        self.seats: list[str] = []
+        self.point: PointRecord | None = None
+
+    def seat(self, players: list[str]) -> None:
+        """
+        Record the players of the table
+
+        Parameters
+        ----------
+        players : list[str]
+            The names of the players in the order they were seated
+
+        Returns
+        -------
+        None
+        """
+        self.seats = list(players)
+        self.log.append(TABLE_RECORD, self.table, "\0".join(players).encode("utf-8"))
+
+    def deal(self, loop: list[str], dealt: dict, highest: int) -> None:
+        """
+        Start the record of a new point
+
+        Parameters
+        ----------
+        loop : list[str]
+            The players in the order they play
+        dealt : dict[str, list[CardBase]]
+            The cards dealt to every player (in dealing order)
+        highest : int
+            The id of the highest card
+
+        Returns
+        -------
+        None
+        """
+        self.point = PointRecord(self.seats.index(loop[0]), highest,
+                                 [list(map(int, dealt[player])) for player in loop], [], [])
+
+    def play(self, card: int) -> None:
+        """
+        Record a played card (not for a point restored from a snapshot, its deal is unknown)
+
+        Parameters
+        ----------
+        card : int
+            The id of the card
+
+        Returns
+        -------
+        None
+        """
+        if self.point is not None:
+            self.point.plays.append(card)
+
+    def turn(self, winner: str) -> None:
+        """
+        Record the winner of a turn
+
+        Parameters
+        ----------
+        winner : str
+            The name of the player that won the turn
+
+        Returns
+        -------
+        None
+        """
+        if self.point is not None:
+            self.point.winners.append(self.seats.index(winner))
+
+    def finish_point(self) -> None:
+        """
+        Append the record of the point to the log (also a point that was not finished)
+
+        Returns
+        -------
+        None
+        """
+        if self.point is not None:
+            self.log.append(POINT_RECORD, self.table, self.point.pack())
+            self.point = None
+
+
+def read_log(path: str) -> Iterator[tuple[int, int, list[str] | PointRecord]]:
+    """
+    Read every record of a log file
+
+    Parameters
+    ----------
+    path : str
+        The path of the log file
+
+    Returns
+    -------
+    Iterator[tuple[int, int, list[str] | PointRecord]] : The type, the table and the players or the point of every record
+    """
+    with open(path, "rb") as file:
+        data = file.read()
+    position = 0
+    while position + RECORD_HEADER.size <= len(data):
+        kind, table, length = RECORD_HEADER.unpack_from(data, position)
+        position += RECORD_HEADER.size
+        record = data[position:position + length]
+        position += length
+        if kind == TABLE_RECORD:
+            yield kind, table, record.decode("utf-8").split("\0")
+        elif kind == POINT_RECORD:
+            yield kind, table, PointRecord.unpack(record)
+
+
+class ReplayEngine:
+    """
+    A class to rebuild the games of a replay log
+
+    ...
+
+    Attributes
+    ----------
+    seats : dict[int, list[str]]
+        The players of every table
+    points : dict[int, list[PointRecord]]
+        The points of every table in the order they were played
+
+    Methods
+    -------
+    game_data_at(table: int, point: int, event: int | None = None) -> GameData
+        Rebuild the GameData of a table after an event of a point
+    check() -> tuple[int, int]
+        Check the recorded winner of every turn with check_winner
+    turns() -> tuple[list[list[int]], list[int], list[int]]
+        Get the played cards, the highest card and the winning index of every recorded turn
+    """
+    def __init__(self, path: str):
+        """
+        Load a replay log
+
+        Parameters
+        ----------
+        path : str
+            The path of the log file
+        """
+        self.seats: dict[int, list[str]] = {}
+        self.points: dict[int, list[PointRecord]] = {}
+        for kind, table, record in read_log(path):
+            if kind == TABLE_RECORD:
+                self.seats[table] = record
+                self.points[table] = []
+            else:
+                self.points[table].append(record)
+
+    def game_data_at(self, table: int, point: int, event: int | None = None) -> GameData:
+        """
+        Rebuild the GameData of a table after an event of a point
+
+        The points before are replayed as well (the teams keep their points and rounds),
+        every play is checked by the rules of the GameEngine
+
+        Parameters
+        ----------
+        table : int
+            The number of the table
+        point : int
+            The index of the point of the table
+        event : int | None (default: None)
+            0: after the cards were dealt, n: after the n-th card was played (None: the whole point)
+
+        Returns
+        -------
+        GameData : The state of the table
+        """
+        seats = self.seats[table]
+        engine = GameEngine(rng=random.Random(0))
+        engine.seat(seats)
+        for index, record in enumerate(self.points[table][:point + 1]):
+            loop = seats[record.first_seat:] + seats[:record.first_seat]
+            engine.game_data.turn_loop = loop
+            engine.phase = DEAL
+            cards = []
+            for start, amount in ((0, 3), (3, 2)):
+                for hand in record.hands:
+                    cards.extend(ALL_CARDS[card] for card in hand[start:start + amount])
+            engine.deal(CardDek(cards))
+            if int(engine.game_data.highest) != record.highest:
+                raise ValueError(f"Point {index} of table {table}: the highest card does not match the deal")
+
+            plays = record.plays if index < point or event is None else record.plays[:event]
+            for card in plays:
+                engine.play(engine.current_player(), card)
+        return engine.game_data
+
+    def turns(self) -> tuple[list[list[int]], list[int], list[int]]:
+        """
+        Get the played cards, the highest card and the winning index (in the turn) of every recorded turn
+
+        Returns
+        -------
+        tuple[list[list[int]], list[int], list[int]] : The cards, the highest card and the winner of every turn
+        """
+        played, highest, winners = [], [], []
+        for records in self.points.values():
+            for record in records:
+                leader = record.first_seat
+                for turn, winner in enumerate(record.winners):
+                    played.append(record.plays[turn * SEATS:(turn + 1) * SEATS])
+                    highest.append(record.highest)
+                    winners.append((winner - leader) % SEATS)
+                    leader = winner
+        return played, highest, winners
+
+    def check(self) -> tuple[int, int]:
+        """
+        Check the recorded winner of every turn with check_winner (check_winner_batch with numpy)
+
+        Returns
+        -------
+        tuple[int, int] : The amount of turns and the amount of turns with a different winner
+        """
+        played, highest, winners = self.turns()
+        if np is not None and played:
+            result = check_winner_batch(np.array(played), np.array(highest))
+            return len(winners), int(np.count_nonzero(result != np.array(winners)))
+        wrong = sum(
+            check_winner([ALL_CARDS[card] for card in cards], ALL_CARDS[high]) != winner
+            for cards, high, winner in zip(played, highest, winners)
+        )
+        return len(winners), wrong
+
+
+if __name__ == '__main__':
+    import tempfile
+
+    # Record random rounds, then replay and check the log
+    AMOUNT = 1000
+    directory = tempfile.mkdtemp()
+    log = ReplayLog(directory)
+    rng = table_rng(1, 0)
+    for table in range(AMOUNT):
+        engine = GameEngine(rng=rng, recorder=PointRecorder(log, table))
+        engine.seat(["Marcel", "Daniel", "Thomas", "Christoph"])
+        play_random_round(engine, rng)
+    log.close()
+    path = os.path.join(directory, os.listdir(directory)[0])
+
+    start_time = time.perf_counter()
+    replay = ReplayEngine(path)
+    loaded = time.perf_counter()
+    turns, wrong = replay.check()
+    checked = time.perf_counter()
+    points = sum(map(len, replay.points.values()))
+    print(f"[{'BENCHMARK':<10}] {points} points in {os.path.getsize(path)} bytes "
+          f"({os.path.getsize(path) / points:.1f} bytes per point)")
+    print(f"[{'BENCHMARK':<10}] load {points * 21 / (loaded - start_time):.0f} events/s, "
+          f"check {turns} turns ({wrong} wrong) {turns * 4 / (checked - loaded):.0f} plays/s")
@@ -1,9 +1,17 @@
 import json
+import queue
 import socket
-import multiprocessing
-from typing import Dict, Any
+import selectors
+import threading
+from typing import Dict, Any, Iterable
 from models import ClientData
 from database import Database
+from login_pool import LoginVerifier, valid_credentials
+from session import SessionTokens
+from framing import READ_SIZE, FrameDecoder, encode_frame, send_frame_parts
+from codec import BINARY, negotiate_codec, encode_binary, decode_command
+from state_delta import negotiate_features
+from protocol_trace import SENT, RECEIVED, trace
 
 
 class NetworkServer:
@@ -21,12 +29,24 @@ class NetworkServer:
     ----------
     clients : dict[str, ClientData] (default: {})
         A dictionary of every Client
+    sessions : SessionTokens
+        Issues the session token of every login (a reconnecting client sends it instead of the password)
+    logins : LoginVerifier
+        Checks the tokens and passwords of the logins (bcrypt on its thread pool)
     conn : socket.socket
         A TCP/IPv4 connection to allow clients to connect to the server
-    que : multiprocessing.Queue
+    que : queue.Queue
         A que to receive multiple commands at once
-    listeners : list[multiprocessing.Process] (default: [])
-        A list of processes to receive data simultaneously
+    selector : selectors.DefaultSelector
+        Watches the sockets of every client that is listened to
+    listener : threading.Thread | None (default: None)
+        The thread that reads the commands of every listened client into the que
+    listener_lock : threading.Lock
+        Makes sure no socket is read by the listener after stop_responses returned
+    responses_allowed : threading.Event
+        Set while at least one client is listened to
+    decoders : dict[socket.socket, FrameDecoder] (default: {})
+        The FrameDecoder of every connection (keeps partial and additional frames between reads)
 
     Methods
     -------
@@ -38,20 +58,24 @@ class NetworkServer:
         Allow 'amount' clients to connect to the Server
     send_all(command: str, **data) -> None
         Send a command to every client in self.clients
+    broadcast(command: str, usernames: Iterable[str], **data) -> None
+        Send the same command to the given clients (encoded only once)
     send_to(command: str, username: str, **data) -> None
         Send data to a Client
     receive(name: str) -> str | None
         Receive data from a client
-    receive_from_client(client) -> list[dict] | dict
+    receive_from_client(client) -> dict
         Listen to ONE response of a client
     allow_responses_from(*clients: str) -> None
-        Start processes for every given client and listen if they are sending commands
+        Listen if the given clients are sending commands
     stop_responses() -> None
-        Close all running listeners
-    wait_for_response(client: str) -> None
-        Wait for Responses from a client
+        Stop listening to every client
+    wait_for_responses() -> None
+        Wait for Responses from every client that is listened to (listener thread)
+    read_responses(client: str) -> None
+        Read the available data of a client and put every complete command into self.que
     """
-    def __init__(self, db:Database, host: str = "127.0.0.2", port: int = 3333):
+    def __init__(self, db:Database, host: str = "127.0.0.2", port: int = 3333, sessions: SessionTokens | None = None):
         """
         Initialize a new NetworkServer to handle the network
 
@@ -61,14 +85,22 @@ class NetworkServer:
             The IP-Address the server will be bind to
         port : int
             The Port the server will be bind to
+        sessions : SessionTokens | None (default: None)
+            Issues and checks the session tokens (tokens with a random key if not given)
         """
         self.db = db
         self.clients: dict[str, ClientData] = {}
+        self.sessions: SessionTokens = sessions if sessions is not None else SessionTokens()
+        self.logins: LoginVerifier = LoginVerifier(db, sessions=self.sessions)
         self.ENCODING = "utf-8"
         self.conn: socket.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
 
-        self.que: multiprocessing.Queue = multiprocessing.Queue()
-        self.listeners: list[multiprocessing.Process] = []
+        self.que: queue.Queue = queue.Queue()
+        self.selector: selectors.DefaultSelector = selectors.DefaultSelector()
+        self.listener: threading.Thread | None = None
+        self.listener_lock: threading.Lock = threading.Lock()
+        self.responses_allowed: threading.Event = threading.Event()
+        self.decoders: dict[socket.socket, FrameDecoder] = {}
 
         print(f"[{'LISTENING':<10}] Bound to the port: {host}:{port}")
         self.conn.bind((host, port))
@@ -88,14 +120,13 @@ class NetworkServer:
         -------
         None
         """
-        length = len(data)
-        conn.send(length.to_bytes(16, "big"))
-        conn.send(data)
+        conn.sendall(encode_frame(data))
 
     def recv(self, conn: socket.socket) -> bytes:
         """
         Function to receive the exact amount of bytes
-        First the length will be received than the client receives the data
+        The bytes are read until one whole frame (length, then data) was received,
+        every additional frame is kept by the FrameDecoder of the connection
 
         Parameters
         ----------
@@ -106,16 +137,17 @@ class NetworkServer:
         -------
         bytes : The data received
         """
-        byte_length = conn.recv(16)
-        length = int.from_bytes(byte_length, "big")
-        data = conn.recv(length)
-        return data
+        if conn not in self.decoders:
+            self.decoders[conn] = FrameDecoder()
+        return self.decoders[conn].recv(conn)
 
     def accept_clients(self, amount: int = 4) -> None:
         """
         Allow 'amount' clients to connect to the Server
 
-        Receive the name and store them as a ClientData
+        Receive the name and store them as a ClientData,
+        the codec and features offered by the client are confirmed in the CONNECTED command together with a session token
+        (the client may send the token instead of the password when it connects again)
 
         Parameters
         ----------
@@ -132,20 +164,32 @@ class NetworkServer:
             name = ""
             conn, addr = self.conn.accept()
 
-            login_crerdentials: dict = json.loads(self.recv(conn).decode(self.ENCODING))
+            try:
+                login_crerdentials: dict = json.loads(self.recv(conn).decode(self.ENCODING))
+            except (ConnectionError, ValueError):
+                login_crerdentials = None
+            if not valid_credentials(login_crerdentials):
+                self.decoders.pop(conn, None)
+                conn.close()
+                continue
             name = login_crerdentials.get("user")
 
             if name in self.clients:
                 self.send(conn, json.dumps({"command": "CONNECTION_REFUSED"}).encode(self.ENCODING))
+                self.decoders.pop(conn, None)
                 conn.close()
             
             #checking if the user exists and if the password is correct
-            elif self.db.verify_user(name, login_crerdentials.get("password")):
+            elif self.logins.verify_blocking(name, login_crerdentials.get("password"), login_crerdentials.get("token")):
                 self.clients[name] = ClientData.new_conn(name, conn, addr)
+                self.clients[name].codec = negotiate_codec(login_crerdentials.get("codecs"))
+                self.clients[name].features = negotiate_features(login_crerdentials.get("features"))
                 print(f"[{'CONNECTION':<10}] {name} connected to the Game {len(self.clients)}/{amount} ({addr[0]}:{addr[1]})")
-                self.send_to("CONNECTED", name)
+                self.send_to("CONNECTED", name, codec=self.clients[name].codec, features=self.clients[name].features,
+                             token=self.sessions.issue(name))
             else:
                 self.send(conn, json.dumps({"command": "CONNECTION_REFUSED"}).encode(self.ENCODING))
+                self.decoders.pop(conn, None)
                 conn.close()
 
     def send_all(self, command: str, **data: Any) -> None:
@@ -163,8 +207,44 @@ class NetworkServer:
         -------
         None
         """
-        for name in self.clients:
-            self.send_to(command, name, **data)
+        self.broadcast(command, self.clients, **data)
+
+    def broadcast(self, command: str, usernames: Iterable[str], **data: Any) -> None:
+        """
+        Send the same command to the given clients
+
+        The data is serialized once, only the name of the client is spliced in
+        and every frame is sent with one gathered write
+        (clients using the binary codec get the same binary command)
+
+        Parameters
+        ----------
+        command : str
+            The command the clients should receive
+        usernames : Iterable[str]
+            The names of the clients to send the command to
+        data : any
+            Additional data every client should receive
+
+        Returns
+        -------
+        None
+        """
+        head, tail = encode_broadcast(command, data, self.ENCODING)
+        binary = encode_binary(command, data)
+
+        for name in usernames:
+            client = self.clients.get(name)
+            if client is None:
+                continue
+            if binary is not None and client.codec == BINARY:
+                self.send(client.conn, binary)
+                if trace.level:
+                    trace.frame(name, SENT, binary)
+            else:
+                send_frame_parts(client.conn, [head, client.encoded_name, tail])
+                if trace.level:
+                    trace.frame(name, SENT, (head, client.encoded_name, tail))
 
     def send_to(self, command: str, username: str, **data: Any) -> None:
         """
@@ -184,6 +264,13 @@ class NetworkServer:
         """
         if username not in self.clients:
             return None
+        if self.clients[username].codec == BINARY:
+            binary = encode_binary(command, data)
+            if binary is not None:
+                self.send(self.clients[username].conn, binary)
+                if trace.level:
+                    trace.frame(username, SENT, binary)
+                return None
         jso = {"command": command,
                "to": username}
 
@@ -191,10 +278,10 @@ class NetworkServer:
             for key, value in data.items():
                 jso[key] = value
 
-        string_data = json.dumps(jso)
-        print(f"[{'SENDING':<10}] {string_data}")
-
-        self.send(self.clients[username].conn, string_data.encode(self.ENCODING))
+        encoded = json.dumps(jso).encode(self.ENCODING)
+        self.send(self.clients[username].conn, encoded)
+        if trace.level:
+            trace.frame(username, SENT, encoded)
 
     def receive(self, name: str) -> str | None:
         """
@@ -214,39 +301,30 @@ class NetworkServer:
 
         return self.recv(self.clients[name].conn).decode(self.ENCODING)
 
-    def receive_from_client(self, client) -> list[dict] | dict:
+    def receive_from_client(self, client) -> dict:
         """
         Listen to ONE response of a client
-        (sometimes can be more command than one)
+        (commands sent at once are returned one after another by the next calls)
+        json and binary commands are both decoded to the same dict
 
         Parameters
         ----------
         client: str
-            The client to receive the command(s) from
+            The client to receive the command from
 
         Returns
         -------
         dict : One Command
-        list[dict] : Multiple Commands
         """
-        data = self.receive(client)
-        print(f"[{'RECEIVED':<10}] {data}")
-        try:
-            return json.loads(data)
-        except json.decoder.JSONDecodeError:
-            commands = []
-            commands_len = data.count("command")
-            # Remove first and last {,} to be sure to add the {,} afterwards in the for loop
-            partial_commands = data[1:-1].split("}{")
-            if len(partial_commands) == commands_len:
-                for command in partial_commands:
-                    # Add the {, } to the command again to make sure it is json loadable
-                    commands.append(json.loads("{" + command + "}"))
-            return commands
+        data = self.recv(self.clients[client].conn)
+        if trace.level:
+            trace.frame(client, RECEIVED, data)
+        return decode_command(data, client, self.clients[client].codec, self.ENCODING)
 
     def allow_responses_from(self, *clients: str) -> None:
         """
-        Start processes for every given client and listen if they are sending commands
+        Listen if the given clients are sending commands
+        (every decoded command is put into self.que by the listener thread)
 
         Parameters
         ----------
@@ -257,45 +335,127 @@ class NetworkServer:
         -------
         None
         """
-        for client in clients:
-            self.listeners.append(multiprocessing.Process(target=self.wait_for_response, args=(client,)))
-            self.listeners[-1].run()
+        with self.listener_lock:
+            for client in clients:
+                conn = self.clients[client].conn
+                try:
+                    self.selector.register(conn, selectors.EVENT_READ, client)
+                except KeyError:
+                    # The client is already listened to
+                    continue
+                # Frames that were already read but not handled go to the queue first
+                decoder = self.decoders.setdefault(conn, FrameDecoder())
+                codec = self.clients[client].codec
+                try:
+                    while decoder.frames:
+                        self.que.put(decode_command(decoder.frames.popleft(), client, codec, self.ENCODING))
+                except ValueError as e:
+                    # Like read_responses: a client that sent a broken frame is not listened to anymore
+                    print(f"[{'DISCONNECT':<10}] Stopped listening to {client} ({e!r})")
+                    trace.dump(client, e)
+                    self.selector.unregister(conn)
+            self.responses_allowed.set()
+
+        if self.listener is None:
+            self.listener = threading.Thread(target=self.wait_for_responses, daemon=True)
+            self.listener.start()
 
     def stop_responses(self) -> None:
         """
-        Close all running listeners
-        (Stop waiting for commands from clients)
+        Stop listening to every client
+        (Stop waiting for commands from clients, the listener thread keeps waiting for new clients)
 
         Returns
         -------
         None
         """
-        for listener in self.listeners:
-            listener.close()
-        self.listeners = []
+        with self.listener_lock:
+            for key in list(self.selector.get_map().values()):
+                self.selector.unregister(key.fileobj)
+            self.responses_allowed.clear()
+
+    def wait_for_responses(self) -> None:
+        """
+        Wait for Responses from every client that is listened to
+        (runs in the listener thread, one selector watches every socket at once)
 
-    def wait_for_response(self, client: str) -> None:
+        Returns
+        -------
+        None
+        """
+        while True:
+            self.responses_allowed.wait()
+            with self.listener_lock:
+                if not self.selector.get_map():
+                    # Nobody is listened to anymore (e.g. the last client disconnected), wait for allow_responses_from
+                    self.responses_allowed.clear()
+                    continue
+            events = self.selector.select(timeout=0.1)
+            with self.listener_lock:
+                for key, mask in events:
+                    try:
+                        # The client could have been removed while waiting
+                        self.selector.get_key(key.fileobj)
+                    except KeyError:
+                        continue
+                    self.read_responses(key.data)
+
+    def read_responses(self, client: str) -> None:
         """
-        Wait for Responses from a client
-        (used as a method in a process to receive multiple commands at once)
+        Read the available data of a client and put every complete command into self.que
 
         Parameters
         ----------
         client : str
-            The name of the client to receive data from
+            The name of the client that sent data
 
         Returns
         -------
         None
         """
-        while True:
-            recv = self.receive_from_client(client)
-            if recv:
-                if isinstance(recv, list):
-                    for com in recv:
-                        self.que.put(com)
-                    return
-                self.que.put(recv)
+        conn = self.clients[client].conn
+        decoder = self.decoders.setdefault(conn, FrameDecoder())
+        try:
+            data = conn.recv(READ_SIZE)
+            if not data:
+                raise ConnectionError("The connection was closed by the other side")
+            for frame in decoder.feed(data):
+                if trace.level:
+                    trace.frame(client, RECEIVED, frame)
+                self.que.put(decode_command(frame, client, self.clients[client].codec, self.ENCODING))
+        except (ConnectionError, ValueError) as e:
+            print(f"[{'DISCONNECT':<10}] Stopped listening to {client} ({e!r})")
+            trace.dump(client, e)
+            self.selector.unregister(conn)
+
+
+def encode_broadcast(command: str, data: dict[str, Any], encoding: str = "utf-8") -> tuple[bytes, bytes]:
+    """
+    Serialize a command once for many clients
+
+    The json of a client is head + the encoded name of the client + tail,
+    which is exactly what send_to would send to that client
+    ("command" and "to" are set by the server, data containing them is refused with a ValueError)
+
+    Parameters
+    ----------
+    command : str
+        The command the clients should receive
+    data : dict[str, any]
+        Additional data every client should receive
+    encoding : str (default: "utf-8")
+        The encoding of the data
+
+    Returns
+    -------
+    tuple[bytes, bytes] : The part before and the part after the name of the client
+    """
+    if "command" in data or "to" in data:
+        # Spliced around the data they would be duplicate keys of the json
+        raise ValueError(f"{command} can not be broadcast with a 'command' or 'to' in its data")
+    head = '{"command": ' + json.dumps(command) + ', "to": '
+    tail = ", " + json.dumps(data)[1:] if data else "}"
+    return head.encode(encoding), tail.encode(encoding)
 
 
 if __name__ == '__main__':
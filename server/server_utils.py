@@ -1,4 +1,11 @@
 from models import CardBase
+from cards_utils import CARD_AMOUNT, COLOR_MASKS, TRICK_RANKS
+
+try:
+    import numpy as np
+except ImportError:
+    # numpy is only needed for check_winner_batch
+    np = None
 
 
 def check_available(player_cards: list[CardBase], already_played: list[CardBase], highest: CardBase, know: bool = True) -> list[CardBase]:
@@ -20,15 +27,41 @@ def check_available(player_cards: list[CardBase], already_played: list[CardBase]
     -------
     list[CardBase] : All the cards the player is allowed to play
     """
-    if already_played:
-        if know:
-            if already_played[0] == highest:
-                playable = [card for card in player_cards if card == highest]
-                if playable:
-                    return playable
+    if already_played and know:
+        color = highest.color
+        if already_played[0].color == color:
+            playable = [card for card in player_cards if card.color == color]
+            if playable:
+                return playable
     return player_cards
 
 
+def check_available_mask(hand: int, already_played: list[CardBase], highest: CardBase, know: bool = True) -> int:
+    """
+    Check which cards the player is allowed to play (the same rules as check_available for a hand mask)
+
+    Parameters
+    ----------
+    hand : int
+        The cards the player currently owns as a bit mask
+    already_played : list[CardBase]
+        The cards that were already played
+    highest : CardBase
+        The current highest card (Rechter)
+    know : bool
+        If the player knows the highest card
+
+    Returns
+    -------
+    int : The cards the player is allowed to play as a bit mask
+    """
+    if already_played and know and already_played[0].color == highest.color:
+        playable = hand & COLOR_MASKS[highest.color]
+        if playable:
+            return playable
+    return hand
+
+
 def check_winner(played_cards: list[CardBase], highest: CardBase) -> int:
     """
     Check which index won the turn
@@ -44,23 +77,73 @@ def check_winner(played_cards: list[CardBase], highest: CardBase) -> int:
     -------
     int : The index of the card that won the turn
     """
-    current_highest = played_cards[0]
-    for card in played_cards[1:]:
-        # Check if the played_card is some type of the highest
-        if card.num() == highest.num():
-            # If the card is the highest
-            if card == highest:
-                return list(map(int, played_cards)).index(int(card))
-            # If the card is one of the highest and
-            # the current highest is not one of the highest
-            elif current_highest.num() != highest.num():
-                current_highest = card
-        else:
-            # If the card is bigger than the current highest and
-            # has the same color
-            if card > current_highest and current_highest.num() != highest.num():
-                current_highest = card
-            elif card.col() == highest.col() and current_highest.col() != highest.col() and current_highest.num() != highest.num():
-                current_highest = card
-
-    return list(map(int, played_cards)).index(int(current_highest))
+    # The strength of every card for this highest and first card (see cards_utils.TRICK_RANKS)
+    offset = (highest.card_id * CARD_AMOUNT + played_cards[0].card_id) * CARD_AMOUNT
+    winner = 0
+    winner_rank = TRICK_RANKS[offset + played_cards[0].card_id]
+    for index in range(1, len(played_cards)):
+        rank = TRICK_RANKS[offset + played_cards[index].card_id]
+        if rank > winner_rank:
+            winner, winner_rank = index, rank
+    return winner
+
+
+def check_winner_batch(played_cards: "np.ndarray", highest: "np.ndarray") -> "np.ndarray":
+    """
+    Check which index won the turn for many turns at once (the same result as check_winner for every row)
+
+    The strength of every card is looked up in TRICK_RANKS for all turns together,
+    the first card with the biggest strength wins (needs numpy)
+
+    Parameters
+    ----------
+    played_cards : np.ndarray
+        The ids of the played cards, shape (N, 4) (one turn per row, in the order they were played)
+    highest : np.ndarray
+        The id of the highest card of every turn, shape (N,)
+
+    Returns
+    -------
+    np.ndarray : The index of the card that won the turn of every row, shape (N,)
+    """
+    if np is None:
+        raise ModuleNotFoundError("check_winner_batch needs numpy (pip install numpy)")
+    played_cards = np.asarray(played_cards, dtype=np.intp)
+    highest = np.asarray(highest, dtype=np.intp)
+
+    ranks = _trick_ranks_array()[highest[:, None], played_cards[:, :1], played_cards]
+    # argmax returns the first index of the biggest strength like check_winner
+    return ranks.argmax(axis=1)
+
+
+def _trick_ranks_array() -> "np.ndarray":
+    # TRICK_RANKS as a (highest, led, card) array, built on the first call
+    global _TRICK_RANKS_ARRAY
+    if _TRICK_RANKS_ARRAY is None:
+        _TRICK_RANKS_ARRAY = np.array(TRICK_RANKS, dtype=np.int8).reshape(CARD_AMOUNT, CARD_AMOUNT, CARD_AMOUNT)
+    return _TRICK_RANKS_ARRAY
+
+
+_TRICK_RANKS_ARRAY = None
+
+if __name__ == '__main__':
+    import time
+    import random
+
+    # Score random turns with check_winner and check_winner_batch and compare the results
+    AMOUNT = 200_000
+    rng = random.Random(1)
+    turns = [rng.sample(range(33), 4) for i in range(AMOUNT)]
+    highests = [rng.randrange(33) for i in range(AMOUNT)]
+
+    start_time = time.perf_counter()
+    expected = [check_winner([CardBase(card) for card in turn], CardBase(highest)) for turn, highest in zip(turns, highests)]
+    single = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    result = check_winner_batch(np.array(turns), np.array(highests))
+    batch = time.perf_counter() - start_time
+
+    assert result.tolist() == expected
+    print(f"[{'BENCHMARK':<10}] {AMOUNT} turns: check_winner {AMOUNT / single:.0f} turns/s, "
+          f"check_winner_batch {AMOUNT / batch:.0f} turns/s")
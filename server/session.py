@@ -0,0 +1,151 @@
+import os
+import hmac
+import time
+import base64
+import hashlib
+
+# The shortest secret load_secret accepts (the random secrets have 32 bytes)
+MIN_SECRET_SIZE = 16
+
+
+class SessionTokens:
+    """
+    A class to issue and check the session tokens of logged-in users
+
+    A token is "<name>.<expiry>.<signature>" (name and signature base64url encoded, expiry in unix seconds),
+    the signature is the HMAC-SHA256 of name and expiry with the secret of the server.
+    Checking a token needs neither the database nor bcrypt (a few microseconds),
+    so reconnecting clients skip the expensive password check.
+    Tokens of an earlier process are only valid if the server uses the same secret again (see load_secret)
+
+    ...
+
+    Attributes
+    ----------
+    lifetime : float
+        The seconds a token is valid after it was issued
+
+    Methods
+    -------
+    issue(name: str) -> str
+        Create a new token for a user that just logged in
+    verify(token: str, name: str) -> bool
+        Check if a token is signed by this server, not expired and belongs to the user
+    """
+    def __init__(self, secret: bytes | None = None, lifetime: float = 12 * 60 * 60):
+        """
+        Initialize the tokens of a server
+
+        Parameters
+        ----------
+        secret : bytes | None (default: None)
+            The key of the signatures (a random one if not given, the tokens end with the process then)
+        lifetime : float (default: 12 hours)
+            The seconds a token is valid after it was issued
+        """
+        self.lifetime = lifetime
+        # Copying the prepared HMAC is faster than hashing the key for every token
+        self._mac = hmac.new(secret if secret is not None else os.urandom(32), digestmod=hashlib.sha256)
+
+    def issue(self, name: str) -> str:
+        """
+        Create a new token for a user that just logged in
+
+        Parameters
+        ----------
+        name : str
+            The name of the user
+
+        Returns
+        -------
+        str : The token
+        """
+        payload = f"{_encode(name.encode('utf-8'))}.{int(time.time() + self.lifetime)}"
+        return f"{payload}.{self._sign(payload)}"
+
+    def verify(self, token: str, name: str) -> bool:
+        """
+        Check if a token is signed by this server, not expired and belongs to the user
+
+        Parameters
+        ----------
+        token : str
+            The token the client sent
+        name : str
+            The name the client wants to log in with
+
+        Returns
+        -------
+        bool : If the token is valid for the user
+        """
+        if not isinstance(token, str) or not isinstance(name, str) or not token.isascii():
+            # Issued tokens are ascii only, compare_digest and int() would fail on other characters
+            return False
+        payload, _, signature = token.rpartition(".")
+        encoded_name, _, expiry = payload.partition(".")
+        if not expiry.isdecimal() or int(expiry) < time.time():
+            return False
+        if not hmac.compare_digest(self._sign(payload), signature):
+            return False
+        return encoded_name == _encode(name.encode("utf-8", "surrogatepass"))
+
+    def _sign(self, payload: str) -> str:
+        mac = self._mac.copy()
+        mac.update(payload.encode("utf-8"))
+        return _encode(mac.digest())
+
+
+def _encode(data: bytes) -> str:
+    # base64url without padding (no "." in it)
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def load_secret(path: str) -> bytes:
+    """
+    Read the secret of the session tokens from a file (a new random secret is written if the file does not exist),
+    so the tokens stay valid when the server is restarted
+    (a secret shorter than MIN_SECRET_SIZE bytes is refused with a ValueError, anyone could forge tokens with it)
+
+    Parameters
+    ----------
+    path : str
+        The file of the secret
+
+    Returns
+    -------
+    bytes : The secret
+    """
+    try:
+        with open(path, "rb") as file:
+            secret = file.read()
+    except FileNotFoundError:
+        secret = os.urandom(32)
+        # Only the user of the server may read the secret
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, "wb") as file:
+            file.write(secret)
+        return secret
+    if len(secret) < MIN_SECRET_SIZE:
+        raise ValueError(f"The session secret in {path} has {len(secret)} bytes, at least {MIN_SECRET_SIZE} are needed")
+    return secret
+
+
+if __name__ == '__main__':
+    # Issue and check tokens like a reconnect storm would
+    AMOUNT = 100000
+    sessions = SessionTokens()
+    tokens = [sessions.issue(f"Player {i}") for i in range(1000)]
+
+    start_time = time.perf_counter()
+    for i in range(AMOUNT):
+        sessions.issue("Marcel")
+    issue_duration = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    valid = sum(sessions.verify(tokens[i % 1000], f"Player {i % 1000}") for i in range(AMOUNT))
+    verify_duration = time.perf_counter() - start_time
+
+    assert valid == AMOUNT and not sessions.verify(tokens[0], "Player 1") and not sessions.verify(tokens[0][:-2], "Player 0")
+    assert not any(sessions.verify(token, "a") for token in ("a.\u00b2.x", "a.9999999999.\u00e9", "\ud800.9999999999.x"))
+    print(f"[{'BENCHMARK':<10}] issue {issue_duration / AMOUNT * 1e6:.2f}µs, verify {verify_duration / AMOUNT * 1e6:.2f}µs "
+          f"per token ({len(tokens[0])} characters)")
@@ -0,0 +1,365 @@
+import os
+import glob
+import time
+import random
+import struct
+import asyncio
+from operator import attrgetter
+
+from models import PlayerData, CardDek
+from models.cards import ALL_CARDS
+from engine import GameEngine, DEAL, PLAY, table_rng
+from cards_utils import mask_ids
+
+# magic, version, flags, tricks, highest card, amount of players, seat of the first player of the turn loop,
+# seats the highest card was shown to, rounds, points and turns of team1 and of team2
+STATE = struct.Struct(">4sBBBbBBBHBBHBB")
+# the hand and the length of the name of every player
+PLAYER = struct.Struct(">QB")
+# Every table in a checkpoint file: number of the table, length of the snapshot
+CHECKPOINT_HEADER = struct.Struct(">IH")
+
+_card_id = attrgetter("card_id")
+
+SNAPSHOT_MAGIC = b"WSNP"
+SNAPSHOT_VERSION = 1
+
+# The flags of the state
+PLAYING = 1
+ROUND_OVER = 2
+# last_won_point is team1 / team2 (bit 2 and 3)
+LAST_WON_SHIFT = 2
+
+
+def dump_table(engine: GameEngine) -> bytes:
+    """
+    Pack the whole state of a table (the GameData, every PlayerData and the phase of the engine) into bytes
+
+    Layout (version 1): the fixed STATE,
+    the hand and the name of every player in the order they were seated (GameEngine.seat),
+    the played cards of the current turn (amount, ids) and the dek (position, amount, ids).
+    The turn loop is the seating order rotated to the first player, the teams are the even and the odd seats,
+    the players that saw the highest card are a bit mask over the seats.
+
+    Parameters
+    ----------
+    engine : GameEngine
+        The engine of the table
+
+    Returns
+    -------
+    bytes : The snapshot of the table
+    """
+    game_data = engine.game_data
+    loop = game_data.turn_loop
+    team1, team2 = game_data.team1, game_data.team2
+    # The turn loop is only ever rotated, the first player of team1 sits on seat 0
+    rotation = loop.index(team1["player"][0]) if loop else 0
+    seating = loop[rotation:] + loop[:rotation]
+    shown_seats = 0
+    for seat, name in enumerate(seating):
+        if name in engine.shown:
+            shown_seats |= 1 << seat
+
+    flags = (engine.phase == PLAY) | ROUND_OVER * engine.round_over
+    if game_data.last_won_point is not None:
+        flags |= (1 if game_data.last_won_point == team1["player"] else 2) << LAST_WON_SHIFT
+    highest = game_data.highest.card_id if game_data.highest is not None else -1
+
+    parts = [STATE.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, flags, engine.tricks, highest, len(loop), -rotation % len(loop) if loop else 0, shown_seats,
+                        team1["rounds"], team1["points"], team1["turns"], team2["rounds"], team2["points"], team2["turns"])]
+    players = game_data.game_player
+    for name in seating:
+        encoded = name.encode("utf-8")
+        parts.append(PLAYER.pack(players[name].hand, len(encoded)))
+        parts.append(encoded)
+
+    played = bytes(map(_card_id, game_data.played_cards))
+    dek = game_data.card_dek
+    cards = bytes(map(_card_id, dek.cards)) if dek is not None else b""
+    parts.append(bytes((len(played),)))
+    parts.append(played)
+    parts.append(bytes((dek.position if dek is not None else 0, len(cards))))
+    parts.append(cards)
+    return b"".join(parts)
+
+
+def load_table(engine: GameEngine, data: bytes) -> None:
+    """
+    Restore the state of a snapshot into an engine
+    (the GameData of the engine is changed in place, the table continues where the snapshot was taken)
+
+    Parameters
+    ----------
+    engine : GameEngine
+        The engine to restore (its on_event, rng and recorder are kept)
+    data : bytes
+        The snapshot (see dump_table)
+
+    Returns
+    -------
+    None
+    """
+    (magic, version, flags, tricks, highest, amount, start, shown_seats,
+     rounds1, points1, turns1, rounds2, points2, turns2) = STATE.unpack_from(data)
+    if magic != SNAPSHOT_MAGIC:
+        raise ValueError("The data is no snapshot of a table")
+    if version > SNAPSHOT_VERSION:
+        raise ValueError(f"The snapshot has the unknown version {version}")
+
+    offset = STATE.size
+    seating = []
+    players = {}
+    for seat in range(amount):
+        hand, length = PLAYER.unpack_from(data, offset)
+        offset += PLAYER.size
+        name = data[offset:offset + length].decode("utf-8")
+        offset += length
+        player = PlayerData(name)
+        player.hand = hand
+        players[name] = player
+        seating.append(name)
+
+    played = data[offset + 1:offset + 1 + data[offset]]
+    offset += 1 + len(played)
+    position, length = data[offset], data[offset + 1]
+    cards = data[offset + 2:offset + 2 + length]
+
+    game_data = engine.game_data
+    game_data.turn_loop = seating[start:] + seating[:start]
+    game_data.game_player = players
+    game_data.played_cards = list(map(ALL_CARDS.__getitem__, played))
+    game_data.highest = ALL_CARDS[highest] if highest >= 0 else None
+    if cards:
+        game_data.card_dek = CardDek(list(map(ALL_CARDS.__getitem__, cards)))
+        game_data.card_dek.position = position
+    else:
+        game_data.card_dek = None
+    for team, first, rounds, points, turns in ((game_data.team1, 0, rounds1, points1, turns1),
+                                               (game_data.team2, 1, rounds2, points2, turns2)):
+        team["player"] = seating[first::2]
+        team["rounds"] = rounds
+        team["points"] = points
+        team["turns"] = turns
+    last_won = flags >> LAST_WON_SHIFT & 3
+    game_data.last_won_point = (game_data.team1["player"], game_data.team2["player"])[last_won - 1] if last_won else None
+
+    engine.phase = PLAY if flags & PLAYING else DEAL
+    engine.tricks = tricks
+    engine.round_over = bool(flags & ROUND_OVER)
+    engine.shown = [name for seat, name in enumerate(seating) if shown_seats >> seat & 1]
+
+
+def snapshot_players(data: bytes) -> list[str]:
+    """
+    The names of the players of a snapshot (in the order they were seated) without restoring it
+
+    Parameters
+    ----------
+    data : bytes
+        The snapshot
+
+    Returns
+    -------
+    list[str] : The names of the players
+    """
+    amount = STATE.unpack_from(data)[5]
+    offset = STATE.size
+    names = []
+    for seat in range(amount):
+        hand, length = PLAYER.unpack_from(data, offset)
+        offset += PLAYER.size
+        names.append(data[offset:offset + length].decode("utf-8"))
+        offset += length
+    return names
+
+
+class Checkpointer:
+    """
+    A class to write the snapshots of every table of this process to a checkpoint file
+
+    Taking the snapshots only costs microseconds per table and is done inside the event loop,
+    writing the file runs in the default executor, so the tables are not stopped by the disk.
+    The file is replaced atomically, it always holds one complete checkpoint.
+    Every (forked) process writes its own file, a new server reads and removes them with load_checkpoints
+
+    ...
+
+    Attributes
+    ----------
+    directory : str
+        The directory of the checkpoint files
+    tables : dict[int, GameEngine]
+        The engines of the running tables by the number of the table
+    path : str | None (default: None)
+        The checkpoint file of this process (None until the first write)
+
+    Methods
+    -------
+    add(table: int, engine: GameEngine) -> None
+        Include a table in the next checkpoints
+    discard(table: int) -> None
+        Stop including a closed table
+    checkpoint() -> bytes
+        Snapshot every table
+    write(data: bytes) -> None
+        Replace the checkpoint file of this process
+    run(interval: float = 5) -> None
+        Write a checkpoint every interval seconds inside the event loop
+    """
+    def __init__(self, directory: str):
+        """
+        Initialize a new checkpointer
+
+        Parameters
+        ----------
+        directory : str
+            The directory of the checkpoint files
+        """
+        self.directory = directory
+        self.tables: dict[int, GameEngine] = {}
+        self.path: str | None = None
+
+    def add(self, table: int, engine: GameEngine) -> None:
+        """
+        Include a table in the next checkpoints
+
+        Parameters
+        ----------
+        table : int
+            The number of the table
+        engine : GameEngine
+            The engine of the table
+
+        Returns
+        -------
+        None
+        """
+        self.tables[table] = engine
+
+    def discard(self, table: int) -> None:
+        """
+        Stop including a closed table
+
+        Parameters
+        ----------
+        table : int
+            The number of the table
+
+        Returns
+        -------
+        None
+        """
+        self.tables.pop(table, None)
+
+    def checkpoint(self) -> bytes:
+        """
+        Snapshot every table (tables without players yet are skipped)
+
+        Returns
+        -------
+        bytes : The content of the checkpoint file
+        """
+        parts = []
+        for table, engine in self.tables.items():
+            if engine.game_data.turn_loop:
+                data = dump_table(engine)
+                parts.append(CHECKPOINT_HEADER.pack(table, len(data)))
+                parts.append(data)
+        return b"".join(parts)
+
+    def write(self, data: bytes) -> None:
+        """
+        Replace the checkpoint file of this process (it is removed if no table is running)
+
+        Parameters
+        ----------
+        data : bytes
+            The content of the checkpoint file
+
+        Returns
+        -------
+        None
+        """
+        if self.path is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self.path = os.path.join(self.directory, f"checkpoint-{os.getpid()}.wsnp")
+        if not data:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            return
+        with open(self.path + ".tmp", "wb") as file:
+            file.write(data)
+        os.replace(self.path + ".tmp", self.path)
+
+    async def run(self, interval: float = 5) -> None:
+        """
+        Write a checkpoint every interval seconds inside the event loop
+
+        Parameters
+        ----------
+        interval : float (default: 5)
+            The seconds between two checkpoints
+
+        Returns
+        -------
+        None
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(interval)
+            await loop.run_in_executor(None, self.write, self.checkpoint())
+
+
+def load_checkpoints(directory: str) -> list[bytes]:
+    """
+    Read the snapshots of every checkpoint file in the directory and remove the files
+    (they belong to processes that do not run anymore)
+
+    Parameters
+    ----------
+    directory : str
+        The directory of the checkpoint files
+
+    Returns
+    -------
+    list[bytes] : The snapshot of every table
+    """
+    snapshots = []
+    for path in glob.glob(os.path.join(directory, "checkpoint-*.wsnp")):
+        with open(path, "rb") as file:
+            data = file.read()
+        offset = 0
+        while offset < len(data):
+            table, length = CHECKPOINT_HEADER.unpack_from(data, offset)
+            offset += CHECKPOINT_HEADER.size
+            snapshots.append(data[offset:offset + length])
+            offset += length
+        os.remove(path)
+    return snapshots
+
+
+if __name__ == '__main__':
+    # Snapshot and restore tables in the middle of a turn
+    AMOUNT = 10000
+    rng = table_rng(1, 0)
+    engine = GameEngine(rng=rng)
+    engine.seat(["Marcel", "Daniel", "Thomas", "Christoph"])
+    engine.deal()
+    for i in range(6):
+        engine.play(engine.current_player(), rng.choice(mask_ids(engine.available_mask())))
+
+    start_time = time.perf_counter()
+    for i in range(AMOUNT):
+        data = dump_table(engine)
+    dump_duration = time.perf_counter() - start_time
+
+    restored = GameEngine(rng=random.Random())
+    start_time = time.perf_counter()
+    for i in range(AMOUNT):
+        load_table(restored, data)
+    load_duration = time.perf_counter() - start_time
+
+    assert dump_table(restored) == data
+    print(f"[{'BENCHMARK':<10}] {len(data)} bytes per table, snapshot {dump_duration / AMOUNT * 1e6:.2f}µs, "
+          f"restore {load_duration / AMOUNT * 1e6:.2f}µs")
@@ -0,0 +1,262 @@
+import time
+import random
+
+from models import CardBase, GameData
+from models.cards import ALL_CARDS
+from cards_utils import CARD_AMOUNT, CARD_COLORS, CARD_NUMBERS, CARD_MASKS, FULL_MASK, TRICK_RANKS, mask_ids
+from server_utils import check_available_mask, check_winner
+
+SEATS = 4
+
+# The cards with the same color and a lower number than every card
+LOWER = tuple(
+    sum(CARD_MASKS[other] for other in range(CARD_AMOUNT)
+        if CARD_COLORS[other] == CARD_COLORS[card] and CARD_NUMBERS[other] < CARD_NUMBERS[card])
+    for card in range(CARD_AMOUNT)
+)
+
+
+class DoubleDummySolver:
+    """
+    A class to find the best play of a point when every hand is known (double dummy)
+
+    Alpha-beta search over the remaining cards, both teams play perfectly:
+    the team of the seats 0 and 2 maximizes its turns, the team of the seats 1 and 3 minimizes them.
+    The legal cards come from check_available_mask, the winner of a turn from check_winner.
+    Every position at the start of a turn is stored in a transposition table
+    with the bounds that are known for it (the same position is reached by many orders of the same turns).
+    The cards are tried in the order of their strength (TRICK_RANKS), strong cards cut the search first.
+    Cards of the same color next to each other (no card of another player or of the turn lies between them)
+    are equal, only one of them is searched.
+
+    ...
+
+    Attributes
+    ----------
+    highest : CardBase
+        The highest card (Rechter) of the point
+    table : dict[tuple[int, int, int, int, int, int], tuple[int, int]]
+        The lower and upper bound of the turns of the team 0/2 for (hands..., leader, turns so far)
+    nodes : int
+        The amount of cards played in the search (for benchmarks)
+
+    Methods
+    -------
+    solve(hands: list[int], leader: int = 0, trick: list[int] | None = None) -> tuple[int, int]
+        The turns both teams win from now on if everyone plays perfectly
+    card_values(hands: list[int], leader: int = 0, trick: list[int] | None = None) -> dict[int, int]
+        The turns the team 0/2 wins after every card the current player may play
+    """
+    def __init__(self, highest: int | CardBase):
+        """
+        Initialize a new solver for one highest card (the table can be reused for every position of the point)
+
+        Parameters
+        ----------
+        highest : int | CardBase
+            The highest card
+        """
+        self.highest: CardBase = ALL_CARDS[int(highest)]
+        self.table: dict[tuple[int, int, int, int, int, int], tuple[int, int]] = {}
+        self.nodes: int = 0
+        # The strength of every card as the first card of a turn
+        offset = self.highest.card_id * CARD_AMOUNT * CARD_AMOUNT
+        self._leading: list[int] = [TRICK_RANKS[offset + card * CARD_AMOUNT + card] for card in range(CARD_AMOUNT)]
+        # The highest card and the cards with its number always have the same strength, the others depend on the turn
+        self._plain: int = FULL_MASK & ~sum(
+            CARD_MASKS[card] for card in range(CARD_AMOUNT)
+            if card == self.highest.card_id or CARD_NUMBERS[card] == CARD_NUMBERS[self.highest.card_id]
+        )
+
+    def solve(self, hands: list[int], leader: int = 0, trick: list[int] | None = None) -> tuple[int, int]:
+        """
+        The turns both teams win from now on if everyone plays perfectly
+
+        Parameters
+        ----------
+        hands : list[int]
+            The cards of the four seats as bit masks (the cards already played in the current turn are not in them)
+        leader : int (default: 0)
+            The seat that played (or plays) the first card of the current turn
+        trick : list[int] | None (default: None)
+            The ids of the cards already played in the current turn
+
+        Returns
+        -------
+        tuple[int, int] : The turns of the team 0/2 and of the team 1/3
+        """
+        played = [ALL_CARDS[card] for card in trick or []]
+        turns = hands[leader].bit_count() + bool(played)
+        value = self._play(list(hands), leader, played, check_winner(played, self.highest) if played else 0, 0, -1, turns + 1, turns)
+        return value, turns - value
+
+    def card_values(self, hands: list[int], leader: int = 0, trick: list[int] | None = None) -> dict[int, int]:
+        """
+        The turns the team 0/2 wins (from now on) after every card the current player may play
+
+        Parameters
+        ----------
+        hands : list[int]
+            The cards of the four seats as bit masks
+        leader : int (default: 0)
+            The seat that played (or plays) the first card of the current turn
+        trick : list[int] | None (default: None)
+            The ids of the cards already played in the current turn
+
+        Returns
+        -------
+        dict[int, int] : The turns of the team 0/2 for every allowed card
+        """
+        played = [ALL_CARDS[card] for card in trick or []]
+        seat = (leader + len(played)) % SEATS
+        turns = hands[leader].bit_count() + bool(played)
+        values = {}
+        for card in mask_ids(check_available_mask(hands[seat], played, self.highest, len(played) in (0, 3))):
+            rest = list(hands)
+            rest[seat] ^= CARD_MASKS[card]
+            values[card] = self._play(rest, leader, played + [ALL_CARDS[card]], check_winner(played + [ALL_CARDS[card]], self.highest),
+                                      0, -1, turns + 1, turns)
+        return values
+
+    def _search(self, hands: list[int], leader: int, done: int, alpha: int, beta: int) -> int:
+        # A new turn starts: the turns of the team 0/2 from here on, looked up in the table if possible
+        remaining = hands[leader].bit_count()
+        if not remaining:
+            return 0
+        if remaining == 1:
+            # The last turn is forced, every player has one card left
+            last = [ALL_CARDS[hands[(leader + index) % SEATS].bit_length() - 1] for index in range(SEATS)]
+            return (leader + check_winner(last, self.highest)) % 2 == 0
+        key = (*hands, leader, done)
+        bounds = self.table.get(key)
+        if bounds is None:
+            # The team with the highest card wins at least one turn
+            top = CARD_MASKS[self.highest.card_id]
+            bounds = (1 if (hands[0] | hands[2]) & top else 0, remaining - 1 if (hands[1] | hands[3]) & top else remaining)
+        low, high = bounds
+        if low >= beta or low == high:
+            return low
+        if high <= alpha:
+            return high
+        value = self._play(hands, leader, [], 0, done, max(alpha, low), min(beta, high), remaining)
+        if value <= alpha:
+            self.table[key] = (low, min(high, value))
+        elif value >= beta:
+            self.table[key] = (max(low, value), high)
+        else:
+            self.table[key] = (value, value)
+        return value
+
+    def _play(self, hands: list[int], leader: int, trick: list[CardBase], winner: int, done: int,
+              alpha: int, beta: int, remaining: int) -> int:
+        # The next seat of the turn plays every allowed card, the team 0/2 maximizes
+        position = len(trick)
+        if position == SEATS:
+            won = (leader + winner) % 2 == 0
+            return won + self._search(hands, (leader + winner) % SEATS, done + 1, alpha - won, beta - won)
+
+        seat = (leader + position) % SEATS
+        hand = hands[seat]
+        ranks = self._ranks(trick)
+        best_rank = ranks[trick[winner].card_id] if trick else -1
+        plain = self._plain
+        others = plain & ~hand & (hands[0] | hands[1] | hands[2] | hands[3] | self._played(trick))
+        cards = self._order(mask_ids(check_available_mask(hand, trick, self.highest, position in (0, 3))),
+                            ranks, best_rank, position and (position - winner) % 2 == 0)
+
+        maximize = seat % 2 == 0
+        best = -1 if maximize else remaining + 1
+        tried = 0
+        for card in cards:
+            if CARD_MASKS[card] & plain:
+                # The cards of the other players below this card decide which cards of the hand are equal
+                equal = 1 << (CARD_COLORS[card] * 8 + (others & LOWER[card]).bit_count())
+                if tried & equal:
+                    continue
+                tried |= equal
+            self.nodes += 1
+            hands[seat] = hand ^ CARD_MASKS[card]
+            value = self._play(hands, leader, trick + [ALL_CARDS[card]], position if ranks[card] > best_rank else winner,
+                               done, alpha, beta, remaining)
+            if maximize:
+                if value > best:
+                    best = value
+                    if value > alpha:
+                        alpha = value
+            elif value < best:
+                best = value
+                if value < beta:
+                    beta = value
+            if alpha >= beta:
+                break
+        hands[seat] = hand
+        return best
+
+    @staticmethod
+    def _played(trick: list[CardBase]) -> int:
+        # The cards of the turn as a bit mask
+        mask = 0
+        for card in trick:
+            mask |= CARD_MASKS[card.card_id]
+        return mask
+
+    def _ranks(self, trick: list[CardBase]):
+        # The strength of every card in this turn (as the first card if the turn did not start yet)
+        if not trick:
+            return self._leading
+        offset = (self.highest.card_id * CARD_AMOUNT + trick[0].card_id) * CARD_AMOUNT
+        return TRICK_RANKS[offset:offset + CARD_AMOUNT]
+
+    def _order(self, cards: list[int], ranks, best_rank: int, partner: bool) -> list[int]:
+        # The first card of a turn is the strongest one, the other players take the turn with their cheapest
+        # winning card, or throw their weakest card if they can not win it or their partner wins it already
+        if best_rank < 0:
+            return sorted(cards, key=ranks.__getitem__, reverse=True)
+        leading = self._leading
+        if partner:
+            return sorted(cards, key=lambda card: (ranks[card] > best_rank, leading[card]))
+        return sorted(cards, key=lambda card: (ranks[card] <= best_rank, ranks[card], leading[card]))
+
+
+def solve_game_data(game_data: GameData) -> tuple[int, int]:
+    """
+    The turns both teams have at the end of the current point if everyone plays perfectly from now on
+    (e.g. to analyse a point of the replay log or a running table)
+
+    Parameters
+    ----------
+    game_data : GameData
+        The state of the table (during a point)
+
+    Returns
+    -------
+    tuple[int, int] : The turns of team1 and team2 (the turns they already won included)
+    """
+    # The first player of the turn loop started the current turn
+    loop = game_data.turn_loop
+    solver = DoubleDummySolver(game_data.highest)
+    first, second = solver.solve([game_data.game_player[player].hand for player in loop], 0,
+                                 list(map(int, game_data.played_cards)))
+    if loop[0] not in game_data.team1["player"]:
+        first, second = second, first
+    return game_data.team1["turns"] + first, game_data.team2["turns"] + second
+
+
+if __name__ == '__main__':
+    # Solve random deals from the start of the point
+    AMOUNT = 200
+    rng = random.Random(1)
+    durations = []
+    nodes = 0
+    for i in range(AMOUNT):
+        cards = rng.sample(range(CARD_AMOUNT), 20)
+        hands = [sum(CARD_MASKS[card] for card in cards[seat * 5:(seat + 1) * 5]) for seat in range(SEATS)]
+        solver = DoubleDummySolver(rng.randrange(CARD_AMOUNT))
+        start_time = time.perf_counter()
+        solver.solve(hands)
+        durations.append(time.perf_counter() - start_time)
+        nodes += solver.nodes
+    durations.sort()
+    print(f"[{'BENCHMARK':<10}] {AMOUNT} deals: mean {sum(durations) / AMOUNT * 1000:.2f}ms, "
+          f"p50 {durations[AMOUNT // 2] * 1000:.2f}ms, max {durations[-1] * 1000:.2f}ms, "
+          f"{nodes / AMOUNT:.0f} cards per deal")
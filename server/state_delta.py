@@ -0,0 +1,187 @@
+from typing import Any
+
+# The same module is used by the client (client/state_delta.py), keep both copies equal
+
+DELTA = "delta"
+# The client answers every HEARTBEAT, so a silent client can be closed as idle
+HEARTBEAT = "heartbeat"
+FEATURES = {DELTA, HEARTBEAT}
+
+
+def negotiate_features(offered: list[str] | None) -> list[str]:
+    """
+    Choose the features of a connection from the features the client offered at the login
+
+    Parameters
+    ----------
+    offered : list[str] | None
+        The "features" of the login credentials (None for old clients)
+
+    Returns
+    -------
+    list[str] : The offered features the server supports
+    """
+    return sorted(FEATURES.intersection(offered or []))
+
+
+class StateStream:
+    """
+    A class to turn the public state of a table into a versioned stream of deltas
+
+    The state is flat ("team1.points", "played", ...),
+    a delta only contains the keys that changed since the last update.
+    A list that only got longer is sent as "<key>+" with the new items.
+
+    ...
+
+    Attributes
+    ----------
+    seq : int (default: 0)
+        The sequence number of the last update
+    state : dict[str, any] (default: {})
+        The state after the last update
+
+    Methods
+    -------
+    update(state: dict[str, any]) -> dict[str, any]
+        Store the new state and return the changes since the last update
+    snapshot() -> dict[str, any]
+        Get the whole current state including the sequence number
+    """
+    def __init__(self):
+        """
+        Initialize a new stream with an empty state
+        """
+        self.seq: int = 0
+        self.state: dict[str, Any] = {}
+
+    def update(self, state: dict[str, Any]) -> dict[str, Any]:
+        """
+        Store the new state and return the changes since the last update
+        (the sequence number is only raised if something changed)
+
+        Parameters
+        ----------
+        state : dict[str, any]
+            The new flat state
+
+        Returns
+        -------
+        dict[str, any] : The changed keys and their new values
+        """
+        changes = {}
+        for key, value in state.items():
+            old = self.state.get(key)
+            if old == value:
+                continue
+            if isinstance(value, list) and isinstance(old, list) and len(value) > len(old) and value[:len(old)] == old:
+                changes[key + "+"] = value[len(old):]
+            else:
+                changes[key] = value
+        if changes:
+            self.seq += 1
+            self.state = state
+        return changes
+
+    def snapshot(self) -> dict[str, Any]:
+        """
+        Get the whole current state including the sequence number
+
+        Returns
+        -------
+        dict[str, any] : {"seq": int, "state": dict}
+        """
+        return {"seq": self.seq, "state": dict(self.state)}
+
+
+class StateView:
+    """
+    A class to rebuild the state of a table from a snapshot and the following deltas
+
+    ...
+
+    Attributes
+    ----------
+    seq : int (default: 0)
+        The sequence number of the last applied delta
+    state : dict[str, any] (default: {})
+        The current state
+
+    Methods
+    -------
+    load(seq: int, state: dict[str, any]) -> None
+        Replace the state with a snapshot
+    apply(seq: int, changes: dict[str, any]) -> bool
+        Apply a delta, return False if a delta is missing
+    team(number: int) -> dict[str, any]
+        Get the stats of a team in the form of the team dicts of the server
+    """
+    def __init__(self):
+        """
+        Initialize a new view with an empty state
+        """
+        self.seq: int = 0
+        self.state: dict[str, Any] = {}
+
+    def load(self, seq: int, state: dict[str, Any]) -> None:
+        """
+        Replace the state with a snapshot
+
+        Parameters
+        ----------
+        seq : int
+            The sequence number of the snapshot
+        state : dict[str, any]
+            The whole state
+
+        Returns
+        -------
+        None
+        """
+        self.seq = seq
+        self.state = dict(state)
+
+    def apply(self, seq: int, changes: dict[str, Any]) -> bool:
+        """
+        Apply a delta
+
+        Parameters
+        ----------
+        seq : int
+            The sequence number of the delta
+        changes : dict[str, any]
+            The changed keys and their new values
+
+        Returns
+        -------
+        bool : False if a delta is missing (a new snapshot has to be requested)
+        """
+        if seq <= self.seq:
+            # The delta is already part of the state (e.g. sent before the snapshot)
+            return True
+        if seq != self.seq + 1:
+            return False
+        for key, value in changes.items():
+            if key.endswith("+"):
+                key = key[:-1]
+                self.state[key] = self.state.get(key, []) + value
+            else:
+                self.state[key] = value
+        self.seq = seq
+        return True
+
+    def team(self, number: int) -> dict[str, Any]:
+        """
+        Get the stats of a team in the form of the team dicts of the server
+
+        Parameters
+        ----------
+        number : int
+            The number of the team (1 or 2)
+
+        Returns
+        -------
+        dict[str, any] : The player, rounds, points and turns of the team
+        """
+        prefix = f"team{number}."
+        return {key[len(prefix):]: value for key, value in self.state.items() if key.startswith(prefix)}
@@ -0,0 +1,543 @@
+import os
+import json
+import socket
+import asyncio
+import multiprocessing
+
+from models import ClientData
+from database import Database
+from async_network import AsyncNetworkServer, AsyncTableServer, play_table
+from lobby import TABLE_SIZE
+from timer_wheel import TimerWheel
+from engine import table_rng
+from replay_log import ReplayLog, PointRecorder
+from snapshot import Checkpointer
+from history import HistoryWriter
+from leaderboard import Leaderboard
+
+# One datagram carries the players of one table, the sockets are passed along (SCM_RIGHTS)
+MESSAGE_SIZE = 65536
+# The seconds a message waits for a full channel until the receiving process is considered stuck
+SEND_TIMEOUT = 5
+
+
+class Supervisor(AsyncNetworkServer):
+    """
+    A class to use every core of the machine for tables
+
+    The supervisor accepts the connections, verifies the logins and runs the lobby,
+    every table that is formed is handed to one worker process
+    together with the sockets of its four clients,
+    so all players of a table are served by the same worker
+
+    A worker that dies is dropped (its players are released, they can log in again),
+    a new one is not forked because the running event loop and the open connections must not be forked.
+    If no worker is left, the supervisor plays the new tables itself.
+
+    ...
+
+    Attributes
+    ----------
+    workers : list[multiprocessing.Process]
+        The worker processes (one event loop with many tables each)
+    channels : list[socket.socket]
+        The unix socket to every worker (tables are sent, closed tables are reported back)
+    load : list[int]
+        The amount of running tables of every worker
+    seated : list[set[str]]
+        The players at the tables of every worker
+    dead : set[int]
+        The workers that died
+
+    Methods
+    -------
+    start_workers() -> None
+        Fork the worker processes
+    start_table(clients: list[ClientData], snapshot: bytes | None = None) -> None
+        Hand the new table to the worker with the fewest tables
+    dispatch_table(worker: int, clients: list[ClientData], table: int, snapshot: bytes | None = None) -> None
+        Send the sockets of the clients to the worker and close them in the supervisor
+    return_to_lobby(clients: list[ClientData]) -> None
+        Let the clients of a table that could not be handed to a worker wait for a new table
+    table_closed(worker: int) -> None
+        Read the closed tables a worker reported
+    worker_died(worker: int) -> None
+        Release the players of a worker that died and stop handing tables to it
+    """
+    def __init__(self, db: Database, host: str = "127.0.0.2", port: int = 3333, workers: int | None = None, **kwargs):
+        """
+        Initialize a new Supervisor
+
+        Parameters
+        ----------
+        db : Database
+            The database to verify the logins with
+        host : str
+            The IP-Address the server will be bind to
+        port : int
+            The Port the server will be bind to
+        workers : int | None (default: None)
+            How many worker processes are started (one per core if not given)
+        kwargs : any
+            Additional arguments of AsyncNetworkServer
+        """
+        super().__init__(db, host, port, **kwargs)
+        self.worker_amount: int = workers or os.cpu_count() or 1
+        self.workers: list[multiprocessing.Process] = []
+        self.channels: list[socket.socket] = []
+        self.load: list[int] = []
+        self.seated: list[set[str]] = []
+        self.dead: set[int] = set()
+
+    async def serve_forever(self) -> None:
+        """
+        Accept clients until the server is stopped
+        (start_workers has to be called before the event loop is started)
+
+        Returns
+        -------
+        None
+        """
+        loop = asyncio.get_running_loop()
+        for worker, channel in enumerate(self.channels):
+            loop.add_reader(channel.fileno(), self.table_closed, worker)
+            loop.add_reader(self.workers[worker].sentinel, self.worker_died, worker)
+        try:
+            await super().serve_forever()
+        finally:
+            for worker, process in enumerate(self.workers):
+                if worker not in self.dead:
+                    loop.remove_reader(process.sentinel)
+                    process.terminate()
+
+    def start_workers(self) -> None:
+        """
+        Fork the worker processes
+        (before the event loop of the supervisor is started, a running loop must not be forked)
+
+        Returns
+        -------
+        None
+        """
+        context = multiprocessing.get_context("fork")
+        for i in range(self.worker_amount):
+            channel, worker_channel = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+            process = context.Process(target=run_worker, args=(worker_channel, self.table_options, self.seed, self.replay_log,
+                                                               self.checkpoints, self.checkpoint_interval, self.history,
+                                                               self.db.path),
+                                      daemon=True)
+            process.start()
+            worker_channel.close()
+            channel.setblocking(False)
+            self.workers.append(process)
+            self.channels.append(channel)
+            self.load.append(0)
+            self.seated.append(set())
+        print(f"[{'WORKERS':<10}] Started {self.worker_amount} workers")
+
+    def start_table(self, clients: list[ClientData], snapshot: bytes | None = None) -> None:
+        """
+        Hand the new table to the worker with the fewest tables
+
+        Parameters
+        ----------
+        clients : list[ClientData]
+            The four clients to seat at the table
+        snapshot : bytes | None (default: None)
+            Continue the table of this snapshot (the clients are its players)
+
+        Returns
+        -------
+        None
+        """
+        alive = [index for index in range(len(self.workers)) if index not in self.dead]
+        if not alive:
+            super().start_table(clients, snapshot)
+            return
+        self.stop_watching(clients)
+        worker = min(alive, key=lambda index: self.load[index])
+        self.load[worker] += 1
+        self.seated[worker].update(client.name for client in clients)
+        for client in clients:
+            # The worker reads from the clients from now on
+            client.writer.transport.pause_reading()
+        task = asyncio.create_task(self.dispatch_table(worker, clients, self.lobby.tables, snapshot))
+        self.tables.add(task)
+        task.add_done_callback(self.tables.discard)
+
+    async def dispatch_table(self, worker: int, clients: list[ClientData], table: int, snapshot: bytes | None = None) -> None:
+        """
+        Send the sockets of the clients to the worker and close them in the supervisor
+        (if that fails, the clients wait for a new table, a client whose connection failed is closed)
+
+        Parameters
+        ----------
+        worker : int
+            The index of the worker
+        clients : list[ClientData]
+            The four clients of the table
+        table : int
+            The number of the table (the worker derives the random generator of the table from it)
+        snapshot : bytes | None (default: None)
+            The snapshot the worker continues the table from
+
+        Returns
+        -------
+        None
+        """
+        players = [{"name": client.name, "codec": client.codec, "features": client.features} for client in clients]
+        message = {"players": players, "table": table, "snapshot": snapshot.hex() if snapshot is not None else None}
+        error = None
+        broken = False
+        try:
+            for client in clients:
+                # Everything written so far has to reach the client before the socket changes the process
+                await client.writer.drain()
+                if client.writer.transport.is_closing():
+                    raise ConnectionError(f"{client.name} disconnected")
+        except ConnectionError as e:
+            error = e
+        if error is None and worker not in self.dead:
+            fds = [client.writer.get_extra_info("socket").fileno() for client in clients]
+            try:
+                await send_message(self.channels[worker], json.dumps(message).encode(self.ENCODING), fds)
+            except TimeoutError as e:
+                error = e
+            except OSError as e:
+                error = e
+                broken = True
+        elif error is None:
+            error = ConnectionError(f"worker {worker} stopped")
+
+        if error is not None:
+            print(f"[{'WORKERS':<10}] Table {', '.join(player['name'] for player in players)} "
+                  f"was not handed to worker {worker} ({error!r})")
+            if worker not in self.dead:
+                self.load[worker] -= 1
+                self.seated[worker].difference_update(player["name"] for player in players)
+            if broken:
+                # The channel is broken, the worker cannot get tables or report them anymore
+                self.workers[worker].kill()
+                self.worker_died(worker)
+            self.return_to_lobby(clients)
+            return
+
+        for client in clients:
+            # Only the file descriptor of the supervisor is closed, the connection stays open in the worker
+            client.writer.transport.abort()
+
+    def return_to_lobby(self, clients: list[ClientData]) -> None:
+        """
+        Let the clients of a table that could not be handed to a worker wait for a new table
+        (a resumed table starts over, a client whose connection failed is closed)
+
+        Parameters
+        ----------
+        clients : list[ClientData]
+            The clients of the table
+
+        Returns
+        -------
+        None
+        """
+        for client in clients:
+            if client.writer.transport.is_closing():
+                self.players.discard(client.name)
+                continue
+            client.writer.transport.resume_reading()
+            # The name was released if the worker died while the table was handed to it
+            self.players.add(client.name)
+            self.watchers[client.name] = asyncio.create_task(self.watch_waiting(client))
+            self.lobby.join(client)
+
+    def table_closed(self, worker: int) -> None:
+        """
+        Read the closed tables a worker reported
+
+        Parameters
+        ----------
+        worker : int
+            The index of the worker
+
+        Returns
+        -------
+        None
+        """
+        while True:
+            try:
+                message = self.channels[worker].recv(MESSAGE_SIZE)
+            except (BlockingIOError, ConnectionError):
+                return
+            if not message:
+                # The worker closed its end of the channel
+                return
+            names = json.loads(message.decode(self.ENCODING))
+            self.load[worker] -= 1
+            self.seated[worker].difference_update(names)
+            self.players.difference_update(names)
+
+    def worker_died(self, worker: int) -> None:
+        """
+        Release the players of a worker that died and stop handing tables to it
+        (the connections of its tables were only open in the worker, they are closed now)
+
+        Parameters
+        ----------
+        worker : int
+            The index of the worker
+
+        Returns
+        -------
+        None
+        """
+        if worker in self.dead:
+            return
+        self.dead.add(worker)
+        process = self.workers[worker]
+        loop = asyncio.get_running_loop()
+        loop.remove_reader(process.sentinel)
+        # The tables it reported before it died
+        self.table_closed(worker)
+        loop.remove_reader(self.channels[worker].fileno())
+        self.channels[worker].close()
+        # The sentinel is ready when the process exits, it is reaped right away
+        process.join(1)
+
+        released = self.seated[worker]
+        self.players.difference_update(released)
+        print(f"[{'WORKERS':<10}] Worker {worker} stopped (exit code {process.exitcode}), {self.load[worker]} tables "
+              f"with {len(released)} players were lost, {len(self.workers) - len(self.dead)} workers left")
+        self.seated[worker] = set()
+        self.load[worker] = 0
+
+
+class TableWorker:
+    """
+    A class to run the tables the supervisor hands to this process
+
+    ...
+
+    Attributes
+    ----------
+    channel : socket.socket
+        The unix socket to the supervisor
+    db : Database
+        The database of this worker
+    table_options : dict[str, float | None]
+        The turn_timeout, idle_timeout and heartbeat_interval of every table
+    seed : int | None
+        The seed of the server (the random generator of every table is derived from it)
+    replay_log : ReplayLog | None
+        The log every point of this worker is written to (None: the games are not recorded)
+    checkpoints : Checkpointer | None
+        Writes the snapshots of the tables of this worker (None: the tables are lost if the worker dies)
+    checkpoint_interval : float
+        The seconds between two checkpoints
+    history : HistoryWriter | None
+        Writes the history of the tables of this worker to the database (None: the history is not stored)
+    leaderboard : Leaderboard
+        Answers the LEADERBOARD requests of the players at the tables of this worker from memory
+    wheel : TimerWheel
+        The timers of every table of this worker
+    tables : set[asyncio.Task]
+        The tasks of the currently running tables
+
+    Methods
+    -------
+    serve_forever() -> None
+        Wait for tables until the supervisor stops the worker
+    receive_tables() -> None
+        Start every table the supervisor sent
+    run_table(players: list[dict], fds: list[int], table: int, snapshot: bytes | None = None) -> None
+        Play on the table and report it to the supervisor when it is closed
+    """
+    def __init__(self, channel: socket.socket, db: Database, table_options: dict[str, float | None] | None = None,
+                 seed: int | None = None, replay_log: ReplayLog | None = None, checkpoints: Checkpointer | None = None,
+                 checkpoint_interval: float = 5, history: HistoryWriter | None = None,
+                 leaderboard: Leaderboard | None = None):
+        """
+        Initialize a new TableWorker
+
+        Parameters
+        ----------
+        channel : socket.socket
+            The unix socket to the supervisor
+        db : Database
+            The database of this worker
+        table_options : dict[str, float | None] | None (default: None)
+            The turn_timeout, idle_timeout and heartbeat_interval of every table
+        seed : int | None (default: None)
+            The seed of the server
+        replay_log : ReplayLog | None (default: None)
+            The log of this worker (it opens its own file on the first write)
+        checkpoints : Checkpointer | None (default: None)
+            The checkpointer of this worker (it writes its own file)
+        checkpoint_interval : float (default: 5)
+            The seconds between two checkpoints
+        history : HistoryWriter | None (default: None)
+            The history writer of this worker (it starts its own thread on the first record)
+        leaderboard : Leaderboard | None (default: None)
+            The leaderboard cache of this worker (a new one if not given)
+        """
+        self.ENCODING = "utf-8"
+        self.channel = channel
+        self.db = db
+        self.table_options: dict[str, float | None] = table_options or {}
+        self.seed = seed
+        self.replay_log = replay_log
+        self.checkpoints = checkpoints
+        self.checkpoint_interval = checkpoint_interval
+        self.history = history
+        self.leaderboard: Leaderboard = leaderboard if leaderboard is not None else Leaderboard(db)
+        self.wheel: TimerWheel = TimerWheel()
+        self.tables: set[asyncio.Task] = set()
+
+    async def serve_forever(self) -> None:
+        """
+        Wait for tables until the supervisor stops the worker
+
+        Returns
+        -------
+        None
+        """
+        self.channel.setblocking(False)
+        asyncio.get_running_loop().add_reader(self.channel.fileno(), self.receive_tables)
+        tasks = [self.wheel.run()]
+        if self.checkpoints is not None:
+            tasks.append(self.checkpoints.run(self.checkpoint_interval))
+        if self.replay_log is None:
+            await asyncio.gather(*tasks)
+            return
+        try:
+            await asyncio.gather(*tasks, self.replay_log.run())
+        finally:
+            self.replay_log.close()
+
+    def receive_tables(self) -> None:
+        """
+        Start every table the supervisor sent
+
+        Returns
+        -------
+        None
+        """
+        while True:
+            try:
+                message, fds, flags, addr = socket.recv_fds(self.channel, MESSAGE_SIZE, TABLE_SIZE)
+            except BlockingIOError:
+                return
+            table = json.loads(message.decode(self.ENCODING))
+            snapshot = bytes.fromhex(table["snapshot"]) if table.get("snapshot") else None
+            task = asyncio.create_task(self.run_table(table["players"], fds, table["table"], snapshot))
+            self.tables.add(task)
+            task.add_done_callback(self.tables.discard)
+
+    async def run_table(self, players: list[dict], fds: list[int], table: int, snapshot: bytes | None = None) -> None:
+        """
+        Play on the table and report it to the supervisor when it is closed
+
+        Parameters
+        ----------
+        players : list[dict]
+            The name, codec and features of every client (in seating order)
+        fds : list[int]
+            The file descriptors of the sockets of the clients
+        table : int
+            The number of the table
+        snapshot : bytes | None (default: None)
+            Continue the table of this snapshot
+
+        Returns
+        -------
+        None
+        """
+        clients = []
+        for player, fd in zip(players, fds):
+            reader, writer = await asyncio.open_connection(sock=socket.socket(fileno=fd))
+            client = ClientData.new_stream(player["name"], reader, writer)
+            client.codec = player["codec"]
+            client.features = player["features"]
+            clients.append(client)
+
+        recorder = PointRecorder(self.replay_log, table) if self.replay_log else None
+        try:
+            await play_table(AsyncTableServer(clients, self.wheel, **self.table_options), self.db, table_rng(self.seed, table),
+                             recorder, self.checkpoints, table, snapshot, self.history, self.leaderboard)
+        finally:
+            names = [player["name"] for player in players]
+            try:
+                await send_message(self.channel, json.dumps(names).encode(self.ENCODING))
+            except OSError as e:
+                # The supervisor keeps the names until it sees this worker stop
+                print(f"[{'WORKERS':<10}] Table {', '.join(names)} was not reported as closed ({e!r})")
+
+
+async def send_message(channel: socket.socket, data: bytes, fds: list[int] | None = None) -> None:
+    """
+    Send one datagram (and the file descriptors) over a non-blocking channel,
+    wait until the channel is writable again if it is full
+    (raises TimeoutError if it stays full for SEND_TIMEOUT seconds, OSError if the other process is gone)
+
+    Parameters
+    ----------
+    channel : socket.socket
+        The unix socket to the other process
+    data : bytes
+        The message
+    fds : list[int] | None (default: None)
+        The file descriptors passed along with the message
+
+    Returns
+    -------
+    None
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            socket.send_fds(channel, [data], fds or [])
+            return
+        except BlockingIOError:
+            writable = loop.create_future()
+            loop.add_writer(channel.fileno(), lambda: writable.done() or writable.set_result(None))
+            try:
+                await asyncio.wait_for(writable, SEND_TIMEOUT)
+            finally:
+                loop.remove_writer(channel.fileno())
+
+
+def run_worker(channel: socket.socket, table_options: dict[str, float | None], seed: int | None,
+               replay_log: ReplayLog | None = None, checkpoints: Checkpointer | None = None, checkpoint_interval: float = 5,
+               history: HistoryWriter | None = None, db_path: str = "watten_py.db") -> None:
+    """
+    The entry point of a worker process
+
+    Parameters
+    ----------
+    channel : socket.socket
+        The unix socket to the supervisor
+    table_options : dict[str, float | None]
+        The turn_timeout, idle_timeout and heartbeat_interval of every table
+    seed : int | None
+        The seed of the server
+    replay_log : ReplayLog | None (default: None)
+        The (still empty) replay log of the supervisor, the worker writes to its own file
+    checkpoints : Checkpointer | None (default: None)
+        The (still empty) checkpointer of the supervisor, the worker writes to its own file
+    checkpoint_interval : float (default: 5)
+        The seconds between two checkpoints
+    history : HistoryWriter | None (default: None)
+        The (still idle) history writer of the supervisor, the worker writes with its own thread and connection
+    db_path : str (default: "watten_py.db")
+        The database of the supervisor
+
+    Returns
+    -------
+    None
+    """
+    # Every worker opens its own connection, sqlite connections must not be shared between processes
+    db = Database(db_path)
+    leaderboard = Leaderboard(db)
+    if history is not None:
+        history = HistoryWriter(db, history.queue.maxsize, history.batch_size, leaderboard)
+    asyncio.run(TableWorker(channel, db, table_options, seed, replay_log, checkpoints, checkpoint_interval,
+                            history, leaderboard).serve_forever())
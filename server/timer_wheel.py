@@ -0,0 +1,190 @@
+import math
+import time
+import asyncio
+from typing import Callable, Any
+
+
+class Timer:
+    """
+    A class to represent a timer armed in a TimerWheel
+
+    ...
+
+    Attributes
+    ----------
+    callback : Callable
+        Is called when the timer expires
+    args : tuple
+        The arguments of the callback
+    rounds : int
+        How many more times the wheel has to pass the slot of the timer before it expires
+    cancelled : bool (default: False)
+        If the timer was cancelled (it is dropped when the wheel reaches its slot)
+
+    Methods
+    -------
+    cancel() -> None
+        Cancel the timer in O(1)
+    """
+    __slots__ = ("callback", "args", "rounds", "cancelled")
+
+    def __init__(self, callback: Callable[..., Any], args: tuple, rounds: int):
+        """
+        Initialize a new timer
+
+        Parameters
+        ----------
+        callback : Callable
+            Is called when the timer expires
+        args : tuple
+            The arguments of the callback
+        rounds : int
+            How many times the wheel has to pass the slot of the timer before it expires
+        """
+        self.callback = callback
+        self.args = args
+        self.rounds = rounds
+        self.cancelled = False
+
+    def cancel(self) -> None:
+        """
+        Cancel the timer in O(1)
+
+        Returns
+        -------
+        None
+        """
+        self.cancelled = True
+
+
+class TimerWheel:
+    """
+    A class to schedule many timers (turn deadlines, heartbeats, idle timeouts) in O(1)
+
+    A hashed timer wheel: every slot is one tick,
+    a timer is appended to the slot it expires in and only counts the rounds of the wheel.
+    Arming and cancelling are O(1), every tick only looks at the timers of one slot.
+
+    ...
+
+    Attributes
+    ----------
+    tick : float
+        The length of one slot in seconds (the precision of the timers)
+    slots : list[list[Timer]]
+        The timers of every slot
+    position : int
+        The slot of the current tick
+    time : float
+        The time of the current tick (time.monotonic)
+
+    Methods
+    -------
+    call_later(delay: float, callback: Callable, *args) -> Timer
+        Call the callback after delay seconds
+    advance(now: float | None = None) -> int
+        Run the timers of every tick up to now
+    run() -> None
+        Advance the wheel every tick inside the event loop
+    """
+    def __init__(self, tick: float = 0.1, slots: int = 1024):
+        """
+        Initialize a new empty wheel
+
+        Parameters
+        ----------
+        tick : float (default: 0.1)
+            The length of one slot in seconds
+        slots : int (default: 1024)
+            The amount of slots (timers longer than slots * tick count the rounds of the wheel)
+        """
+        self.tick: float = tick
+        self.slots: list[list[Timer]] = [[] for i in range(slots)]
+        self.position: int = 0
+        self.time: float = time.monotonic()
+
+    def call_later(self, delay: float, callback: Callable[..., Any], *args: Any) -> Timer:
+        """
+        Call the callback after delay seconds (rounded up to the next tick)
+
+        Parameters
+        ----------
+        delay : float
+            The seconds until the callback is called
+        callback : Callable
+            The function to call
+        args : any
+            The arguments of the callback
+
+        Returns
+        -------
+        Timer : The timer (to cancel it)
+        """
+        ticks = max(1, math.ceil(delay / self.tick))
+        timer = Timer(callback, args, (ticks - 1) // len(self.slots))
+        self.slots[(self.position + ticks) % len(self.slots)].append(timer)
+        return timer
+
+    def advance(self, now: float | None = None) -> int:
+        """
+        Run the timers of every tick up to now
+
+        Parameters
+        ----------
+        now : float | None (default: None)
+            The current time (time.monotonic() if not given)
+
+        Returns
+        -------
+        int : The amount of timers that expired
+        """
+        if now is None:
+            now = time.monotonic()
+        expired = 0
+        while self.time + self.tick <= now:
+            self.time += self.tick
+            self.position = (self.position + 1) % len(self.slots)
+            timers = self.slots[self.position]
+            # Timers armed by the callbacks go into a new list
+            self.slots[self.position] = waiting = []
+            for timer in timers:
+                if timer.cancelled:
+                    continue
+                if timer.rounds:
+                    timer.rounds -= 1
+                    waiting.append(timer)
+                    continue
+                expired += 1
+                try:
+                    timer.callback(*timer.args)
+                except Exception as e:
+                    print(f"[{'TIMER':<10}] {timer.callback!r} failed ({e!r})")
+        return expired
+
+    async def run(self) -> None:
+        """
+        Advance the wheel every tick inside the event loop
+
+        Returns
+        -------
+        None
+        """
+        while True:
+            await asyncio.sleep(self.tick)
+            self.advance()
+
+
+if __name__ == '__main__':
+    # Arm and cancel as many timers as there are turns on a busy server
+    AMOUNT = 1_000_000
+    wheel = TimerWheel()
+    start_time = time.perf_counter()
+    timers = [wheel.call_later(30, print) for i in range(AMOUNT)]
+    armed = time.perf_counter()
+    for timer in timers:
+        timer.cancel()
+    cancelled = time.perf_counter()
+    wheel.advance(wheel.time + 60)
+    swept = time.perf_counter()
+    print(f"[{'BENCHMARK':<10}] {AMOUNT} timers: arm {(armed - start_time) / AMOUNT * 1e9:.0f}ns, "
+          f"cancel {(cancelled - armed) / AMOUNT * 1e9:.0f}ns, sweep {(swept - cancelled) / AMOUNT * 1e9:.0f}ns per timer")